@@ -0,0 +1,24 @@
+# Generated by Django 5.2.8 on 2026-10-19 08:37
+
+import apps.common.fields
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='image_variants',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+        migrations.AlterField(
+            model_name='user',
+            name='avatar',
+            field=apps.common.fields.VariantImageField(default='avatars/default.jpg', null=True, upload_to='avatars/'),
+        ),
+    ]
@@ -2,6 +2,7 @@ from django.db import models
 from django.contrib.auth.models import AbstractBaseUser
 
 from apps.accounts.managers import CustomUserManager
+from apps.common.fields import VariantImageField
 from apps.common.models import IsDeletedModel
 
 
@@ -20,6 +21,7 @@ class User(IsDeletedModel, AbstractBaseUser):
         last_name (str): The last name of the user.
         email (str): The email address of the user, used as the username field.
         avatar (ImageField): The avatar image of the user.
+        image_variants (JSONField): Resized variants of the avatar, see VariantImageField.
         is_staff (bool): Designates whether the user can log into this admin site.
         is_active (bool): Designates whether this user should be treated as active.
         account_type (str): The type of account (SELLER or BUYER).
@@ -32,7 +34,8 @@ class User(IsDeletedModel, AbstractBaseUser):
     first_name = models.CharField(max_length=25, verbose_name='First name', null=True)
     last_name = models.CharField(max_length=25, verbose_name='Last name', null=True)
     email = models.EmailField(verbose_name='Email address', unique=True)
-    avatar = models.ImageField(upload_to='avatars/', null=True, default='avatars/default.jpg')
+    avatar = VariantImageField(upload_to='avatars/', null=True, default='avatars/default.jpg')
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
 
     is_staff = models.BooleanField(default=False)
     is_active = models.BooleanField(default=True)
@@ -1,3 +1,27 @@
 from django.contrib import admin
 
-# Register your models here.
+from .models import Checkpoint, Job, MediaBlob, SqlTagStats
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'name', 'queue', 'status', 'attempts', 'run_at', 'started_at', 'finished_at')
+    list_filter = ('status', 'queue', 'name')
+    search_fields = ('idempotency_key',)
+
+
+@admin.register(MediaBlob)
+class MediaBlobAdmin(admin.ModelAdmin):
+    list_display = ('name', 'size', 'refcount', 'created_at', 'last_used_at')
+    search_fields = ('name',)
+
+
+@admin.register(Checkpoint)
+class CheckpointAdmin(admin.ModelAdmin):
+    list_display = ('name', 'position', 'updated_at')
+
+
+@admin.register(SqlTagStats)
+class SqlTagStatsAdmin(admin.ModelAdmin):
+    list_display = ('hour', 'controller', 'action', 'api_version', 'statements', 'total_ms')
+    list_filter = ('controller', 'action')
@@ -1,6 +1,11 @@
 from django.apps import AppConfig
+from django.utils.module_loading import autodiscover_modules
 
 
 class CommonConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'apps.common'
+
+    def ready(self):
+        # Register the background jobs declared in <app>/tasks.py
+        autodiscover_modules('tasks')
@@ -0,0 +1,181 @@
+import atexit
+import logging
+import os
+import socket
+import threading
+import time
+from functools import partial
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from apps.common.utils import batched
+
+
+logger = logging.getLogger(__name__)
+
+# Buffers of this process by name
+buffers = {}
+
+
+class WriteBehindBuffer:
+    """
+    Increments summed in process memory and written in batches, so hot rows
+    (views of a popular product) are not updated once per request.
+
+    `write(pending)` receives a {key: total} dict and must write it in one
+    transaction. A batch is written by a timer thread `interval` seconds after
+    its first increment, or right away once it holds `max_pending` keys, and at
+    process exit (workers recycled by the web server exit normally). A failed
+    write keeps the batch for the next attempt one interval later, so a killed
+    process loses at most one interval of increments. While writes fail, new keys
+    beyond `max_keys` are dropped and counted in backlog() instead of growing the
+    batch without bound.
+    """
+
+    def __init__(self, name, write, interval=None, max_pending=None, max_keys=None):
+        self.name = name
+        self.write = write
+        self.interval = interval
+        self.max_pending = max_pending
+        self.max_keys = max_keys
+        self.lock = threading.Lock()
+        self.pending = {}
+        self.since = None
+        self.timer = None
+        self.error_until = None
+        self.flushed = 0
+        self.dropped = 0
+        self.last_flush = None
+        self.last_error = None
+        buffers[name] = self
+
+    def add(self, key, value=1):
+        with self.lock:
+            if key not in self.pending and len(self.pending) >= (self.max_keys or settings.COUNTERS['MAX_KEYS']):
+                self.dropped += 1
+                return
+            self.pending[key] = self.pending.get(key, 0) + value
+            if self.since is None:
+                self.since = time.time()
+            if self.error_until is not None and time.time() < self.error_until:
+                # The retry of the failed write is already scheduled, a full batch must not bring it forward
+                return
+            if len(self.pending) >= (self.max_pending or settings.COUNTERS['MAX_PENDING']):
+                self.schedule(0)
+            else:
+                self.schedule(self.flush_interval)
+
+    @property
+    def flush_interval(self):
+        return self.interval or settings.COUNTERS['FLUSH_INTERVAL']
+
+    def schedule(self, delay):
+        # Called with the lock held
+        if self.timer is not None:
+            if delay:
+                return
+            self.timer.cancel()
+        self.timer = threading.Timer(delay, self.flush_in_thread)
+        self.timer.daemon = True
+        self.timer.start()
+
+    def take(self):
+        with self.lock:
+            pending, since = self.pending, self.since
+            self.pending, self.since, self.timer = {}, None, None
+        return pending, since
+
+    def flush(self):
+        """Write the pending increments and return the number of keys written."""
+
+        pending, since = self.take()
+        if not pending:
+            return 0
+        try:
+            self.write(pending)
+        except Exception as error:
+            logger.exception('Could not write %s keys of the %s counters', len(pending), self.name)
+            with self.lock:
+                for key, value in pending.items():
+                    self.pending[key] = self.pending.get(key, 0) + value
+                self.since = min(since, self.since or since)
+                self.last_error = repr(error)
+                self.error_until = time.time() + self.flush_interval
+                self.schedule(self.flush_interval)
+            return 0
+        with self.lock:
+            self.flushed += len(pending)
+            self.last_flush = timezone.now()
+            self.last_error = None
+            self.error_until = None
+        return len(pending)
+
+    def flush_in_thread(self):
+        try:
+            self.flush()
+        finally:
+            # The timer thread has its own connection
+            connection.close()
+
+    def backlog(self):
+        with self.lock:
+            return {
+                'name': self.name,
+                'pending_keys': len(self.pending),
+                'pending_total': sum(self.pending.values()),
+                'oldest_seconds': round(time.time() - self.since, 3) if self.since is not None else None,
+                'flushed_keys': self.flushed,
+                'dropped_increments': self.dropped,
+                'last_flush': self.last_flush,
+                'last_error': self.last_error,
+            }
+
+
+def update_counts(model, field, key, counts):
+    """
+    Add `counts` ({key value: increment}) to an integer column of `model` with
+    batched UPDATE ... FROM (VALUES ...) statements, rows matched by the `key` field.
+    """
+
+    quote = connection.ops.quote_name
+    table = quote(model._meta.db_table)
+    column = quote(model._meta.get_field(field).column)
+    key_field = model._meta.pk if key == 'pk' else model._meta.get_field(key)
+    key_type = key_field.cast_db_type(connection)
+    # Rows locked in the same order by every process
+    items = sorted(counts.items(), key=lambda item: str(item[0]))
+    with transaction.atomic():
+        for batch in batched(items, 1000):
+            params = []
+            for value, increment in batch:
+                params.extend([key_field.get_db_prep_value(value, connection, prepared=False), increment])
+            values = ', '.join([f'(CAST(%s AS {key_type}), CAST(%s AS bigint))'] * len(batch))
+            # VALUES columns are column1, column2... in PostgreSQL and SQLite alike
+            sql = (
+                f'UPDATE {table} SET {column} = {table}.{column} + v.column2 '
+                f'FROM (VALUES {values}) AS v WHERE {table}.{quote(key_field.column)} = v.column1'
+            )
+            with connection.cursor() as cursor:
+                cursor.execute(sql, params)
+
+
+def counter(name, model, field, key='pk'):
+    """A WriteBehindBuffer adding to the integer `field` of the `model` rows identified by `key`."""
+    return WriteBehindBuffer(name, partial(update_counts, model, field, key))
+
+
+def flush_all():
+    return {name: buffer.flush() for name, buffer in buffers.items()}
+
+
+def backlog():
+    """Pending increments of the buffers of this process."""
+    return {
+        'process': f'{socket.gethostname()}:{os.getpid()}',
+        'buffers': [buffer.backlog() for buffer in buffers.values()],
+    }
+
+
+atexit.register(flush_all)
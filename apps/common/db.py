@@ -0,0 +1,357 @@
+import contextvars
+import hashlib
+import json
+import logging
+import os
+import queue
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter, deque
+from urllib.parse import quote
+
+from django.conf import settings
+from django.db import DatabaseError, connection, connections, transaction
+from django.utils import timezone
+
+from apps.common.counters import WriteBehindBuffer
+
+
+logger = logging.getLogger(__name__)
+
+APPS_DIR = os.path.join(settings.BASE_DIR, 'apps')
+# Frames of the query hooks themselves are not interesting as call sites
+HOOK_FILES = {__file__, os.path.join(APPS_DIR, 'common', 'middleware.py')}
+LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+
+# Последние медленные запросы этого процесса
+slow_queries = deque(maxlen=settings.SLOW_QUERY_LOG['BUFFER_SIZE'])
+
+# Число превышений бюджета по view в этом процессе
+budget_violations = Counter()
+
+# Теги текущего запроса (view, метод, маршрут, версия API, request id), заполняет QueryTagMiddleware
+query_tags = contextvars.ContextVar('query_tags', default=None)
+
+
+def fingerprint(value):
+    return hashlib.sha1(value.encode()).hexdigest()[:16]
+
+
+def sql_fingerprint(sql):
+    """Fingerprint of the statement shape: literals and whitespace do not matter."""
+    return fingerprint(' '.join(LITERALS.sub('?', sql).split()))
+
+
+def call_site():
+    """Return "file:line in function" of the innermost project frame outside the query hooks."""
+    frame = sys._getframe(1)
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if filename.startswith(APPS_DIR) and filename not in HOOK_FILES:
+            return f'{os.path.relpath(filename, settings.BASE_DIR)}:{frame.f_lineno} in {frame.f_code.co_name}'
+        frame = frame.f_back
+    return None
+
+
+class SlowQueryWorker(threading.Thread):
+    """
+    Background thread that finishes slow query entries off the request path.
+
+    For sampled SELECT statements it runs EXPLAIN (ANALYZE, BUFFERS) on its own
+    connection inside a rolled back transaction, then appends the entry to the
+    in-memory ring buffer and the JSONL log. The queue is bounded: when it is full
+    the entry is recorded right away without a plan.
+    """
+
+    def __init__(self):
+        super().__init__(name='slow-query-worker', daemon=True)
+        self.queue = queue.Queue(maxsize=100)
+        self.lock = threading.Lock()
+
+    def submit(self, entry, sql, params, alias):
+        try:
+            self.queue.put_nowait((entry, sql, params, alias))
+        except queue.Full:
+            self.record(entry)
+
+    def run(self):
+        while True:
+            entry, sql, params, alias = self.queue.get()
+            if sql is not None:
+                entry['explain'] = self.explain(sql, params, alias)
+            self.record(entry)
+
+    def explain(self, sql, params, alias):
+        connection = connections[alias]
+        try:
+            with transaction.atomic(using=alias), connection.cursor() as cursor:
+                cursor.execute(f"SET LOCAL statement_timeout = {settings.SLOW_QUERY_LOG['EXPLAIN_TIMEOUT_MS']}")
+                cursor.execute(f'EXPLAIN (ANALYZE, BUFFERS) {sql}', params)
+                plan = [row[0] for row in cursor.fetchall()]
+                transaction.set_rollback(True, using=alias)
+                return plan
+        except DatabaseError as exc:
+            return [f'EXPLAIN failed: {exc}']
+        finally:
+            connection.close_if_unusable_or_obsolete()
+
+    def record(self, entry):
+        slow_queries.append(entry)
+        path = settings.SLOW_QUERY_LOG['PATH']
+        if not path:
+            return
+        with self.lock:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(entry, ensure_ascii=False, default=str) + '\n')
+
+
+_worker = None
+_worker_lock = threading.Lock()
+
+
+def get_worker():
+    global _worker
+    with _worker_lock:
+        if _worker is None or not _worker.is_alive():
+            _worker = SlowQueryWorker()
+            _worker.start()
+    return _worker
+
+
+class SlowQueryLogger:
+    """
+    Execute wrapper (see connection.execute_wrapper) that records slow queries.
+
+    Queries slower than SLOW_QUERY_LOG['THRESHOLD_MS'] are recorded with their SQL,
+    a fingerprint of the statement and of its parameters, the view that issued them
+    and the project call site. A sampled share of SELECT statements also gets an
+    EXPLAIN (ANALYZE, BUFFERS) plan captured by SlowQueryWorker.
+    """
+
+    def __init__(self, alias, request=None):
+        config = settings.SLOW_QUERY_LOG
+        self.alias = alias
+        self.request = request
+        self.threshold = config['THRESHOLD_MS']
+        self.explain_rate = config['EXPLAIN_SAMPLE_RATE']
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = (time.perf_counter() - started) * 1000
+            if duration >= self.threshold:
+                self.log(sql, params, many, duration)
+
+    def log(self, sql, params, many, duration):
+        match = getattr(self.request, 'resolver_match', None)
+        entry = {
+            'ts': timezone.now().isoformat(),
+            'duration_ms': round(duration, 3),
+            'sql': sql,
+            'sql_fingerprint': sql_fingerprint(sql),
+            'params_fingerprint': fingerprint(repr(params)),
+            'view': match._func_path if match else None,
+            'route': match.route if match else None,
+            'call_site': call_site(),
+            'request_id': (query_tags.get() or {}).get('request_id'),
+            'explain': None,
+        }
+        statement = sql.lstrip().upper()
+        explain = (
+            not many
+            and connections[self.alias].vendor == 'postgresql'
+            and statement.startswith('SELECT')
+            and 'FOR UPDATE' not in statement
+            and random.random() < self.explain_rate
+        )
+        get_worker().submit(entry, sql if explain else None, params, self.alias)
+
+
+# Columns of SqlTagStats, the tags statements are grouped by
+STATS_TAGS = ('controller', 'action', 'route', 'api_version')
+
+
+def write_tag_stats(pending):
+    """Add {(hour, *STATS_TAGS, metric): value} totals to SqlTagStats with one upsert per batch."""
+
+    from apps.common.models import SqlTagStats
+
+    rows = {}
+    for (*key, metric), value in pending.items():
+        rows.setdefault(tuple(key), {'statements': 0, 'total_ms': 0.0})[metric] += value
+    quote = connection.ops.quote_name
+    table = quote(SqlTagStats._meta.db_table)
+    columns = [SqlTagStats._meta.get_field(name) for name in ('hour', *STATS_TAGS, 'statements', 'total_ms')]
+    items = sorted(rows.items())
+    for start in range(0, len(items), 500):
+        batch = items[start:start + 500]
+        params = []
+        for key, totals in batch:
+            params.extend(field.get_db_prep_value(value, connection, prepared=False)
+                          for field, value in zip(columns, [*key, totals['statements'], totals['total_ms']]))
+        placeholders = f'({", ".join(["%s"] * len(columns))})'
+        sql = (
+            f'INSERT INTO {table} ({", ".join(quote(field.column) for field in columns)}) '
+            f'VALUES {", ".join([placeholders] * len(batch))} '
+            f'ON CONFLICT ({", ".join(quote(field.column) for field in columns[:-2])}) DO UPDATE SET '
+            + ', '.join(f'{quote(name)} = {table}.{quote(name)} + EXCLUDED.{quote(name)}'
+                        for name in ('statements', 'total_ms'))
+        )
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(sql, params)
+
+
+# Statement timings of this process by endpoint and hour, written every few seconds
+tag_stats = WriteBehindBuffer('common.sql_tag_stats', write_tag_stats)
+
+
+class SQLCommenter:
+    """
+    Execute wrapper that appends a sqlcommenter-style comment to every statement.
+
+    The comment carries the tags of the current request from `query_tags`, e.g.
+    /*action='get',controller='ProductsView',request_id='...'*/, so statements seen
+    in the Postgres logs can be mapped back to the code. Values are URL-encoded as
+    the sqlcommenter spec requires, so they can not close the comment.
+
+    pg_stat_statements ignores comments when it groups statements, so it can not
+    tell endpoints apart: the wrapper also times every statement and adds it to
+    SqlTagStats by endpoint and hour, the source of the sql_tag_report command.
+    """
+
+    def __init__(self, tags):
+        self.tags = tags
+
+    def __call__(self, execute, sql, params, many, context):
+        tags = query_tags.get()
+        if not tags:
+            return execute(sql, params, many, context)
+        comment = ','.join(
+            f"{key}='{quote(str(tags[key]), safe='')}'" for key in sorted(self.tags) if tags.get(key)
+        )
+        if comment:
+            # URL-encoded values contain "%" that must survive parameter interpolation
+            if params is not None:
+                comment = comment.replace('%', '%%')
+            sql = f'{sql} /*{comment}*/'
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = (time.perf_counter() - started) * 1000
+            key = (timezone.now().replace(minute=0, second=0, microsecond=0),
+                   *(str(tags.get(tag) or '') for tag in STATS_TAGS))
+            tag_stats.add((*key, 'statements'), 1)
+            tag_stats.add((*key, 'total_ms'), duration)
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+class QueryBudget:
+    """
+    Database budget of a view, declared as `query_budget = QueryBudget(...)`.
+
+    Attributes:
+        queries (int): Maximum number of SQL statements per request.
+        db_ms (int): Maximum total database time per request, in milliseconds.
+        statement_timeout (bool): Also cancel statements running longer than
+            db_ms. On Postgres the view then runs in a transaction (like with
+            ATOMIC_REQUESTS: writes commit at the end of the view and on_commit
+            callbacks run then) started by SET LOCAL statement_timeout, which is
+            not counted in the budget. Only for views that can run in one
+            transaction, e.g. read-only ones.
+    """
+
+    def __init__(self, queries=None, db_ms=None, statement_timeout=False):
+        self.queries = queries
+        self.db_ms = db_ms
+        self.statement_timeout = statement_timeout
+
+
+class QueryBudgetTracker:
+    """
+    Execute wrapper that enforces the QueryBudget of the current view.
+
+    The budget is attached in `start()` once the view is known. With
+    QUERY_BUDGETS['RAISE'] a violation raises QueryBudgetExceeded: an extra query
+    raises before it is sent, a time overrun raises in `finish()`. Otherwise the
+    violation is logged together with the SQL trace of the request and counted in
+    `budget_violations`.
+    """
+
+    def __init__(self, request):
+        self.request = request
+        self.budget = None
+        self.view = None
+        self.trace = []
+        self.db_ms = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        if self.budget is None:
+            return execute(sql, params, many, context)
+        if (self.budget.queries is not None and len(self.trace) >= self.budget.queries
+                and settings.QUERY_BUDGETS['RAISE']):
+            raise QueryBudgetExceeded(
+                f'{self.view} exceeded its budget of {self.budget.queries} queries, next query: {sql}'
+            )
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = (time.perf_counter() - started) * 1000
+            self.db_ms += duration
+            self.trace.append((round(duration, 3), sql))
+
+    def start(self, view, budget):
+        self.view = view
+        self.budget = budget
+
+    def run_view(self, view, budget, view_func, request, args, kwargs):
+        """
+        Attach the budget of the view. For a budget with `statement_timeout` on
+        Postgres also call the view in a transaction limited by it and return the
+        response, otherwise return None and let Django call the view.
+        """
+
+        connection = connections['default']
+        if not (budget.statement_timeout and budget.db_ms) or connection.vendor != 'postgresql':
+            self.start(view, budget)
+            return None
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                cursor.execute(f'SET LOCAL statement_timeout = {int(budget.db_ms)}')
+            # Attached after the SET, which is not a query of the view
+            self.start(view, budget)
+            return view_func(request, *args, **kwargs)
+
+    def finish(self, raise_exceeded=True):
+        """Check the budget at the end of the request, `raise_exceeded=False` only logs a violation."""
+
+        budget, self.budget = self.budget, None
+        if budget is None:
+            return
+
+        problems = []
+        if budget.queries is not None and len(self.trace) > budget.queries:
+            problems.append(f'{len(self.trace)} queries > {budget.queries}')
+        if budget.db_ms is not None and self.db_ms > budget.db_ms:
+            problems.append(f'{self.db_ms:.1f} ms > {budget.db_ms} ms')
+        if not problems:
+            return
+
+        message = f'{self.view} exceeded its query budget: {", ".join(problems)}'
+        if settings.QUERY_BUDGETS['RAISE'] and raise_exceeded:
+            raise QueryBudgetExceeded(message)
+        budget_violations[self.view] += 1
+        logger.warning(
+            '%s (%s %s)\n%s', message, self.request.method, self.request.path,
+            '\n'.join(f'{duration:>9} ms  {sql}' for duration, sql in self.trace),
+        )
@@ -0,0 +1,246 @@
+import hashlib
+import re
+from collections import Counter
+
+from autoslug.settings import slugify
+from django.db import connections, models, router
+from django.db.models.signals import post_init, post_save
+
+
+# Allocated slugs look like "base", "base--2", "base--3". slugify() never produces "--",
+# so a suffixed slug can not be equal to the base slug of some other name.
+SUFFIX_SEPARATOR = '--'
+SUFFIXED = re.compile(rf'^(?P<base>.+){SUFFIX_SEPARATOR}(?P<index>\d+)$')
+# Room left after the base for the separator and the counter
+SUFFIX_RESERVE = 10
+CHUNK_SIZE = 1000
+SOURCE_UNKNOWN = object()
+
+
+def split_slug(slug):
+    """Return (base, index) of an allocated slug, e.g. ("iphone-case", 3) for "iphone-case--3"."""
+    match = SUFFIXED.match(slug)
+    if match:
+        return match['base'], int(match['index'])
+    return slug, 1
+
+
+def counter_table(using):
+    from apps.common.models import SlugCounter
+
+    return connections[using].ops.quote_name(SlugCounter._meta.db_table)
+
+
+def allocate_slugs(scope, bases, using='default'):
+    """
+    Allocate one unique slug per base, with one query per CHUNK_SIZE distinct bases.
+
+    The counter of every (scope, base) pair is bumped by the number of slugs needed
+    with INSERT ... ON CONFLICT DO UPDATE ... RETURNING, so no table probing is
+    needed no matter how many rows share a base.
+
+    Args:
+        scope (str): Counter namespace, e.g. "shop.product.slug".
+        bases (list): Base slugs, repeated bases get distinct suffixes.
+        using (str): Database alias.
+
+    Returns:
+        list: One slug per base, in order.
+    """
+
+    counts = Counter(bases)
+    last = {}
+    table = counter_table(using)
+    distinct = list(counts)
+    for start in range(0, len(distinct), CHUNK_SIZE):
+        chunk = distinct[start:start + CHUNK_SIZE]
+        params = []
+        for base in chunk:
+            params.extend([scope, base, counts[base]])
+        sql = (
+            f'INSERT INTO {table} (scope, base, value) VALUES {", ".join(["(%s, %s, %s)"] * len(chunk))} '
+            f'ON CONFLICT (scope, base) DO UPDATE SET value = {table}.value + EXCLUDED.value '
+            f'RETURNING base, value'
+        )
+        with connections[using].cursor() as cursor:
+            cursor.execute(sql, params)
+            last.update(cursor.fetchall())
+
+    # Counters now hold the last allocated index, hand out the preceding ones in order
+    next_index = {base: last[base] - counts[base] + 1 for base in counts}
+    slugs = []
+    for base in bases:
+        index = next_index[base]
+        next_index[base] += 1
+        slugs.append(base if index == 1 else f'{base}{SUFFIX_SEPARATOR}{index}')
+    return slugs
+
+
+def register_slugs(scope, slugs, using='default'):
+    """
+    Make sure the counters are past existing slugs, e.g. after rows were written
+    bypassing the allocator (data migrations, COPY).
+    """
+
+    highest = {}
+    for slug in slugs:
+        if slug:
+            base, index = split_slug(slug)
+            highest[base] = max(highest.get(base, 0), index)
+    table = counter_table(using)
+    greatest = 'GREATEST' if connections[using].vendor == 'postgresql' else 'MAX'
+    items = list(highest.items())
+    for start in range(0, len(items), CHUNK_SIZE):
+        chunk = items[start:start + CHUNK_SIZE]
+        params = []
+        for base, index in chunk:
+            params.extend([scope, base, index])
+        sql = (
+            f'INSERT INTO {table} (scope, base, value) VALUES {", ".join(["(%s, %s, %s)"] * len(chunk))} '
+            f'ON CONFLICT (scope, base) DO UPDATE SET value = {greatest}({table}.value, EXCLUDED.value)'
+        )
+        with connections[using].cursor() as cursor:
+            cursor.execute(sql, params)
+
+
+class UniqueSlugField(models.SlugField):
+    """
+    Unique slug populated from another field and allocated from SlugCounter.
+
+    A new slug costs one query whatever the number of existing rows with the same
+    name. With `always_update` the slug is re-allocated only when the source field
+    was changed since the instance was loaded and its base slug differs, so slugs
+    of another scheme (AutoSlugField's "-2" suffixes, longer bases) survive
+    unrelated saves. Use `allocate_bulk_slugs()` (called by
+    GetOrNoneQuerySet.bulk_create) to allocate the slugs of many objects at once.
+    """
+
+    def __init__(self, *args, populate_from=None, always_update=False, **kwargs):
+        self.populate_from = populate_from
+        self.always_update = always_update
+        kwargs.setdefault('max_length', 50)
+        kwargs.setdefault('unique', True)
+        kwargs.setdefault('editable', False)
+        super().__init__(*args, **kwargs)
+
+    def deconstruct(self):
+        name, path, args, kwargs = super().deconstruct()
+        kwargs['populate_from'] = self.populate_from
+        if self.always_update:
+            kwargs['always_update'] = True
+        if kwargs.get('max_length') == 50:
+            del kwargs['max_length']
+        if self.unique:
+            kwargs.pop('unique', None)
+        else:
+            kwargs['unique'] = False
+        if not self.editable:
+            kwargs.pop('editable', None)
+        else:
+            kwargs['editable'] = True
+        return name, path, args, kwargs
+
+    def contribute_to_class(self, cls, name, **kwargs):
+        super().contribute_to_class(cls, name, **kwargs)
+        if self.always_update and not cls._meta.abstract:
+            uid = f'slug-source:{cls._meta.label_lower}.{name}'
+            post_init.connect(self.remember_source, sender=cls, weak=False, dispatch_uid=uid)
+            post_save.connect(self.remember_source, sender=cls, weak=False, dispatch_uid=uid)
+
+    @property
+    def source_key(self):
+        return f'_{self.attname}_source'
+
+    def remember_source(self, sender, instance, **kwargs):
+        # Deferred sources are not loaded just for this, the slug is then compared to the base
+        if self.populate_from in instance.__dict__:
+            instance.__dict__[self.source_key] = instance.__dict__[self.populate_from]
+
+    @property
+    def scope(self):
+        return f'{self.model._meta.label_lower}.{self.name}'
+
+    def base_slug(self, instance):
+        return self.slugify(getattr(instance, self.populate_from))
+
+    def slugify(self, value):
+        base = slugify(str(value or '')) or self.model._meta.model_name
+        return base[:self.max_length - SUFFIX_RESERVE].strip('-')
+
+    def needs_slug(self, instance):
+        current = getattr(instance, self.attname)
+        if not current:
+            return True
+        if not self.always_update:
+            return False
+        source = instance.__dict__.get(self.source_key, SOURCE_UNKNOWN)
+        if source is not SOURCE_UNKNOWN and source == getattr(instance, self.populate_from):
+            return False
+        return split_slug(current)[0] != self.base_slug(instance)
+
+    def pre_save(self, instance, add):
+        if self.needs_slug(instance):
+            using = router.db_for_write(self.model, instance=instance)
+            setattr(instance, self.attname, allocate_slugs(self.scope, [self.base_slug(instance)], using)[0])
+        return getattr(instance, self.attname)
+
+
+def allocate_bulk_slugs(model, objs, using='default'):
+    """Allocate the missing UniqueSlugField values of `objs` in one query per field."""
+
+    for field in model._meta.concrete_fields:
+        if not isinstance(field, UniqueSlugField):
+            continue
+        pending = [obj for obj in objs if field.needs_slug(obj)]
+        if pending:
+            slugs = allocate_slugs(field.scope, [field.base_slug(obj) for obj in pending], using)
+            for obj, slug in zip(pending, slugs):
+                setattr(obj, field.attname, slug)
+
+
+class VariantImageField(models.ImageField):
+    """
+    ImageField whose resized WebP/JPEG variants (settings.IMAGE_VARIANTS) are
+    generated by a background job whenever the image changes.
+
+    The names of the variants are kept in the JSONField `variants_field` of the
+    model, {"<field>": {"source": <image name>, "thumb": {"webp": ..., "jpeg": ...}}},
+    see ImageVariantsField to serialize them.
+    """
+
+    def __init__(self, *args, variants_field='image_variants', **kwargs):
+        self.variants_field = variants_field
+        super().__init__(*args, **kwargs)
+
+    def deconstruct(self):
+        name, path, args, kwargs = super().deconstruct()
+        if self.variants_field != 'image_variants':
+            kwargs['variants_field'] = self.variants_field
+        return name, path, args, kwargs
+
+    def contribute_to_class(self, cls, name, **kwargs):
+        super().contribute_to_class(cls, name, **kwargs)
+        if not cls._meta.abstract:
+            # One handler per model for all its variant fields
+            post_save.connect(enqueue_variants, sender=cls, dispatch_uid=f'image-variants:{cls._meta.label_lower}')
+
+
+def enqueue_variants(sender, instance, update_fields=None, raw=False, **kwargs):
+    from apps.common.jobs import enqueue
+
+    if raw:
+        return
+    fields = [field for field in sender._meta.concrete_fields if isinstance(field, VariantImageField)]
+    if update_fields is not None:
+        fields = [field for field in fields if field.name in update_fields]
+    if not fields:
+        return
+    variants = getattr(instance, fields[0].variants_field) or {}
+    names = {field.name: getattr(instance, field.attname).name for field in fields}
+    stale = [name for field, name in names.items() if name and variants.get(field, {}).get('source') != name]
+    if stale:
+        # Written in the same transaction as the image, once per set of image names
+        label = sender._meta.label_lower
+        digest = hashlib.md5('\n'.join(stale).encode()).hexdigest()
+        enqueue('common.generate_image_variants', {'model': label, 'pks': [str(instance.pk)]},
+                idempotency_key=f'image-variants:{label}:{instance.pk}:{digest}')
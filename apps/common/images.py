@@ -0,0 +1,117 @@
+import io
+import logging
+import posixpath
+
+from django.apps import apps
+from django.conf import settings
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps
+
+
+logger = logging.getLogger(__name__)
+
+MODES = {'webp': ('RGBA', 'RGB'), 'jpeg': ('RGB',)}
+
+
+def variants_dir(name):
+    """product_images/abc.jpg -> product_images/variants/abc"""
+    directory, filename = posixpath.split(name)
+    return posixpath.join(directory, 'variants', posixpath.splitext(filename)[0])
+
+
+def variant_name(name, variant, file_format):
+    """
+    product_images/abc.jpg -> product_images/variants/abc/card-480-q80.webp
+
+    The size and quality are part of the name, so changing IMAGE_VARIANTS never
+    serves new content under a URL that clients may have cached for good.
+    """
+    size = settings.IMAGE_VARIANTS['SIZES'][variant]
+    quality = settings.IMAGE_VARIANTS['FORMATS'][file_format]
+    extension = 'jpg' if file_format == 'jpeg' else file_format
+    return posixpath.join(variants_dir(name), f'{variant}-{size}-q{quality}.{extension}')
+
+
+def encode(image, file_format, quality):
+    if image.mode not in MODES[file_format]:
+        if image.mode in ('RGBA', 'LA', 'P') and file_format == 'jpeg':
+            # JPEG has no alpha, flatten on white instead of the black Pillow would use
+            rgba = image.convert('RGBA')
+            image = Image.new('RGB', rgba.size, 'white')
+            image.paste(rgba, mask=rgba.getchannel('A'))
+        else:
+            image = image.convert(MODES[file_format][-1])
+    buffer = io.BytesIO()
+    # No exif= argument, so no metadata is written
+    image.save(buffer, file_format.upper(), quality=quality, optimize=file_format == 'jpeg')
+    return buffer.getvalue()
+
+
+def generate_variants(storage, name):
+    """
+    Write the IMAGE_VARIANTS of the stored image `name` and return their names,
+    {"thumb": {"webp": ..., "jpeg": ...}, ...}.
+
+    Images are rotated according to their EXIF orientation, which is then dropped
+    with the rest of the metadata, and scaled down to fit the variant box.
+    Variants that already exist are kept, so a shared image (e.g. the default
+    avatar) is processed once.
+    """
+
+    source_storage = storage
+    # A content addressed storage would rename the variants after their hash
+    storage = getattr(storage, 'derived', storage)
+    sizes = settings.IMAGE_VARIANTS['SIZES']
+    formats = settings.IMAGE_VARIANTS['FORMATS']
+    names = {variant: {fmt: variant_name(name, variant, fmt) for fmt in formats} for variant in sizes}
+    if all(storage.exists(path) for paths in names.values() for path in paths.values()):
+        return names
+
+    with source_storage.open(name, 'rb') as f:
+        source = Image.open(f)
+        source.load()
+    source = ImageOps.exif_transpose(source)
+    for variant, size in sizes.items():
+        image = source.copy()
+        image.thumbnail((size, size), Image.Resampling.LANCZOS)
+        for fmt, quality in formats.items():
+            path = names[variant][fmt]
+            if storage.exists(path):
+                storage.delete(path)
+            storage.save(path, ContentFile(encode(image, fmt, quality)))
+    return names
+
+
+def update_variants(model_label, pks):
+    """Generate the missing variants of the VariantImageFields of the given rows."""
+
+    from apps.common.fields import VariantImageField
+
+    model = apps.get_model(model_label)
+    fields = [field for field in model._meta.concrete_fields if isinstance(field, VariantImageField)]
+    variants_field = fields[0].variants_field
+    generated = {}  # rows often share an image, e.g. the default avatar
+    for instance in model._base_manager.filter(pk__in=pks).only('pk', variants_field, *(f.name for f in fields)):
+        current = getattr(instance, variants_field) or {}
+        variants = {}
+        for field in fields:
+            name = getattr(instance, field.attname).name
+            if not name:
+                continue
+            if current.get(field.name, {}).get('source') == name:
+                variants[field.name] = current[field.name]
+                continue
+            if name not in generated:
+                try:
+                    generated[name] = generate_variants(field.storage, name)
+                except (OSError, Image.DecompressionBombError) as exc:
+                    # Missing or broken file: keep serving the original
+                    logger.warning('No variants for %s %s: %s', model_label, name, exc)
+                    generated[name] = None
+            if generated[name] is not None:
+                variants[field.name] = {'source': name, **generated[name]}
+        if variants != current:
+            # Only written if the images did not change meanwhile, a newer job handles those
+            model._base_manager.filter(
+                pk=instance.pk, **{f.attname: getattr(instance, f.attname).name for f in fields}
+            ).update(**{variants_field: variants})
@@ -0,0 +1,336 @@
+import logging
+import os
+import random
+import socket
+import threading
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import DatabaseError, IntegrityError, close_old_connections, connection, transaction
+from django.db.models import Avg, Count, F, Min, Q
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from apps.common.models import Job
+
+
+logger = logging.getLogger(__name__)
+
+registry = {}
+
+
+class JobFunction:
+    """A function registered with @job, call `.enqueue(**kwargs)` to run it in a worker."""
+
+    def __init__(self, func, name, queue, max_attempts, backoff):
+        self.func = func
+        self.name = name
+        self.queue = queue
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+
+    def __call__(self, **kwargs):
+        return self.func(**kwargs)
+
+    def enqueue(self, idempotency_key=None, run_at=None, delay=None, **kwargs):
+        return enqueue(self.name, kwargs, idempotency_key=idempotency_key, run_at=run_at, delay=delay)
+
+    def retry_delay(self, attempts):
+        """Exponential backoff with full jitter, capped at JOBS['MAX_BACKOFF']."""
+        return random.uniform(0, min(self.backoff * 2 ** (attempts - 1), settings.JOBS['MAX_BACKOFF']))
+
+
+def job(name=None, queue='default', max_attempts=5, backoff=10):
+    """
+    Register a function as a background job.
+
+    Args:
+        name (str): Job name, by default "<app>.<function>".
+        queue (str): Queue the jobs are put in.
+        max_attempts (int): Attempts before the job is marked FAILED.
+        backoff (float): Base retry delay in seconds, doubled on every failed attempt.
+
+    Job functions take JSON-serializable keyword arguments and may run more than
+    once (a worker can die after the work is done), so they must be idempotent.
+    """
+
+    def decorator(func):
+        app = func.__module__.split('.')[1] if func.__module__.startswith('apps.') else func.__module__
+        job_name = name or f'{app}.{func.__name__}'
+        registry[job_name] = JobFunction(func, job_name, queue, max_attempts, backoff)
+        return registry[job_name]
+
+    return decorator
+
+
+def enqueue(name, kwargs=None, idempotency_key=None, run_at=None, delay=None):
+    """
+    Put a job in the queue and return it.
+
+    The job row is written in the current transaction, so it only becomes visible
+    to the workers if that transaction commits. With an idempotency key an
+    existing job with the same key is returned instead of a new one, unless that
+    job FAILED: it then gives up its key (and stays for inspection) and a new
+    job is enqueued.
+    """
+
+    func = registry[name]
+    if run_at is None:
+        run_at = timezone.now() + timedelta(seconds=delay or 0)
+    fields = dict(name=name, kwargs=kwargs or {}, queue=func.queue, max_attempts=func.max_attempts, run_at=run_at)
+    if idempotency_key is None:
+        return Job.objects.create(**fields)
+    try:
+        with transaction.atomic():
+            return Job.objects.create(idempotency_key=idempotency_key, **fields)
+    except IntegrityError:
+        existing = Job.objects.get(idempotency_key=idempotency_key)
+    if existing.status != 'FAILED' or not Job.objects.filter(id=existing.id, status='FAILED').update(
+            idempotency_key=None):
+        return existing
+    try:
+        with transaction.atomic():
+            return Job.objects.create(idempotency_key=idempotency_key, **fields)
+    except IntegrityError:
+        # Another process enqueued the key again first
+        return Job.objects.get(idempotency_key=idempotency_key)
+
+
+def claim(queues, worker_id):
+    """Lock the oldest due job of `queues` with FOR UPDATE SKIP LOCKED and mark it RUNNING."""
+
+    now = timezone.now()
+    with transaction.atomic():
+        job = (
+            Job.objects.select_for_update(skip_locked=True)
+            .filter(status='QUEUED', queue__in=queues, run_at__lte=now)
+            .order_by('run_at')
+            .first()
+        )
+        if job is None:
+            return None
+        job.status = 'RUNNING'
+        job.attempts += 1
+        job.locked_by = worker_id
+        job.started_at = now
+        job.heartbeat_at = now
+        job.save(update_fields=['status', 'attempts', 'locked_by', 'started_at', 'heartbeat_at'])
+    return job
+
+
+class Heartbeat(threading.Thread):
+    """
+    Touches heartbeat_at of a running job every JOBS['HEARTBEAT_INTERVAL'] seconds,
+    so requeue_stale can tell a slow job from one whose worker died.
+    """
+
+    def __init__(self, job):
+        super().__init__(daemon=True)
+        self.job = job
+        self.stopped = threading.Event()
+
+    def run(self):
+        try:
+            while not self.stopped.wait(settings.JOBS['HEARTBEAT_INTERVAL']):
+                try:
+                    Job.objects.filter(id=self.job.id, status='RUNNING', locked_by=self.job.locked_by).update(
+                        heartbeat_at=timezone.now())
+                except DatabaseError:
+                    logger.exception('Could not record the heartbeat of job %s', self.job)
+        finally:
+            # The thread has its own connection
+            connection.close()
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+
+def execute(job):
+    """Run a claimed job and record the outcome, scheduling a retry on failure."""
+
+    func = registry.get(job.name)
+    heartbeat = Heartbeat(job)
+    heartbeat.start()
+    try:
+        if func is None:
+            raise LookupError(f'Job {job.name} is not registered')
+        func(**job.kwargs)
+    except Exception:
+        job.last_error = traceback.format_exc()
+        if func is not None and job.attempts < job.max_attempts:
+            job.status = 'QUEUED'
+            job.run_at = timezone.now() + timedelta(seconds=func.retry_delay(job.attempts))
+            logger.warning('Job %s failed (attempt %s of %s), retry at %s\n%s',
+                           job, job.attempts, job.max_attempts, job.run_at, job.last_error)
+        else:
+            job.status = 'FAILED'
+            job.finished_at = timezone.now()
+            logger.error('Job %s failed for good after %s attempts\n%s', job, job.attempts, job.last_error)
+    else:
+        job.status = 'SUCCEEDED'
+        job.finished_at = timezone.now()
+    finally:
+        heartbeat.stop()
+    try:
+        # Only while the job is still ours: requeue_stale may have handed it to another worker
+        saved = Job.objects.filter(id=job.id, status='RUNNING', locked_by=job.locked_by).update(
+            status=job.status, run_at=job.run_at, finished_at=job.finished_at, last_error=job.last_error,
+            locked_by='',
+        )
+    except DatabaseError:
+        # The job stays RUNNING without a heartbeat, requeue_stale picks it up
+        logger.exception('Could not record the outcome %s of job %s', job.status, job)
+        return
+    if not saved:
+        logger.warning('Job %s was taken from worker %s before it finished (%s)', job, job.locked_by, job.status)
+
+
+def requeue_stale(timeout):
+    """
+    Handle jobs left RUNNING by a worker that died (no heartbeat for `timeout`
+    seconds): put them back in the queue, or mark them FAILED when they have no
+    attempts left. Returns the number of handled jobs.
+    """
+
+    now = timezone.now()
+    stale = Job.objects.filter(status='RUNNING').annotate(
+        last_seen=Coalesce('heartbeat_at', 'started_at')
+    ).filter(last_seen__lt=now - timedelta(seconds=timeout))
+    error = f'The worker stopped sending heartbeats for {timeout} seconds'
+    failed = stale.filter(attempts__gte=F('max_attempts')).update(
+        status='FAILED', locked_by='', finished_at=now, last_error=error)
+    requeued = stale.filter(attempts__lt=F('max_attempts')).update(
+        status='QUEUED', locked_by='', run_at=now, last_error=error)
+    if failed:
+        logger.error('Marked %s stale jobs without attempts left FAILED', failed)
+    return failed + requeued
+
+
+# Periodic jobs
+
+def parse_cron_field(field, low, high):
+    values = set()
+    for part in field.split(','):
+        value, _, step = part.partition('/')
+        step = int(step) if step else 1
+        if value == '*':
+            start, end = low, high
+        elif '-' in value:
+            start, end = map(int, value.split('-'))
+        else:
+            start = int(value)
+            end = high if step > 1 else start
+        if not low <= start <= end <= high:
+            raise ValueError(f'Cron field {field!r} is out of range {low}-{high}')
+        values.update(range(start, end + 1, step))
+    return values
+
+
+class Cron:
+    """
+    A five field cron expression: minute hour day-of-month month day-of-week.
+
+    Supports "*", lists, ranges and steps. Like cron, when both day fields are
+    restricted a time matches if either of them matches. Sunday is 0 or 7.
+    """
+
+    def __init__(self, expression):
+        fields = expression.split()
+        if len(fields) != 5:
+            raise ValueError(f'Cron expression {expression!r} must have 5 fields')
+        self.expression = expression
+        self.minutes = parse_cron_field(fields[0], 0, 59)
+        self.hours = parse_cron_field(fields[1], 0, 23)
+        self.days = parse_cron_field(fields[2], 1, 31)
+        self.months = parse_cron_field(fields[3], 1, 12)
+        self.weekdays = {day % 7 for day in parse_cron_field(fields[4], 0, 7)}
+        self.any_day = fields[2] == '*'
+        self.any_weekday = fields[4] == '*'
+
+    def matches(self, moment):
+        if moment.minute not in self.minutes or moment.hour not in self.hours or moment.month not in self.months:
+            return False
+        day = moment.day in self.days
+        weekday = (moment.isoweekday() % 7) in self.weekdays
+        if self.any_day or self.any_weekday:
+            return day and weekday
+        return day or weekday
+
+
+class Scheduler:
+    """
+    Enqueues the jobs of JOBS['PERIODIC'] when their cron expression matches.
+
+    Every due minute is enqueued with the idempotency key "periodic:<name>:<minute>",
+    so several schedulers (one per run_workers instance) never double-enqueue.
+    Minutes missed while no scheduler was running are not caught up.
+    """
+
+    def __init__(self, periodic):
+        self.entries = {name: (entry['job'], Cron(entry['cron']), entry.get('kwargs', {}))
+                        for name, entry in periodic.items()}
+        self.last_minute = timezone.localtime().replace(second=0, microsecond=0)
+
+    def tick(self):
+        minute = timezone.localtime().replace(second=0, microsecond=0)
+        while self.last_minute < minute:
+            self.last_minute += timedelta(minutes=1)
+            for name, (job_name, cron, kwargs) in self.entries.items():
+                if cron.matches(self.last_minute):
+                    enqueue(job_name, kwargs, idempotency_key=f'periodic:{name}:{self.last_minute.isoformat()}')
+
+
+# Workers
+
+def worker_id():
+    return f'{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}'
+
+
+def work(queues, stop, poll_interval, burst=False):
+    """Claim and run jobs until `stop` is set, or until the queues are empty with `burst`."""
+
+    ident = worker_id()
+    while not stop.is_set():
+        close_old_connections()
+        try:
+            job = claim(queues, ident)
+        except DatabaseError:
+            # E.g. the database restarted, keep the worker alive and try again later
+            logger.exception('Worker %s could not claim a job', ident)
+            stop.wait(poll_interval)
+            continue
+        if job is None:
+            if burst:
+                return
+            stop.wait(poll_interval)
+            continue
+        execute(job)
+
+
+def queue_stats():
+    """Depth, age of the oldest due job and recent wait/run times per queue."""
+
+    now = timezone.now()
+    hour_ago = now - timedelta(hours=1)
+    rows = Job.objects.values('queue').annotate(
+        queued=Count('id', filter=Q(status='QUEUED', run_at__lte=now)),
+        scheduled=Count('id', filter=Q(status='QUEUED', run_at__gt=now)),
+        running=Count('id', filter=Q(status='RUNNING')),
+        failed=Count('id', filter=Q(status='FAILED')),
+        succeeded_last_hour=Count('id', filter=Q(status='SUCCEEDED', finished_at__gte=hour_ago)),
+        oldest_run_at=Min('run_at', filter=Q(status='QUEUED', run_at__lte=now)),
+        avg_wait=Avg(F('started_at') - F('run_at'), filter=Q(status='SUCCEEDED', finished_at__gte=hour_ago)),
+        avg_run=Avg(F('finished_at') - F('started_at'), filter=Q(status='SUCCEEDED', finished_at__gte=hour_ago)),
+    )
+    stats = {}
+    for row in rows:
+        queue = row.pop('queue')
+        oldest = row.pop('oldest_run_at')
+        row['oldest_wait_s'] = round((now - oldest).total_seconds(), 3) if oldest else 0
+        for key in ('avg_wait', 'avg_run'):
+            value = row.pop(key)
+            row[f'{key}_s'] = round(value.total_seconds(), 3) if value is not None else None
+        stats[queue] = row
+    return stats
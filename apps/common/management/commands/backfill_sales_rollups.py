@@ -0,0 +1,24 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.sellers.analytics import backfill_rollups
+
+
+class Command(BaseCommand):
+    help = (
+        'Rebuild the daily sales and rating stats of sellers and products (SellerDailyStats, '
+        'ProductDailyStats) from orders and reviews. Every batch of days is replaced in its own '
+        'transaction, so the command can be interrupted and run again.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date-from', type=date.fromisoformat, help='First day, YYYY-MM-DD (default: first order)')
+        parser.add_argument('--date-to', type=date.fromisoformat, help='Last day, YYYY-MM-DD (default: today)')
+        parser.add_argument('--batch-days', type=int, default=31, help='Days per transaction')
+
+    def handle(self, *args, **options):
+        if options['batch_days'] < 1:
+            raise CommandError('--batch-days must be positive')
+        sellers, products = backfill_rollups(options['date_from'], options['date_to'], options['batch_days'])
+        self.stdout.write(f'Wrote {sellers} seller and {products} product daily rows')
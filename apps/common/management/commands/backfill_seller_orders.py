@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from apps.sellers.orders import backfill_seller_orders
+
+
+class Command(BaseCommand):
+    help = (
+        'Create the per-seller order rows (SellerOrder) of orders placed before they existed. Orders that '
+        'already have them are skipped, so the command can be interrupted and run again. Subtotals use '
+        'the current product prices.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Orders per batch')
+
+    def handle(self, *args, **options):
+        created = backfill_seller_orders(options['batch_size'])
+        self.stdout.write(f'Created {created} seller orders')
@@ -0,0 +1,203 @@
+import json
+import subprocess
+import time
+import tracemalloc
+from unittest import mock
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client
+from django.utils import timezone
+from rest_framework.views import APIView
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from apps.common.utils import percentile
+from apps.profiles.models import Order, OrderItem, ShippingAddress
+from apps.sellers.models import Seller
+from apps.shop.models import Category, Product
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark the hot API endpoints in-process against the current (seeded) database. '
+        'Reports throughput, p50/p95/p99 latency, query counts and allocations, and can save '
+        'the results as a JSON baseline or compare them with a previous one. '
+        'All writes are rolled back when the run finishes.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=200, help='Timed requests per endpoint')
+        parser.add_argument('--warmup', type=int, default=20, help='Untimed requests per endpoint')
+        parser.add_argument('--only', default='', help='Comma separated endpoint names to run')
+        parser.add_argument('--save', metavar='PATH', help='Write results to a JSON baseline file')
+        parser.add_argument('--compare', metavar='PATH', help='Compare results with a JSON baseline file')
+        parser.add_argument('--threshold', type=float, default=0.15,
+                            help='Relative slowdown of p50/p95 that counts as a regression')
+
+    def handle(self, *args, **options):
+        self.fixtures = self.load_fixtures()
+        self.client = Client(HTTP_HOST='localhost')
+        scenarios = self.scenarios()
+        if options['only']:
+            names = set(options['only'].split(','))
+            scenarios = [scenario for scenario in scenarios if scenario['name'] in names]
+
+        results = {}
+        # Throttling would reject most of the run, it is not what is measured here
+        with mock.patch.object(APIView, 'get_throttles', return_value=[]), transaction.atomic():
+            for scenario in scenarios:
+                results[scenario['name']] = self.run_scenario(scenario, options['iterations'], options['warmup'])
+                self.print_result(scenario['name'], results[scenario['name']])
+            transaction.set_rollback(True)
+
+        report = {
+            'commit': self.current_commit(),
+            'created_at': timezone.now().isoformat(),
+            'iterations': options['iterations'],
+            'results': results,
+        }
+        if options['save']:
+            with open(options['save'], 'w') as f:
+                json.dump(report, f, indent=2)
+            self.stdout.write(f'Baseline saved to {options["save"]}')
+        if options['compare']:
+            self.compare(report, options['compare'], options['threshold'])
+
+    def load_fixtures(self):
+        seller = Seller.objects.select_related('user').filter(is_approved=True, products__isnull=False).first()
+        buyer_order = Order.objects.select_related('user').filter(user__is_active=True).first()
+        product = Product.objects.first()
+        category = Category.objects.filter(products__isnull=False).first()
+        if not (seller and buyer_order and product and category):
+            raise CommandError('The database is empty, run "manage.py seed_marketplace" first')
+        buyer = buyer_order.user
+        shipping = ShippingAddress.objects.filter(user=buyer).first() or ShippingAddress.objects.create(
+            user=buyer, full_name=buyer.full_name, email=buyer.email, phone='79000000000',
+            address='Bench street 1', city='Moscow', country='Russia', zipcode='101000',
+        )
+        return {
+            'buyer': buyer,
+            'buyer_token': str(RefreshToken.for_user(buyer).access_token),
+            'seller_token': str(RefreshToken.for_user(seller.user).access_token),
+            'product': product,
+            'category': category,
+            'shipping': shipping,
+        }
+
+    def scenarios(self):
+        f = self.fixtures
+        buyer, seller = f['buyer_token'], f['seller_token']
+        cart_body = {'slug': f['product'].slug, 'quantity': 1}
+
+        def fill_cart():
+            OrderItem.objects.update_or_create(
+                user=f['buyer'], order=None, product=f['product'], defaults={'quantity': 1}
+            )
+
+        return [
+            {'name': 'products', 'method': 'get', 'path': '/shop/products/', 'token': buyer},
+            {'name': 'products_filtered', 'method': 'get', 'token': buyer,
+             'path': '/shop/products/?min_price=10&max_price=5000&in_stock=1&page_size=20'},
+            {'name': 'products_search', 'method': 'get', 'token': buyer,
+             'path': f'/shop/products/?name={f["product"].name.split()[0]}'},
+            {'name': 'product', 'method': 'get', 'path': f'/shop/products/{f["product"].slug}/', 'token': buyer},
+            {'name': 'categories', 'method': 'get', 'path': '/shop/categories/', 'token': buyer},
+            {'name': 'cart_get', 'method': 'get', 'path': '/shop/cart/', 'token': buyer, 'setup': fill_cart},
+            {'name': 'cart_post', 'method': 'post', 'path': '/shop/cart/', 'token': buyer, 'data': cart_body},
+            {'name': 'checkout', 'method': 'post', 'path': '/shop/checkout/', 'token': buyer, 'setup': fill_cart,
+             'data': {'shipping_id': str(f['shipping'].id)}},
+            {'name': 'orders', 'method': 'get', 'path': '/profiles/orders/', 'token': buyer},
+            {'name': 'seller_orders', 'method': 'get', 'path': '/sellers/orders/', 'token': seller},
+        ]
+
+    def request(self, scenario):
+        call = getattr(self.client, scenario['method'])
+        kwargs = {'HTTP_AUTHORIZATION': f'Bearer {scenario["token"]}'}
+        if 'data' in scenario:
+            kwargs.update(data=scenario['data'], content_type='application/json')
+        response = call(scenario['path'], **kwargs)
+        if hasattr(response, 'streaming_content'):
+            b''.join(response.streaming_content)
+        return response
+
+    def run_scenario(self, scenario, iterations, warmup):
+        setup = scenario.get('setup', lambda: None)
+        for _ in range(warmup):
+            setup()
+            self.request(scenario)
+
+        timings, statuses = [], {}
+        for _ in range(iterations):
+            setup()
+            started = time.perf_counter()
+            response = self.request(scenario)
+            timings.append((time.perf_counter() - started) * 1000)
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+        # Queries and allocations are measured on separate requests so that
+        # the query hook and tracemalloc do not inflate the timings above
+        queries = []
+
+        def count_queries(execute, sql, params, many, context):
+            queries.append(sql)
+            return execute(sql, params, many, context)
+
+        setup()
+        with connection.execute_wrapper(count_queries):
+            self.request(scenario)
+
+        setup()
+        tracemalloc.start()
+        try:
+            before, _ = tracemalloc.get_traced_memory()
+            self.request(scenario)
+            after, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        timings.sort()
+        return {
+            'rps': round(iterations / (sum(timings) / 1000), 1),
+            'p50_ms': round(percentile(timings, 50), 3),
+            'p95_ms': round(percentile(timings, 95), 3),
+            'p99_ms': round(percentile(timings, 99), 3),
+            'queries': len(queries),
+            'alloc_peak_kb': round((peak - before) / 1024, 1),
+            'alloc_retained_kb': round((after - before) / 1024, 1),
+            'statuses': {str(code): count for code, count in statuses.items()},
+        }
+
+    def print_result(self, name, result):
+        self.stdout.write(
+            f'{name:<18} {result["rps"]:>8} rps  p50 {result["p50_ms"]:>8} ms  p95 {result["p95_ms"]:>8} ms  '
+            f'p99 {result["p99_ms"]:>8} ms  {result["queries"]:>4} queries  {result["alloc_peak_kb"]:>8} KB peak  '
+            f'statuses {result["statuses"]}'
+        )
+
+    def compare(self, report, path, threshold):
+        with open(path) as f:
+            baseline = json.load(f)
+        self.stdout.write(f'Compared with {path} (commit {baseline.get("commit")})')
+        regressions = []
+        for name, result in report['results'].items():
+            old = baseline['results'].get(name)
+            if not old:
+                continue
+            for metric in ('p50_ms', 'p95_ms'):
+                if old[metric] and result[metric] > old[metric] * (1 + threshold):
+                    regressions.append(f'{name}: {metric} {old[metric]} -> {result[metric]}')
+            if result['queries'] > old['queries']:
+                regressions.append(f'{name}: queries {old["queries"]} -> {result["queries"]}')
+        if regressions:
+            for line in regressions:
+                self.stdout.write(self.style.ERROR(f'REGRESSION {line}'))
+            raise CommandError(f'{len(regressions)} regression(s) against {path}')
+        self.stdout.write(self.style.SUCCESS('No regressions'))
+
+    def current_commit(self):
+        try:
+            return subprocess.run(
+                ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
@@ -0,0 +1,42 @@
+from django.apps import apps
+from django.core.management.base import BaseCommand
+
+from apps.common.fields import VariantImageField
+from apps.common.images import update_variants
+from apps.common.jobs import enqueue
+from apps.common.utils import batched
+
+
+def variant_models():
+    return {
+        model._meta.label_lower: model for model in apps.get_models()
+        if any(isinstance(field, VariantImageField) for field in model._meta.concrete_fields)
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        'Generate the resized image variants of existing rows (products, categories, avatars), e.g. after '
+        'deploying the variants pipeline or changing IMAGE_VARIANTS. Rows are queued in batches for '
+        'run_workers, or processed in this process with --sync. Rows with up-to-date variants are skipped.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--model', action='append', choices=sorted(variant_models()),
+                            help='Model to process, all by default. Can be repeated')
+        parser.add_argument('--batch-size', type=int, default=200)
+        parser.add_argument('--sync', action='store_true', help='Generate the variants here instead of queueing jobs')
+
+    def handle(self, *args, **options):
+        models = variant_models()
+        for label in options['model'] or sorted(models):
+            pks = models[label]._base_manager.order_by('pk').values_list('pk', flat=True)
+            batches = 0
+            for batch in batched(pks.iterator(chunk_size=options['batch_size']), options['batch_size']):
+                batch = [str(pk) for pk in batch]
+                if options['sync']:
+                    update_variants(label, batch)
+                else:
+                    enqueue('common.generate_image_variants', {'model': label, 'pks': batch})
+                batches += 1
+            self.stdout.write(f'{label}: {batches} batches {"processed" if options["sync"] else "queued"}')
@@ -0,0 +1,48 @@
+import json
+import os
+
+from django.core.files import File
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Q
+
+from apps.sellers.imports import run_import
+from apps.sellers.models import ProductImport, Seller
+
+
+class Command(BaseCommand):
+    help = (
+        'Bulk import products for a seller from a CSV or JSONL file. Images are given as URLs '
+        'or as paths inside a zip archive. Prints a per-row error report.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('source', help='CSV or JSONL file with the products')
+        parser.add_argument('--seller', required=True, help='Seller slug or the email of its user')
+        parser.add_argument('--archive', help='Zip archive with the images referenced by the rows')
+        parser.add_argument('--file-format', choices=['csv', 'jsonl'],
+                            help='Format of the source file, by default taken from its extension')
+
+    def handle(self, *args, **options):
+        seller = Seller.objects.filter(Q(slug=options['seller']) | Q(user__email=options['seller'])).first()
+        if seller is None:
+            raise CommandError(f'Seller {options["seller"]} does not exist')
+        file_format = options['file_format'] or os.path.splitext(options['source'])[1].lstrip('.').lower()
+        if file_format not in ('csv', 'jsonl'):
+            raise CommandError('Pass --file-format csv or jsonl')
+
+        product_import = ProductImport(seller=seller, file_format=file_format)
+        with open(options['source'], 'rb') as source:
+            product_import.source.save(os.path.basename(options['source']), File(source), save=False)
+        if options['archive']:
+            with open(options['archive'], 'rb') as archive:
+                product_import.archive.save(os.path.basename(options['archive']), File(archive), save=False)
+        product_import.save()
+
+        run_import(product_import)
+
+        for error in product_import.errors:
+            self.stdout.write(f'row {error["row"]}: {json.dumps(error["errors"], ensure_ascii=False)}')
+        self.stdout.write(self.style.SUCCESS(
+            f'{product_import.processed_rows} rows, {product_import.created_count} products created, '
+            f'{product_import.error_count} rows rejected'
+        ))
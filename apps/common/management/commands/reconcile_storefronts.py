@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from apps.sellers.storefront import reconcile_storefronts
+
+
+class Command(BaseCommand):
+    help = (
+        'Recompute the storefront counters of sellers (product count, rating, units sold) that drifted '
+        'from their products, reviews and orders. Run it once after adding the counters; afterwards '
+        'the sellers.reconcile_storefronts periodic job keeps them in check.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Sellers per batch')
+
+    def handle(self, *args, **options):
+        fixed = reconcile_storefronts(options['batch_size'])
+        self.stdout.write(f'Corrected {fixed} sellers')
@@ -0,0 +1,156 @@
+import http.client
+import json
+import queue
+import threading
+import time
+from collections import defaultdict
+from urllib.parse import urlencode, urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from apps.accounts.models import User
+from apps.common.utils import percentile
+
+
+PLACEHOLDERS = {'str': 'x', 'int': 1, 'float': 1.0, 'bool': True, 'NoneType': None}
+
+
+def placeholder_body(body_shape):
+    """Build a request body with dummy values from a captured body shape."""
+    if isinstance(body_shape, dict):
+        return {key: placeholder_body(value) for key, value in body_shape.items()}
+    if isinstance(body_shape, list):
+        return [placeholder_body(value) for value in body_shape]
+    return PLACEHOLDERS.get(body_shape)
+
+
+class Command(BaseCommand):
+    help = (
+        'Replay traffic captured by TrafficCaptureMiddleware against a running gunicorn/uvicorn '
+        'deployment with a given concurrency and request rate, then report latency percentiles, '
+        'error rate and throughput per endpoint.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('capture', help='JSONL file written by TrafficCaptureMiddleware')
+        parser.add_argument('--base-url', default='http://127.0.0.1:8000')
+        parser.add_argument('--concurrency', type=int, default=8, help='Parallel connections')
+        parser.add_argument('--rate', type=float, default=0, help='Requests per second, 0 means as fast as possible')
+        parser.add_argument('--limit', type=int, default=0, help='Stop after this many requests')
+        parser.add_argument('--timeout', type=float, default=30)
+        parser.add_argument('--include-writes', action='store_true',
+                            help='Also replay POST/PUT/PATCH/DELETE requests')
+        parser.add_argument('--token', action='append', default=[], metavar='ROLE=TOKEN',
+                            help='JWT access token for a role (buyer, seller, staff). By default tokens '
+                                 'are issued for the first matching user of the local database')
+
+    def handle(self, *args, **options):
+        url = urlsplit(options['base_url'])
+        if url.scheme not in ('http', 'https'):
+            raise CommandError('--base-url must be an http(s) URL')
+        self.url = url
+        self.options = options
+        self.tokens = self.load_tokens(options['token'])
+
+        requests = queue.Queue(maxsize=options['concurrency'] * 4)
+        results = defaultdict(list)
+        workers = [
+            threading.Thread(target=self.worker, args=(requests, results), daemon=True)
+            for _ in range(options['concurrency'])
+        ]
+        for worker in workers:
+            worker.start()
+
+        started = time.perf_counter()
+        sent = 0
+        for record in self.records():
+            if options['rate']:
+                # Open-loop schedule: the send time does not depend on how slow responses are
+                delay = started + sent / options['rate'] - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            requests.put(record)
+            sent += 1
+            if options['limit'] and sent >= options['limit']:
+                break
+        for _ in workers:
+            requests.put(None)
+        for worker in workers:
+            worker.join()
+
+        self.report(results, time.perf_counter() - started)
+
+    def load_tokens(self, pairs):
+        tokens = {}
+        for pair in pairs:
+            role, _, token = pair.partition('=')
+            tokens[role] = token
+        users = {
+            'staff': User.objects.filter(is_staff=True, is_active=True),
+            'seller': User.objects.filter(account_type='SELLER', seller__is_approved=True, is_active=True),
+            'buyer': User.objects.filter(account_type='BUYER', is_staff=False, is_active=True),
+        }
+        for role, queryset in users.items():
+            if role not in tokens:
+                user = queryset.first()
+                if user:
+                    tokens[role] = str(RefreshToken.for_user(user).access_token)
+        return tokens
+
+    def records(self):
+        with open(self.options['capture'], encoding='utf-8') as f:
+            for line in f:
+                record = json.loads(line)
+                if record['method'] not in ('GET', 'HEAD') and not self.options['include_writes']:
+                    continue
+                yield record
+
+    def worker(self, requests, results):
+        connection_class = http.client.HTTPSConnection if self.url.scheme == 'https' else http.client.HTTPConnection
+        connection = connection_class(self.url.netloc, timeout=self.options['timeout'])
+        local = defaultdict(list)
+        while (record := requests.get()) is not None:
+            endpoint = f'{record["method"]} {record["route"] or record["path"]}'
+            path = record['path'] + ('?' + urlencode(record['query'], doseq=True) if record['query'] else '')
+            headers = {}
+            body = None
+            token = self.tokens.get(record['role'])
+            if token:
+                headers['Authorization'] = f'Bearer {token}'
+            if record['method'] not in ('GET', 'HEAD'):
+                payload = record['body'] if 'body' in record else placeholder_body(record['body_shape'])
+                body = json.dumps(payload).encode()
+                headers['Content-Type'] = 'application/json'
+
+            started = time.perf_counter()
+            try:
+                connection.request(record['method'], path, body=body, headers=headers)
+                response = connection.getresponse()
+                response.read()
+                status = response.status
+            except (OSError, http.client.HTTPException):
+                connection.close()
+                status = None
+            local[endpoint].append((status, (time.perf_counter() - started) * 1000))
+        connection.close()
+        # list.extend is atomic under the GIL, no lock is needed to merge
+        for endpoint, samples in local.items():
+            results[endpoint].extend(samples)
+
+    def report(self, results, elapsed):
+        total = sum(len(samples) for samples in results.values())
+        self.stdout.write(f'{total} requests in {elapsed:.1f}s, {total / elapsed:.1f} rps')
+        self.stdout.write(
+            f'{"endpoint":<55} {"count":>7} {"rps":>8} {"err%":>6} {"4xx%":>6} '
+            f'{"p50 ms":>9} {"p95 ms":>9} {"p99 ms":>9}'
+        )
+        for endpoint, samples in sorted(results.items(), key=lambda item: -len(item[1])):
+            timings = sorted(latency for _, latency in samples)
+            errors = sum(1 for status, _ in samples if status is None or status >= 500)
+            client_errors = sum(1 for status, _ in samples if status and 400 <= status < 500)
+            self.stdout.write(
+                f'{endpoint[:55]:<55} {len(samples):>7} {len(samples) / elapsed:>8.1f} '
+                f'{100 * errors / len(samples):>6.1f} {100 * client_errors / len(samples):>6.1f} '
+                f'{percentile(timings, 50):>9.1f} {percentile(timings, 95):>9.1f} {percentile(timings, 99):>9.1f}'
+            )
@@ -0,0 +1,126 @@
+import logging
+import os
+import signal
+import threading
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError, close_old_connections, connections
+
+from apps.common.jobs import Scheduler, registry, requeue_stale, work
+
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = (
+        'Run background job workers: PROCESSES forked processes with THREADS worker threads each, '
+        'claiming jobs from the common_job table with SELECT ... FOR UPDATE SKIP LOCKED. The parent '
+        'process enqueues the periodic jobs of JOBS["PERIODIC"], requeues jobs of dead workers and '
+        'restarts worker processes that died.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=1)
+        parser.add_argument('--threads', type=int, default=4, help='Worker threads per process')
+        parser.add_argument('--queues', default='', help='Comma separated queues, by default all registered ones')
+        parser.add_argument('--poll-interval', type=float, default=None,
+                            help='Seconds to wait when the queues are empty, JOBS["POLL_INTERVAL"] by default')
+        parser.add_argument('--burst', action='store_true', help='Exit once the queues are empty')
+        parser.add_argument('--no-scheduler', action='store_true', help='Do not enqueue periodic jobs')
+
+    def handle(self, *args, **options):
+        if options['processes'] < 1 or options['threads'] < 1:
+            raise CommandError('--processes and --threads must be at least 1')
+        queues = [queue for queue in options['queues'].split(',') if queue] or sorted(
+            {func.queue for func in registry.values()})
+        poll_interval = options['poll_interval'] or settings.JOBS['POLL_INTERVAL']
+        self.stop = threading.Event()
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            signal.signal(signum, self.shutdown)
+
+        self.stdout.write(f'Workers: {options["processes"]} x {options["threads"]}, queues: {", ".join(queues)}')
+        if options['burst']:
+            self.run_threads(queues, options['threads'], poll_interval, burst=True)
+            return
+
+        children = set()
+        try:
+            for _ in range(options['processes']):
+                children.add(self.fork_child(queues, options['threads'], poll_interval))
+
+            scheduler = None if options['no_scheduler'] else Scheduler(settings.JOBS['PERIODIC'])
+            while not self.stop.is_set():
+                for pid in self.reap(children):
+                    if self.stop.is_set():
+                        break
+                    self.stderr.write(f'Worker process {pid} died, starting a new one')
+                    children.add(self.fork_child(queues, options['threads'], poll_interval))
+                try:
+                    close_old_connections()
+                    if scheduler is not None:
+                        scheduler.tick()
+                    stale = requeue_stale(settings.JOBS['VISIBILITY_TIMEOUT'])
+                except DatabaseError:
+                    # E.g. the database restarted, the workers keep running and the next round retries
+                    logger.exception('Could not enqueue periodic jobs or requeue stale jobs')
+                else:
+                    if stale:
+                        self.stdout.write(f'Requeued or failed {stale} stale jobs')
+                self.stop.wait(min(poll_interval * 10, 30))
+        finally:
+            self.reap(children)
+            for pid in children:
+                os.kill(pid, signal.SIGTERM)
+            for pid in children:
+                os.waitpid(pid, 0)
+
+    def fork_child(self, queues, threads, poll_interval):
+        # Connections must not be shared with the forked children
+        connections.close_all()
+        pid = os.fork()
+        if pid == 0:
+            self.run_child(queues, threads, poll_interval)
+        return pid
+
+    def reap(self, children):
+        """Remove the exited children from `children` and return their pids."""
+
+        exited = []
+        while children:
+            pid, _ = os.waitpid(-1, os.WNOHANG)
+            if pid == 0:
+                break
+            children.discard(pid)
+            exited.append(pid)
+        return exited
+
+    def run_child(self, queues, threads, poll_interval):
+        try:
+            self.run_threads(queues, threads, poll_interval)
+        finally:
+            connections.close_all()
+            os._exit(0)
+
+    def run_threads(self, queues, threads, poll_interval, burst=False):
+        workers = [
+            threading.Thread(target=self.run_worker, args=(queues, poll_interval, burst))
+            for _ in range(threads)
+        ]
+        for worker in workers:
+            worker.start()
+        # Join with a timeout, so the main thread still handles signals
+        while any(worker.is_alive() for worker in workers):
+            for worker in workers:
+                worker.join(0.5)
+
+    def run_worker(self, queues, poll_interval, burst):
+        try:
+            work(queues, self.stop, poll_interval, burst=burst)
+        finally:
+            connections.close_all()
+
+    def shutdown(self, signum, frame):
+        # Running jobs are finished, no new ones are claimed
+        self.stop.set()
@@ -0,0 +1,308 @@
+import random
+import uuid
+from array import array
+from bisect import bisect
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+from itertools import accumulate
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from apps.accounts.models import User
+from apps.common.fields import register_slugs
+from apps.common.utils import batched
+from apps.profiles.models import Order, OrderItem, ShippingAddress
+from apps.reviews.models import Review
+from apps.sellers.analytics import backfill_rollups
+from apps.sellers.storefront import reconcile_storefronts
+from apps.sellers.models import ProductDailyStats, Seller, SellerDailyStats, SellerOrder
+from apps.sellers.orders import backfill_seller_orders
+from apps.shop.models import Category, Product
+from apps.shop.related import update_related_products
+from apps.shop.similar import update_similar_products
+
+
+CATEGORY_NAMES = [
+    'Electronics', 'Phones', 'Laptops', 'Books', 'Clothes', 'Shoes', 'Toys', 'Garden', 'Kitchen',
+    'Sports', 'Beauty', 'Health', 'Auto', 'Pets', 'Furniture', 'Music', 'Office', 'Tools',
+]
+ADJECTIVES = [
+    'Classic', 'Smart', 'Compact', 'Premium', 'Wireless', 'Portable', 'Eco', 'Pro', 'Mini', 'Ultra',
+    'Vintage', 'Modern', 'Soft', 'Heavy', 'Light', 'Digital', 'Organic', 'Waterproof',
+]
+NOUNS = [
+    'Case', 'Charger', 'Headphones', 'Lamp', 'Backpack', 'Bottle', 'Chair', 'Notebook', 'Watch',
+    'Jacket', 'Sneakers', 'Speaker', 'Mug', 'Keyboard', 'Mouse', 'Blanket', 'Kettle', 'Camera',
+]
+FIRST_NAMES = ['Ivan', 'Anna', 'Oleg', 'Maria', 'Pavel', 'Olga', 'Sergey', 'Elena', 'Dmitry', 'Irina']
+LAST_NAMES = ['Ivanov', 'Petrova', 'Sidorov', 'Smirnova', 'Kuznetsov', 'Popova', 'Volkov', 'Orlova']
+CITIES = ['Moscow', 'Kazan', 'Samara', 'Omsk', 'Tver', 'Perm', 'Sochi', 'Tomsk']
+DELIVERY_STATUSES = ['PENDING', 'PACKING', 'SHIPPING', 'ARRIVING', 'SUCCESS']
+PAYMENT_STATUSES = ['PENDING', 'PROCESSING', 'SUCCESSFUL', 'CANCELLED', 'FAILED']
+PAYMENT_WEIGHTS = [5, 3, 85, 4, 3]
+RATING_WEIGHTS = [1, 1, 2, 4, 6]
+
+
+def date_argument(value):
+    return datetime.strptime(value, '%Y-%m-%d').replace(tzinfo=timezone.utc)
+
+
+class ZipfSampler:
+    """
+    Samples indexes 0..n-1 with probability proportional to 1 / (rank + 1) ** skew.
+
+    Cumulative weights are kept in a flat array of doubles, so memory stays
+    O(n) no matter how many samples are drawn.
+    """
+
+    def __init__(self, n, skew, rng):
+        self.rng = rng
+        self.cum_weights = array('d', accumulate(1 / (rank + 1) ** skew for rank in range(n)))
+        self.total = self.cum_weights[-1]
+
+    def sample(self):
+        return bisect(self.cum_weights, self.rng.random() * self.total)
+
+    def sample_distinct(self, k):
+        picked = set()
+        for _ in range(k * 10):
+            if len(picked) >= k:
+                break
+            picked.add(self.sample())
+        return picked
+
+
+class Command(BaseCommand):
+    help = (
+        'Fill the database with a deterministic synthetic marketplace: users, sellers, categories, '
+        'products, reviews, shipping addresses, orders and order items. Rows are streamed into '
+        'Postgres with COPY in batches, so memory stays bounded for millions of rows.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', type=int, default=1, help='Random seed, the same seed gives the same data')
+        parser.add_argument('--users', type=int, default=10_000)
+        parser.add_argument('--sellers', type=int, default=500)
+        parser.add_argument('--categories', type=int, default=50)
+        parser.add_argument('--products', type=int, default=100_000)
+        parser.add_argument('--reviews', type=int, default=200_000)
+        parser.add_argument('--orders', type=int, default=100_000)
+        parser.add_argument('--items-per-order', type=float, default=2.5, help='Mean number of items per order')
+        parser.add_argument('--product-skew', type=float, default=1.1,
+                            help='Zipf exponent of product popularity (orders and reviews)')
+        parser.add_argument('--seller-skew', type=float, default=1.3,
+                            help='Zipf exponent of the number of products per seller')
+        parser.add_argument('--days', type=int, default=365, help='Spread created_at over this many days')
+        parser.add_argument('--until', type=date_argument, default='2026-01-01',
+                            help='created_at values end at midnight (UTC) of this date, YYYY-MM-DD')
+        parser.add_argument('--batch-size', type=int, default=10_000, help='Rows per COPY statement')
+        parser.add_argument('--password', default='password123', help='Password of every generated user')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError('seed_marketplace streams rows with COPY and requires PostgreSQL')
+        if options['sellers'] > options['users']:
+            raise CommandError('--sellers can not be greater than --users')
+        if min(options['users'], options['categories'], options['products']) < 1:
+            raise CommandError('--users, --categories and --products must be positive')
+
+        self.configure(options)
+
+        self.copy(User, [
+            'id', 'created_at', 'updated_at', 'is_deleted', 'deleted_at', 'password', 'last_login',
+            'first_name', 'last_name', 'email', 'avatar', 'image_variants', 'is_staff', 'is_active', 'account_type',
+        ], self.user_rows())
+        self.copy(Seller, [
+            'id', 'created_at', 'updated_at', 'user', 'business_name', 'slug', 'inn_identification_number',
+            'website_url', 'phone_number', 'business_description', 'business_address', 'city', 'postal_code',
+            'bank_name', 'bank_bic_number', 'bank_account_number', 'bank_routing_number', 'is_approved',
+            'product_count', 'rating_sum', 'rating_count', 'units_sold',
+        ], self.seller_rows())
+        self.copy(Category, ['id', 'created_at', 'updated_at', 'name', 'slug', 'image', 'image_variants'], self.category_rows())
+        self.copy(Product, [
+            'id', 'created_at', 'updated_at', 'is_deleted', 'deleted_at', 'seller', 'name', 'slug', 'desc',
+            'price_old', 'price_current', 'category', 'in_stock', 'image1', 'image2', 'image3',
+            'image_variants', 'view_count', 'cart_add_count',
+        ], self.product_rows())
+        self.copy(ShippingAddress, [
+            'id', 'created_at', 'updated_at', 'user', 'full_name', 'email', 'phone', 'address', 'city',
+            'country', 'zipcode',
+        ], self.shipping_address_rows())
+        self.copy(Review, [
+            'id', 'created_at', 'updated_at', 'is_deleted', 'deleted_at', 'user', 'product', 'rating', 'text',
+        ], self.review_rows())
+        self.copy_orders()
+        # The storefront counters are computed once everything they count is written
+        self.stdout.write(f'Storefront counters of {reconcile_storefronts()} sellers')
+
+    # helpers
+
+    def configure(self, options):
+        self.options = options
+        self.seed = options['seed']
+        self.namespace = uuid.uuid5(uuid.NAMESPACE_OID, f'seed_marketplace:{self.seed}')
+        self.until = options['until']
+
+    def rng(self, name):
+        # Separate stream per table: changing one count does not reshuffle the others
+        return random.Random(f'{self.seed}:{name}')
+
+    def uuid(self, kind, index):
+        return uuid.uuid5(self.namespace, f'{kind}:{index}')
+
+    def slug(self, model, text):
+        # Names made unique by the seed and index give unique slugs without the allocator
+        return model._meta.get_field('slug').slugify(text)
+
+    def timestamp(self, rng):
+        return self.until - timedelta(seconds=rng.randrange(self.options['days'] * 86400))
+
+    def copy(self, model, fields, rows):
+        total = 0
+        for batch in batched(rows, self.options['batch_size']):
+            if 'slug' in fields:
+                # Slugs come from the seed, not from the allocator: the counters are
+                # only moved past them, so later saves do not hand them out again
+                position = fields.index('slug')
+                register_slugs(model._meta.get_field('slug').scope, [row[position] for row in batch])
+            total += self.copy_batch(model, fields, batch)
+        self.stdout.write(f'{model._meta.label}: {total} rows')
+
+    def copy_batch(self, model, fields, rows):
+        """Write one batch with a single COPY statement in its own transaction."""
+        opts = model._meta
+        columns = ', '.join(connection.ops.quote_name(opts.get_field(field).column) for field in fields)
+        sql = f'COPY {connection.ops.quote_name(opts.db_table)} ({columns}) FROM STDIN'
+        with transaction.atomic(), connection.cursor() as cursor:
+            # cursor.cursor is the underlying psycopg cursor, Django does not wrap COPY
+            with cursor.cursor.copy(sql) as copy:
+                for row in rows:
+                    copy.write_row(row)
+        return len(rows)
+
+    # row generators
+
+    def user_rows(self):
+        rng = self.rng('users')
+        password = make_password(self.options['password'], salt=f'seed{self.seed}')
+        for i in range(self.options['users']):
+            created_at = self.timestamp(rng)
+            yield (
+                self.uuid('user', i), created_at, created_at, False, None, password, None,
+                FIRST_NAMES[i % len(FIRST_NAMES)], LAST_NAMES[i % len(LAST_NAMES)],
+                f'user{i}.s{self.seed}@example.com', 'avatars/default.jpg', '{}', False, True,
+                'SELLER' if i < self.options['sellers'] else 'BUYER',
+            )
+
+    def seller_rows(self):
+        rng = self.rng('sellers')
+        for i in range(self.options['sellers']):
+            created_at = self.timestamp(rng)
+            name = f'Shop {self.seed}-{i}'
+            yield (
+                self.uuid('seller', i), created_at, created_at, self.uuid('user', i), name, self.slug(Seller, name),
+                f'{i:012d}', None, f'+7900{i:07d}', f'Synthetic seller #{i}', f'Street {i}',
+                CITIES[i % len(CITIES)], f'{i % 1000000:06d}', 'Seed Bank', f'{i % 10 ** 9:09d}',
+                f'{i:020d}', f'{i:09d}', True, 0, 0, 0, 0,
+            )
+
+    def category_rows(self):
+        rng = self.rng('categories')
+        for i in range(self.options['categories']):
+            created_at = self.timestamp(rng)
+            name = f'{CATEGORY_NAMES[i % len(CATEGORY_NAMES)]} {self.seed}-{i}'
+            yield self.uuid('category', i), created_at, created_at, name, self.slug(Category, name), 'category_images/seed.png', '{}'
+
+    def product_rows(self):
+        rng = self.rng('products')
+        sellers = ZipfSampler(self.options['sellers'], self.options['seller_skew'], rng) \
+            if self.options['sellers'] else None
+        for i in range(self.options['products']):
+            created_at = self.timestamp(rng)
+            name = f'{rng.choice(ADJECTIVES)} {rng.choice(NOUNS)}'
+            price = Decimal(rng.randrange(100, 10_000_000)) / 100
+            price_old = price + Decimal(rng.randrange(100, 50_000)) / 100 if rng.random() < 0.3 else None
+            seller = self.uuid('seller', sellers.sample()) if sellers else None
+            yield (
+                self.uuid('product', i), created_at, created_at, False, None, seller, name,
+                self.slug(Product, f'{name} {self.seed}-{i}'), f'{name}. Synthetic product #{i}.', price_old, price,
+                self.uuid('category', rng.randrange(self.options['categories'])), rng.randrange(0, 200),
+                'product_images/seed.png', '', '', '{}', 0, 0,
+            )
+
+    def shipping_address_rows(self):
+        for i in range(self.options['users']):
+            yield (self.uuid('address', i), self.until, self.until, self.uuid('user', i), *self.address(i))
+
+    def address(self, user_index):
+        return (
+            f'{FIRST_NAMES[user_index % len(FIRST_NAMES)]} {LAST_NAMES[user_index % len(LAST_NAMES)]}',
+            f'user{user_index}.s{self.seed}@example.com', f'7900{user_index % 10 ** 7:07d}',
+            f'Street {user_index % 500}, {user_index % 200}', CITIES[user_index % len(CITIES)], 'Russia',
+            f'{user_index % 10 ** 6:06d}',
+        )
+
+    def review_rows(self):
+        rng = self.rng('reviews')
+        products = ZipfSampler(self.options['products'], self.options['product_skew'], rng)
+        per_user, extra = divmod(self.options['reviews'], self.options['users'])
+        index = 0
+        for user in range(self.options['users']):
+            k = min(per_user + (user < extra), self.options['products'])
+            for product in sorted(products.sample_distinct(k)):
+                created_at = self.timestamp(rng)
+                yield (
+                    self.uuid('review', index), created_at, created_at, False, None, self.uuid('user', user),
+                    self.uuid('product', product), rng.choices(range(1, 6), weights=RATING_WEIGHTS)[0], '',
+                )
+                index += 1
+
+    def copy_orders(self):
+        # Orders and their items are generated together, then written table by table
+        # per batch, so an OrderItem batch never references an order that is not stored yet
+        rng = self.rng('orders')
+        products = ZipfSampler(self.options['products'], self.options['product_skew'], rng)
+        max_items = min(self.options['products'], 20)
+        mean_extra = max(self.options['items_per_order'] - 1, 0)
+        order_fields = [
+            'id', 'created_at', 'updated_at', 'user', 'tx_ref', 'delivery_status', 'payment_status',
+            'date_delivered', 'full_name', 'email', 'phone', 'address', 'city', 'country', 'zipcode',
+        ]
+        item_fields = ['id', 'created_at', 'updated_at', 'user', 'order', 'product', 'quantity']
+        item_index = 0
+        orders_total = items_total = 0
+
+        for batch in batched(range(self.options['orders']), self.options['batch_size']):
+            orders, items = [], []
+            for i in batch:
+                user = rng.randrange(self.options['users'])
+                created_at = self.timestamp(rng)
+                delivery_status = rng.choice(DELIVERY_STATUSES)
+                delivered = created_at + timedelta(days=rng.randrange(1, 10)) if delivery_status == 'SUCCESS' else None
+                order_id = self.uuid('order', i)
+                orders.append((
+                    order_id, created_at, created_at, self.uuid('user', user), f'SEED{self.seed}X{i:010d}',
+                    delivery_status, rng.choices(PAYMENT_STATUSES, weights=PAYMENT_WEIGHTS)[0], delivered,
+                    *self.address(user),
+                ))
+                count = 1 + (min(int(rng.expovariate(1 / mean_extra)), max_items - 1) if mean_extra else 0)
+                for product in sorted(products.sample_distinct(count)):
+                    items.append((
+                        self.uuid('orderitem', item_index), created_at, created_at, self.uuid('user', user),
+                        order_id, self.uuid('product', product), rng.choices((1, 2, 3, 4), weights=(70, 20, 7, 3))[0],
+                    ))
+                    item_index += 1
+            orders_total += self.copy_batch(Order, order_fields, orders)
+            items_total += self.copy_batch(OrderItem, item_fields, items)
+
+        self.stdout.write(f'{Order._meta.label}: {orders_total} rows')
+        self.stdout.write(f'{OrderItem._meta.label}: {items_total} rows')
+        seller_orders = backfill_seller_orders(self.options['batch_size'])
+        self.stdout.write(f'{SellerOrder._meta.label}: {seller_orders} rows')
+        seller_stats, product_stats = backfill_rollups()
+        self.stdout.write(f'{SellerDailyStats._meta.label}: {seller_stats} rows')
+        self.stdout.write(f'{ProductDailyStats._meta.label}: {product_stats} rows')
+        self.stdout.write(f'Related products of {update_related_products()} products')
+        self.stdout.write(f'Similar products of {update_similar_products()} products')
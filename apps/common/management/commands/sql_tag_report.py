@@ -0,0 +1,45 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Sum
+from django.utils import timezone
+
+from apps.common.counters import flush_all
+from apps.common.db import STATS_TAGS
+from apps.common.models import SqlTagStats
+
+
+class Command(BaseCommand):
+    help = (
+        'Rank endpoints by database time, from the statement timings SQLCommenter records per '
+        'endpoint and hour in SqlTagStats (pg_stat_statements ignores the sqlcommenter comments '
+        'when it groups statements, so it can not tell endpoints apart). Timings reach the table '
+        'a few seconds after the requests.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--by', default='controller,action',
+                            help=f'Comma separated tags to group by: {", ".join(STATS_TAGS)}')
+        parser.add_argument('--hours', type=int, default=24, help='Only the last N hours')
+        parser.add_argument('--limit', type=int, default=20)
+
+    def handle(self, *args, **options):
+        keys = options['by'].split(',')
+        unknown = set(keys) - set(STATS_TAGS)
+        if unknown:
+            raise CommandError(f'Unknown tags: {", ".join(sorted(unknown))}')
+        flush_all()
+        since = timezone.now().replace(minute=0, second=0, microsecond=0) - timedelta(hours=options['hours'] - 1)
+        groups = list(
+            SqlTagStats.objects.filter(hour__gte=since).values(*keys)
+            .annotate(statements=Sum('statements'), total_ms=Sum('total_ms')).order_by('-total_ms')
+        )
+
+        total = sum(group['total_ms'] for group in groups) or 1
+        self.stdout.write(f'{" / ".join(keys):<50} {"total ms":>12} {"share":>7} {"stmts":>10} {"mean ms":>9}')
+        for group in groups[:options['limit']]:
+            key = ' / '.join(group[name] or '-' for name in keys)
+            self.stdout.write(
+                f'{key[:50]:<50} {group["total_ms"]:>12.1f} {100 * group["total_ms"] / total:>6.1f}% '
+                f'{group["statements"]:>10} {group["total_ms"] / max(group["statements"], 1):>9.2f}'
+            )
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from apps.shop.related import reset_related_products, update_related_products
+
+
+class Command(BaseCommand):
+    help = (
+        'Count the products ordered together in the orders created since the last run and update the '
+        '"frequently bought together" recommendations. The shop.update_related_products periodic job '
+        'runs the same every hour; --rebuild counts all orders again from scratch.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rebuild', action='store_true', help='Drop the counted pairs first')
+
+    def handle(self, *args, **options):
+        if options['rebuild']:
+            reset_related_products()
+        updated = update_related_products()
+        self.stdout.write(f'Updated the recommendations of {updated} products')
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from apps.shop.similar import reset_similar_products, update_similar_products
+
+
+class Command(BaseCommand):
+    help = (
+        'Recompute the similar products (same category, close name and description) of the products '
+        'changed since the last run. The shop.update_similar_products periodic job runs the same every '
+        '10 minutes; --rebuild recomputes every category.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rebuild', action='store_true', help='Recompute all products')
+
+    def handle(self, *args, **options):
+        if options['rebuild']:
+            reset_similar_products()
+        updated = update_similar_products()
+        self.stdout.write(f'Updated the similar products of {updated} products')
@@ -11,6 +11,14 @@ class GetOrNoneQuerySet(models.QuerySet):
         except self.model.DoesNotExist:
             return None
 
+    def bulk_create(self, objs, *args, **kwargs):
+        # Allocate the slugs of the whole batch at once instead of one query per object
+        from apps.common.fields import allocate_bulk_slugs
+
+        objs = list(objs)
+        allocate_bulk_slugs(self.model, objs, self.db)
+        return super().bulk_create(objs, *args, **kwargs)
+
 class GetOrNoneManager(models.Manager):
     """Adds get_or_none method to objects"""
 
@@ -26,7 +34,8 @@ class IsDeleteQuerySet(GetOrNoneQuerySet):
         if hard_delete:
             return super().delete()
         else:
-            return self.update(is_deleted=True, deleted_at=timezone.now())
+            now = timezone.now()
+            return self.update(is_deleted=True, deleted_at=now, updated_at=now)
 
 
 class IsDeletedManager(GetOrNoneManager):
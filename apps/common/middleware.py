@@ -0,0 +1,326 @@
+import json
+import linecache
+import os
+import random
+import re
+import threading
+import time
+import tracemalloc
+import uuid
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.utils import timezone
+from rest_framework.exceptions import APIException, AuthenticationFailed
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+
+from apps.common import profiling
+from apps.common.db import QueryBudgetTracker, SQLCommenter, SlowQueryLogger, query_tags
+
+
+REQUEST_ID = re.compile(r'^[\w.-]{1,64}$')
+SECRET_KEYS = re.compile(r'(^|_)(password|token|secret|refresh|access|authorization|bank|inn|card|cvv)', re.IGNORECASE)
+SCRUBBED = '***'
+
+
+def scrub(data):
+    """Replace values of secret-looking keys in nested dicts/lists."""
+    if isinstance(data, dict):
+        return {key: SCRUBBED if SECRET_KEYS.search(str(key)) else scrub(value) for key, value in data.items()}
+    if isinstance(data, list):
+        return [scrub(value) for value in data]
+    return data
+
+
+def shape(data):
+    """Describe a parsed body by its keys and value types, without the values."""
+    if isinstance(data, dict):
+        return {key: shape(value) for key, value in data.items()}
+    if isinstance(data, list):
+        return [shape(data[0])] if data else []
+    return type(data).__name__
+
+
+def request_role(user):
+    if user is None or not user.is_authenticated:
+        return 'anon'
+    if user.is_staff:
+        return 'staff'
+    return user.account_type.lower()
+
+
+class TrafficCaptureMiddleware:
+    """
+    Samples real requests into a JSONL file for later replay.
+
+    Each line holds the method, path, resolved route, query, body shape, auth role,
+    status and timing of one request. Values of secret-looking keys are scrubbed and
+    bodies are only stored as a shape unless TRAFFIC_CAPTURE['INCLUDE_BODY'] is set.
+    The middleware removes itself when capturing is disabled.
+    """
+
+    lock = threading.Lock()
+
+    def __init__(self, get_response):
+        config = settings.TRAFFIC_CAPTURE
+        if not config['ENABLED']:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.sample_rate = config['SAMPLE_RATE']
+        self.include_body = config['INCLUDE_BODY']
+        self.path = config['PATH']
+        self.file = None
+
+    def __call__(self, request):
+        if random.random() >= self.sample_rate:
+            return self.get_response(request)
+
+        body = self.parse_body(request)
+        started = time.perf_counter()
+        response = self.get_response(request)
+        duration = (time.perf_counter() - started) * 1000
+
+        match = request.resolver_match
+        record = {
+            'ts': timezone.now().isoformat(),
+            'method': request.method,
+            'path': request.path,
+            'route': match.route if match else None,
+            'query': scrub({key: request.GET.getlist(key) for key in request.GET}),
+            'content_type': request.content_type,
+            'body_shape': shape(body) if body is not None else None,
+            'role': request_role(getattr(request, 'user', None)),
+            'status': response.status_code,
+            'duration_ms': round(duration, 3),
+        }
+        if self.include_body and body is not None:
+            record['body'] = scrub(body)
+        self.write(record)
+        return response
+
+    def parse_body(self, request):
+        # Multipart bodies are not read here, that would buffer uploads in the middleware
+        if request.method in ('GET', 'HEAD', 'OPTIONS'):
+            return None
+        if request.content_type == 'application/json':
+            try:
+                return json.loads(request.body or b'null')
+            except ValueError:
+                return None
+        if request.content_type == 'application/x-www-form-urlencoded':
+            return {key: request.POST.get(key) for key in request.POST}
+        return None
+
+    def write(self, record):
+        line = json.dumps(record, ensure_ascii=False, default=str) + '\n'
+        with self.lock:
+            if self.file is None:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                self.file = open(self.path, 'a', buffering=1, encoding='utf-8')
+            self.file.write(line)
+
+
+class ProfilingMiddleware:
+    """
+    Profiles a single request on demand, for staff users only.
+
+    A request asks for profiling with the `X-Profile: 1` header or the `_profile`
+    query parameter. It then runs under StackSampler and tracemalloc, and three
+    artifacts are written to PROFILING['DIR']: `<id>.collapsed` (flamegraph input),
+    `<id>.alloc.txt` (top allocation sites) and `<id>.json` (summary). The id is
+    returned in the `X-Profile-Id` response header. Requests without the flag only
+    pay for a header and query lookup. At most one profile runs per process at a
+    time, and at most one per PROFILING['MIN_INTERVAL'] seconds per cache.
+    """
+
+    lock = threading.Lock()
+
+    def __init__(self, get_response):
+        config = settings.PROFILING
+        if not config['ENABLED']:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.directory = config['DIR']
+        self.interval = config['SAMPLE_INTERVAL']
+        self.min_interval = config['MIN_INTERVAL']
+        self.top_allocations = config['TOP_ALLOCATIONS']
+
+    def __call__(self, request):
+        if not (request.META.get('HTTP_X_PROFILE') or '_profile' in request.GET):
+            return self.get_response(request)
+        if not self.is_staff(request) or not self.acquire():
+            return self.get_response(request)
+        try:
+            return self.profile(request)
+        finally:
+            self.lock.release()
+
+    def is_staff(self, request):
+        user = getattr(request, 'user', None)
+        if user is not None and user.is_authenticated:
+            return user.is_staff
+        # JWT authentication normally happens in the DRF view, after the middleware
+        try:
+            result = JWTAuthentication().authenticate(request)
+        except (AuthenticationFailed, InvalidToken):
+            return False
+        return bool(result and result[0].is_staff)
+
+    def acquire(self):
+        if not self.lock.acquire(blocking=False):
+            return False
+        if not cache.add('profiling:last-run', True, timeout=self.min_interval):
+            self.lock.release()
+            return False
+        return True
+
+    def profile(self, request):
+        profile_id = f'{timezone.now():%Y%m%d-%H%M%S}-{uuid.uuid4().hex[:8]}'
+        tracemalloc.start(settings.PROFILING['TRACEMALLOC_FRAMES'])
+        started = time.perf_counter()
+        try:
+            with profiling.StackSampler(threading.get_ident(), self.interval) as sampler:
+                response = self.get_response(request)
+            duration = (time.perf_counter() - started) * 1000
+            snapshot = tracemalloc.take_snapshot()
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        allocations = snapshot.filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, linecache.__file__),
+            tracemalloc.Filter(False, profiling.__file__),
+        ]).statistics('lineno')[:self.top_allocations]
+        os.makedirs(self.directory, exist_ok=True)
+        base = os.path.join(self.directory, profile_id)
+        with open(f'{base}.collapsed', 'w') as f:
+            f.write(sampler.collapsed())
+        with open(f'{base}.alloc.txt', 'w') as f:
+            f.writelines(f'{stat}\n' for stat in allocations)
+        with open(f'{base}.json', 'w') as f:
+            json.dump({
+                'id': profile_id,
+                'method': request.method,
+                'path': request.get_full_path(),
+                'status': response.status_code,
+                'duration_ms': round(duration, 3),
+                'samples': sampler.samples,
+                'sample_interval_ms': self.interval * 1000,
+                'alloc_peak_kb': round(peak / 1024, 1),
+                'top_allocations': [
+                    {'site': str(stat.traceback), 'size_kb': round(stat.size / 1024, 1), 'count': stat.count}
+                    for stat in allocations
+                ],
+            }, f, indent=2)
+
+        response['X-Profile-Id'] = profile_id
+        return response
+
+
+class SlowQueryLogMiddleware:
+    """Installs SlowQueryLogger on every database connection for the duration of a request."""
+
+    def __init__(self, get_response):
+        if not settings.SLOW_QUERY_LOG['ENABLED']:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(SlowQueryLogger(connection.alias, request)))
+            return self.get_response(request)
+
+
+class QueryTagMiddleware:
+    """
+    Tags every SQL statement of a request with the DRF view class and method, the URL
+    route, the API version and a request id (see SQLCommenter).
+
+    The request id is taken from a valid X-Request-ID header or generated, exposed
+    as `request.request_id` and returned in the X-Request-ID response header.
+    """
+
+    def __init__(self, get_response):
+        config = settings.SQL_COMMENTER
+        if not config['ENABLED']:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.tags = config['TAGS']
+
+    def __call__(self, request):
+        request_id = request.META.get('HTTP_X_REQUEST_ID', '')
+        if not REQUEST_ID.match(request_id):
+            request_id = uuid.uuid4().hex
+        request.request_id = request_id
+        token = query_tags.set({'request_id': request_id})
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(SQLCommenter(self.tags)))
+                response = self.get_response(request)
+        finally:
+            query_tags.reset(token)
+        response['X-Request-ID'] = request_id
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        tags = query_tags.get()
+        if tags is None:
+            return None
+        view_class = getattr(view_func, 'view_class', None)
+        tags['controller'] = view_class.__name__ if view_class else view_func.__name__
+        tags['action'] = request.method.lower()
+        tags['route'] = request.resolver_match.route
+        versioning_class = getattr(view_class, 'versioning_class', api_settings.DEFAULT_VERSIONING_CLASS)
+        if versioning_class is not None:
+            try:
+                tags['api_version'] = versioning_class().determine_version(Request(request), *view_args, **view_kwargs)
+            except APIException:
+                # Invalid versions are reported by the view itself, the tag is just left out
+                pass
+        return None
+
+
+class QueryBudgetMiddleware:
+    """
+    Enforces the `query_budget` declared on a view class (see QueryBudget).
+
+    Queries are only counted and timed for views that declare a budget. Queries of
+    streaming responses run after the middleware returns and are not covered.
+    """
+
+    def __init__(self, get_response):
+        if not settings.QUERY_BUDGETS['ENABLED']:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        tracker = request.query_budget_tracker = QueryBudgetTracker(request)
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(tracker))
+            try:
+                response = self.get_response(request)
+            except BaseException:
+                # The error of the view is the one to report, a violation is only logged
+                tracker.finish(raise_exceeded=False)
+                raise
+            tracker.finish()
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        view_class = getattr(view_func, 'view_class', None)
+        budget = getattr(view_class, 'query_budget', None)
+        if budget is None:
+            return None
+        # The last view middleware: the view runs here when it asks for a statement_timeout
+        return request.query_budget_tracker.run_view(view_class.__name__, budget, view_func, request,
+                                                     view_args, view_kwargs)
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.8 on 2026-10-19 08:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SlugCounter',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('scope', models.CharField(max_length=100)),
+                ('base', models.CharField(max_length=255)),
+                ('value', models.PositiveBigIntegerField(default=0)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('scope', 'base'), name='slug_counter_scope_base_unique')],
+            },
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.8 on 2026-10-19 08:34
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('common', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Job',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('name', models.CharField(max_length=200)),
+                ('kwargs', models.JSONField(blank=True, default=dict)),
+                ('queue', models.CharField(default='default', max_length=50)),
+                ('status', models.CharField(choices=[('QUEUED', 'В ОЧЕРЕДИ'), ('RUNNING', 'ВЫПОЛНЯЕТСЯ'), ('SUCCEEDED', 'УСПЕШНО'), ('FAILED', 'ОШИБКА')], default='QUEUED', max_length=20)),
+                ('run_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('max_attempts', models.PositiveIntegerField(default=5)),
+                ('idempotency_key', models.CharField(blank=True, max_length=255, null=True, unique=True)),
+                ('locked_by', models.CharField(blank=True, max_length=100)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('last_error', models.TextField(blank=True)),
+            ],
+            options={
+                'indexes': [models.Index(condition=models.Q(('status', 'QUEUED')), fields=['queue', 'run_at'], name='job_queued_idx'), models.Index(fields=['status', 'finished_at'], name='job_status_finished_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.8 on 2026-10-19 09:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('common', '0005_job_heartbeat_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SqlTagStats',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('hour', models.DateTimeField()),
+                ('controller', models.CharField(blank=True, max_length=100)),
+                ('action', models.CharField(blank=True, max_length=10)),
+                ('route', models.CharField(blank=True, max_length=255)),
+                ('api_version', models.CharField(blank=True, max_length=20)),
+                ('statements', models.BigIntegerField(default=0)),
+                ('total_ms', models.FloatField(default=0)),
+            ],
+            options={
+                'verbose_name_plural': 'SQL tag stats',
+                'constraints': [models.UniqueConstraint(fields=('hour', 'controller', 'action', 'route', 'api_version'), name='sql_tag_stats_unique')],
+            },
+        ),
+    ]
@@ -39,7 +39,162 @@ class IsDeletedModel(BaseModel):
         # Мягкое удаление is_deleted=True
         self.is_deleted = True
         self.deleted_at = timezone.now()
-        self.save(update_fields=['is_deleted', 'deleted_at'])
+        self.save(update_fields=['is_deleted', 'deleted_at', 'updated_at'])
 
     def hard_delete(self, *args, **kwargs):
         super().delete(*args, **kwargs)
+
+
+class SlugCounter(models.Model):
+    """
+    Number of slugs allocated for a base slug, see apps.common.fields.allocate_slugs.
+
+    Attributes:
+        scope (str): Model and field the slug belongs to, e.g. "shop.product.slug".
+        base (str): The base slug.
+        value (int): Index of the last allocated slug, "base" is 1, "base--2" is 2.
+    """
+
+    id = models.BigAutoField(primary_key=True)
+    scope = models.CharField(max_length=100)
+    base = models.CharField(max_length=255)
+    value = models.PositiveBigIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['scope', 'base'], name='slug_counter_scope_base_unique'),
+        ]
+
+    def __str__(self):
+        return f'{self.scope}: {self.base} ({self.value})'
+
+
+class Checkpoint(models.Model):
+    """
+    Progress of an incremental job that processes rows in time order.
+
+    Attributes:
+        name (str): The job, e.g. "shop.related_products".
+        position (datetime): Rows created before it are processed.
+    """
+
+    id = models.BigAutoField(primary_key=True)
+    name = models.CharField(max_length=100, unique=True)
+    position = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f'{self.name}: {self.position}'
+
+
+JOB_STATUS_CHOICES = (
+    ("QUEUED", "В ОЧЕРЕДИ"),
+    ("RUNNING", "ВЫПОЛНЯЕТСЯ"),
+    ("SUCCEEDED", "УСПЕШНО"),
+    ("FAILED", "ОШИБКА"),
+)
+
+
+class Job(models.Model):
+    """
+    A background job, see apps.common.jobs.
+
+    Attributes:
+        name (str): Name of the registered job function.
+        kwargs (JSONField): Keyword arguments of the call.
+        queue (str): Queue the job belongs to.
+        status (str): QUEUED, RUNNING, SUCCEEDED or FAILED (no attempts left).
+        run_at (datetime): Not run before this time, also used for retry backoff.
+        attempts (int): Number of started attempts.
+        max_attempts (int): Attempts before the job is marked FAILED.
+        idempotency_key (str): Optional key, a job with the same key is enqueued only once (again once it FAILED).
+        locked_by (str): Worker running the job.
+        started_at (datetime): Start of the last attempt.
+        heartbeat_at (datetime): Last sign of life of the worker running the job.
+        finished_at (datetime): When the job succeeded or failed for good.
+        last_error (str): Traceback of the last failed attempt.
+    """
+
+    id = models.BigAutoField(primary_key=True)
+    name = models.CharField(max_length=200)
+    kwargs = models.JSONField(default=dict, blank=True)
+    queue = models.CharField(max_length=50, default='default')
+    status = models.CharField(max_length=20, default='QUEUED', choices=JOB_STATUS_CHOICES)
+    run_at = models.DateTimeField(default=timezone.now)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    idempotency_key = models.CharField(max_length=255, null=True, blank=True, unique=True)
+    locked_by = models.CharField(max_length=100, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+
+    class Meta:
+        indexes = [
+            # Only waiting jobs are scanned by the workers, the partial index stays small
+            models.Index(fields=['queue', 'run_at'], condition=models.Q(status='QUEUED'), name='job_queued_idx'),
+            models.Index(fields=['status', 'finished_at'], name='job_status_finished_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.name} #{self.id} ({self.status})'
+
+
+class MediaBlob(models.Model):
+    """
+    A file of the content addressed media storage, see apps.common.storage.
+
+    Attributes:
+        name (str): Storage name, derived from the SHA-256 of the content.
+        size (int): Size in bytes.
+        refcount (int): Rows referencing the file at the last collect_media run.
+        created_at (datetime): First upload.
+        last_used_at (datetime): Last upload of the same content.
+    """
+
+    id = models.BigAutoField(primary_key=True)
+    name = models.CharField(max_length=255, unique=True)
+    size = models.BigIntegerField()
+    refcount = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_used_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f'{self.name} ({self.refcount})'
+
+
+class SqlTagStats(models.Model):
+    """
+    Database time of the statements of one endpoint during one hour, written by
+    SQLCommenter from its own timings (see apps.common.db), read by sql_tag_report.
+
+    Attributes:
+        hour (datetime): Start of the hour.
+        controller (str): The DRF view class, empty for statements run before the view is known.
+        action (str): The HTTP method.
+        route (str): The URL route.
+        api_version (str): The API version, empty when not versioned.
+        statements (int): Number of statements.
+        total_ms (float): Their total execution time, in milliseconds.
+    """
+
+    id = models.BigAutoField(primary_key=True)
+    hour = models.DateTimeField()
+    controller = models.CharField(max_length=100, blank=True)
+    action = models.CharField(max_length=10, blank=True)
+    route = models.CharField(max_length=255, blank=True)
+    api_version = models.CharField(max_length=20, blank=True)
+    statements = models.BigIntegerField(default=0)
+    total_ms = models.FloatField(default=0)
+
+    class Meta:
+        verbose_name_plural = 'SQL tag stats'
+        constraints = [
+            models.UniqueConstraint(fields=['hour', 'controller', 'action', 'route', 'api_version'],
+                                    name='sql_tag_stats_unique'),
+        ]
+
+    def __str__(self):
+        return f'{self.hour:%Y-%m-%d %H}h {self.controller} {self.action}: {self.total_ms:.1f} ms'
@@ -1,4 +1,4 @@
-from rest_framework.pagination import PageNumberPagination
+from rest_framework.pagination import CursorPagination, PageNumberPagination
 from rest_framework.response import Response
 
 
@@ -16,3 +16,14 @@ class CustomPagination(PageNumberPagination):
             'previous': self.get_previous_link(),
             'results': data,
         })
+
+
+class CreatedAtCursorPagination(CursorPagination):
+    """
+    Keyset pagination on -created_at: a page is an index range scan whatever its
+    depth, and no COUNT(*) is run. The next/previous links carry the cursor.
+    """
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    ordering = '-created_at'
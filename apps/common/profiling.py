@@ -0,0 +1,48 @@
+import sys
+import threading
+from collections import Counter
+
+
+class StackSampler:
+    """
+    Sampling profiler for a single thread.
+
+    A background thread reads the target thread's current frame every `interval`
+    seconds and counts the stacks it sees. The result is written in the collapsed
+    stack format ("root;child;leaf count" per line) understood by flamegraph.pl,
+    speedscope and similar tools.
+    """
+
+    def __init__(self, thread_id, interval=0.005):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='stack-sampler', daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stopped.set()
+        self._thread.join()
+
+    @property
+    def samples(self):
+        return sum(self.stacks.values())
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f'{code.co_name} ({code.co_filename}:{frame.f_lineno})')
+                frame = frame.f_back
+            self.stacks[';'.join(reversed(stack))] += 1
+
+    def collapsed(self):
+        return ''.join(f'{stack} {count}\n' for stack, count in self.stacks.most_common())
@@ -0,0 +1,82 @@
+import json
+import mimetypes
+import os
+from itertools import islice
+from urllib.parse import quote
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from rest_framework.utils.encoders import JSONEncoder
+
+
+def iter_json_list(queryset, serializer_class, chunk_size, buffer_size=64 * 1024):
+    """
+    Serialize a queryset into a JSON array piece by piece.
+
+    Rows are read with a server-side cursor (`.iterator(chunk_size=...)`), serialized
+    one chunk at a time and yielded as byte strings of about `buffer_size`, so memory
+    does not depend on the number of rows.
+    """
+
+    rows = queryset.iterator(chunk_size=chunk_size)
+    buffer = [b'[']
+    size = 1
+    separator = b''
+    while chunk := list(islice(rows, chunk_size)):
+        for item in serializer_class(chunk, many=True).data:
+            part = separator + json.dumps(item, cls=JSONEncoder, ensure_ascii=False, separators=(',', ':')).encode()
+            separator = b','
+            buffer.append(part)
+            size += len(part)
+            if size >= buffer_size:
+                yield b''.join(buffer)
+                buffer, size = [], 0
+    buffer.append(b']')
+    yield b''.join(buffer)
+
+
+async def aiter_sync(iterator):
+    """Consume a sync iterator from async code, one item per call in the main sync thread."""
+    # thread_sensitive keeps every step on the same thread, and so on the same DB connection
+    next_item = sync_to_async(next, thread_sensitive=True)
+    while (item := await next_item(iterator, None)) is not None:
+        yield item
+
+
+def is_async_request(request):
+    return isinstance(getattr(request, '_request', request), ASGIRequest)
+
+
+def stream_json_list(request, queryset, serializer_class, chunk_size=500):
+    """
+    Return a StreamingHttpResponse with `queryset` serialized as a JSON array.
+
+    Under ASGI the rows are fed through an async iterator. Otherwise Django would
+    collect the whole sync iterator into memory before sending it.
+    """
+
+    content = iter_json_list(queryset, serializer_class, chunk_size)
+    if is_async_request(request):
+        content = aiter_sync(content)
+    return StreamingHttpResponse(content, content_type='application/json')
+
+
+def private_file_response(file, filename=None):
+    """
+    Download response for a file of the private storage, access must be checked by the view.
+
+    With PRIVATE_MEDIA_ACCEL_PREFIX set nginx sends the file from its internal
+    location (X-Accel-Redirect), otherwise it is streamed by Django.
+    """
+
+    filename = filename or os.path.basename(file.name)
+    if settings.PRIVATE_MEDIA_ACCEL_PREFIX:
+        response = HttpResponse(content_type=mimetypes.guess_type(filename)[0] or 'application/octet-stream')
+        response['X-Accel-Redirect'] = settings.PRIVATE_MEDIA_ACCEL_PREFIX.rstrip('/') + '/' + quote(file.name)
+        response['Content-Disposition'] = f"attachment; filename*=UTF-8''{quote(filename)}"
+    else:
+        response = FileResponse(file.open('rb'), as_attachment=True, filename=filename)
+    response['Cache-Control'] = 'private, no-store'
+    return response
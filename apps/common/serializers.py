@@ -0,0 +1,41 @@
+from drf_spectacular.utils import extend_schema_field
+from rest_framework import serializers
+
+
+@extend_schema_field({
+    'type': 'object',
+    'nullable': True,
+    'description': 'URL вариантов изображения по размерам (thumb, card, full) и форматам (webp, jpeg), '
+                   'null пока варианты не готовы',
+    'additionalProperties': {'type': 'object', 'additionalProperties': {'type': 'string', 'format': 'uri'}},
+})
+class ImageVariantsField(serializers.Field):
+    """
+    Read-only URLs of the variants of a VariantImageField:
+    {"thumb": {"webp": url, "jpeg": url}, "card": {...}, "full": {...}}.
+
+    `source` is the object holding the image, "*" (default) for the serialized
+    object itself, e.g. ImageVariantsField('avatar', source='user').
+    """
+
+    def __init__(self, image_field, **kwargs):
+        self.image_field = image_field
+        kwargs.setdefault('source', '*')
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, instance):
+        field = instance._meta.get_field(self.image_field)
+        variants = (getattr(instance, field.variants_field) or {}).get(self.image_field)
+        if not variants or variants['source'] != getattr(instance, field.attname).name:
+            return None
+        request = self.context.get('request')
+        urls = {}
+        for variant, names in variants.items():
+            if variant == 'source':
+                continue
+            urls[variant] = {}
+            for file_format, name in names.items():
+                url = field.storage.url(name)
+                urls[variant][file_format] = request.build_absolute_uri(url) if request is not None else url
+        return urls
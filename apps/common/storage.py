@@ -0,0 +1,189 @@
+import hashlib
+import os
+import posixpath
+import tempfile
+
+from django.apps import apps
+from django.core.files.move import file_move_safe
+from django.core.files.storage import FileSystemStorage, storages
+from django.db import transaction
+from django.db.models import Count, FileField
+from django.utils import timezone
+from django.utils.deconstruct import deconstructible
+from django.utils.functional import cached_property
+
+
+PREFIX = 'cas'
+CHUNK_SIZE = 64 * 1024
+
+
+def blob_name(digest, extension):
+    """cas/ab/cd/abcd...<64 hex>.jpg"""
+    return posixpath.join(PREFIX, digest[:2], digest[2:4], f'{digest}{extension.lower()}')
+
+
+def is_blob(name):
+    return bool(name) and name.startswith(f'{PREFIX}/')
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    File system storage naming files by the SHA-256 of their content.
+
+    The directory and name given by upload_to are ignored, only the extension is
+    kept, so the same image uploaded for several products or slots is stored
+    once. Uploads are hashed while they are streamed to a temporary file in
+    chunks (uploads already on disk are hashed in place and moved) and every
+    distinct file gets a MediaBlob row, which the collect_media job uses to
+    delete the blobs no longer referenced by any file field.
+
+    A name always refers to the same content, so URLs can be cached forever.
+    delete() ignores blobs, they may be shared and only collect_media removes them.
+    Files derived from a blob (image variants) are written through `derived`,
+    a plain storage on the same directory.
+    """
+
+    def get_available_name(self, name, max_length=None):
+        # The final name is only known once the content is hashed, in _save()
+        return name
+
+    def _save(self, name, content):
+        extension = os.path.splitext(name)[1]
+        digest = hashlib.sha256()
+        size = 0
+        if hasattr(content, 'temporary_file_path'):
+            for chunk in content.chunks(CHUNK_SIZE):
+                digest.update(chunk)
+                size += len(chunk)
+            source, temporary = content.temporary_file_path(), False
+        else:
+            os.makedirs(self.location, exist_ok=True)
+            fd, source = tempfile.mkstemp(dir=self.location, prefix='.upload-')
+            temporary = True
+            with os.fdopen(fd, 'wb') as f:
+                for chunk in content.chunks(CHUNK_SIZE):
+                    if isinstance(chunk, str):
+                        chunk = chunk.encode()
+                    digest.update(chunk)
+                    f.write(chunk)
+                    size += len(chunk)
+
+        name = blob_name(digest.hexdigest(), extension)
+        full_path = self.path(name)
+        with transaction.atomic():
+            # The blob row stays locked until the commit, so collect_blobs can not delete
+            # the file between the check below and the row referencing it
+            register_blob(name, size)
+            moved = not os.path.exists(full_path)
+            if moved:
+                os.makedirs(os.path.dirname(full_path), exist_ok=True)
+                # Same content under the same name, a concurrent upload of it may win the race
+                file_move_safe(source, full_path, allow_overwrite=True)
+                if self.file_permissions_mode is not None:
+                    os.chmod(full_path, self.file_permissions_mode)
+        if temporary and not moved:
+            os.remove(source)
+        return name
+
+    def delete(self, name):
+        if not is_blob(name):
+            super().delete(name)
+
+    def delete_blob(self, name):
+        super().delete(name)
+
+    @cached_property
+    def derived(self):
+        return FileSystemStorage(
+            location=self.base_location, base_url=self.base_url,
+            file_permissions_mode=self.file_permissions_mode,
+            directory_permissions_mode=self.directory_permissions_mode,
+        )
+
+
+def private_storage():
+    """Storage of the files that must not be served publicly, downloaded through views checking access."""
+    return storages['private']
+
+
+def register_blob(name, size):
+    from apps.common.models import MediaBlob
+
+    # last_used_at protects a blob reused by a new upload from a concurrent collect_media run,
+    # the UPDATE (or INSERT) locks the row for the rest of the caller's transaction
+    now = timezone.now()
+    if not MediaBlob.objects.filter(name=name).update(last_used_at=now):
+        MediaBlob.objects.bulk_create([MediaBlob(name=name, size=size, last_used_at=now)], ignore_conflicts=True)
+
+
+def referencing_fields():
+    """(model, field) pairs of the file fields stored in a ContentAddressedStorage."""
+    return [
+        (model, field) for model in apps.get_models() for field in model._meta.concrete_fields
+        if isinstance(field, FileField) and isinstance(field.storage, ContentAddressedStorage)
+    ]
+
+
+def count_references():
+    """Number of rows referencing every blob, across all file fields."""
+
+    counts = {}
+    for model, field in referencing_fields():
+        rows = (model._base_manager.filter(**{f'{field.attname}__startswith': f'{PREFIX}/'})
+                .values_list(field.attname).annotate(n=Count('pk')).order_by())
+        for name, n in rows.iterator():
+            counts[name] = counts.get(name, 0) + n
+    return counts
+
+
+def collect_blobs(storage, grace):
+    """
+    Recount the references of every MediaBlob and delete the unreferenced ones
+    not used for `grace` (a timedelta), with their derived files. Returns the
+    number of deleted blobs.
+
+    The grace period covers files uploaded by a transaction that has not
+    committed yet, and rows written bypassing save() (bulk_create, COPY) are
+    counted like any other.
+    """
+
+    from apps.common.models import MediaBlob
+
+    counts = count_references()
+    changed = []
+    for blob in MediaBlob.objects.only('id', 'name', 'refcount').iterator(chunk_size=2000):
+        refcount = counts.get(blob.name, 0)
+        if blob.refcount != refcount:
+            blob.refcount = refcount
+            changed.append(blob)
+    MediaBlob.objects.bulk_update(changed, ['refcount'], batch_size=1000)
+
+    deleted = 0
+    cutoff = timezone.now() - grace
+    candidates = list(MediaBlob.objects.filter(refcount=0, last_used_at__lt=cutoff).values_list('id', flat=True))
+    for blob_id in candidates:
+        with transaction.atomic():
+            # Locked and checked again: an upload of the same content waits in register_blob
+            # until the file is gone, then writes it again
+            blob = MediaBlob.objects.select_for_update().filter(
+                id=blob_id, refcount=0, last_used_at__lt=cutoff).first()
+            if blob is None:
+                continue
+            storage.delete_blob(blob.name)
+            delete_derived(storage.derived, blob.name)
+            blob.delete()
+            deleted += 1
+    return deleted
+
+
+def delete_derived(storage, name):
+    from apps.common.images import variants_dir
+
+    directory = variants_dir(name)
+    if not storage.exists(directory):
+        return
+    _, files = storage.listdir(directory)
+    for file in files:
+        storage.delete(posixpath.join(directory, file))
+    os.rmdir(storage.path(directory))
@@ -0,0 +1,49 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.utils import timezone
+
+from apps.common.images import update_variants
+from apps.common.jobs import job
+from apps.common.models import Job, SqlTagStats
+from apps.common.storage import ContentAddressedStorage, collect_blobs
+
+
+@job(max_attempts=3)
+def flush_expired_tokens():
+    """Delete expired outstanding and blacklisted JWT refresh tokens."""
+    call_command('flushexpiredtokens')
+
+
+@job(max_attempts=3)
+def purge_jobs():
+    """
+    Delete succeeded jobs older than JOBS['RETENTION_DAYS'] and failed ones, kept
+    longer for inspection, older than JOBS['FAILED_RETENTION_DAYS'].
+    """
+    now = timezone.now()
+    for status, days in (('SUCCEEDED', settings.JOBS['RETENTION_DAYS']),
+                         ('FAILED', settings.JOBS['FAILED_RETENTION_DAYS'])):
+        Job.objects.filter(status=status, finished_at__lt=now - timedelta(days=days)).delete()
+
+
+@job(max_attempts=3)
+def purge_sql_tag_stats():
+    """Delete the SqlTagStats hours older than SQL_COMMENTER['RETENTION_DAYS']."""
+    cutoff = timezone.now() - timedelta(days=settings.SQL_COMMENTER['RETENTION_DAYS'])
+    SqlTagStats.objects.filter(hour__lt=cutoff).delete()
+
+
+@job(queue='images', max_attempts=3, backoff=30)
+def generate_image_variants(model, pks):
+    """Generate the resized variants of the VariantImageFields of `model` rows, see apps.common.images."""
+    update_variants(model, pks)
+
+
+@job(max_attempts=3)
+def collect_media():
+    """Delete the media blobs no longer referenced by any file field, see apps.common.storage."""
+    if isinstance(default_storage, ContentAddressedStorage):
+        collect_blobs(default_storage, timedelta(hours=settings.MEDIA_GC_GRACE_HOURS))
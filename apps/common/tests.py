@@ -1,3 +1,526 @@
-from django.test import TestCase
+import io
+import json
+import os
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from autoslug.settings import slugify
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.cache import cache
+from django.core.management.base import CommandError
+from django.db import connection
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from PIL import Image
+from rest_framework.test import APIClient
+
+from apps.common.fields import allocate_slugs, register_slugs, split_slug
+from apps.common.jobs import Cron, claim, enqueue, execute, job, requeue_stale
+from apps.common.management.commands.bench import Command as BenchCommand
+from apps.common.management.commands.replay_traffic import placeholder_body
+from apps.common.management.commands.seed_marketplace import Command as SeedMarketplaceCommand
+from apps.accounts.models import User
+from apps.common.counters import WriteBehindBuffer, buffers
+from apps.common.db import (QueryBudget, QueryBudgetExceeded, QueryBudgetTracker, SQLCommenter, SlowQueryLogger,
+                             budget_violations, query_tags, slow_queries, sql_fingerprint, tag_stats)
+from apps.common.models import Job, MediaBlob, SqlTagStats
+from apps.common.middleware import ProfilingMiddleware, TrafficCaptureMiddleware, scrub, shape
+from apps.common.images import generate_variants
+from apps.common.responses import iter_json_list
+from apps.common.storage import collect_blobs
+from apps.common.tasks import purge_jobs
+from apps.common.utils import percentile
+from apps.shop.models import Category
+from apps.shop.serializers import CategorySerializer
+from apps.shop.views import CategoriesView
+
+
+
+def discard_buffers():
+    """Drop the write-behind increments of the test requests, they would be flushed after the test database is gone."""
+    for buffer in buffers.values():
+        buffer.take()
+
+
+
+def use_temporary_media(test):
+    """Point the public and private storages and the upload staging of a test at a temporary directory removed after it."""
+    directory = tempfile.TemporaryDirectory()
+    test.addCleanup(directory.cleanup)
+    storages = {**settings.STORAGES, 'private': {
+        **settings.STORAGES['private'],
+        'OPTIONS': {**settings.STORAGES['private']['OPTIONS'], 'location': os.path.join(directory.name, 'private')},
+    }}
+    uploads = {**settings.IMAGE_UPLOADS, 'STAGING_DIR': os.path.join(directory.name, 'uploads')}
+    override = override_settings(MEDIA_ROOT=os.path.join(directory.name, 'media'), STORAGES=storages,
+                                 IMAGE_UPLOADS=uploads)
+    override.enable()
+    test.addCleanup(override.disable)
+    return directory.name
+
+
+class AllocateSlugsTests(TestCase):
+
+    def test_repeated_bases_get_distinct_suffixes(self):
+        slugs = allocate_slugs('test.slug', ['phone', 'case', 'phone', 'phone'])
+        self.assertEqual(slugs, ['phone', 'case', 'phone--2', 'phone--3'])
+
+    def test_counters_continue_across_calls(self):
+        allocate_slugs('test.slug', ['phone', 'phone'])
+        self.assertEqual(allocate_slugs('test.slug', ['phone', 'case']), ['phone--3', 'case'])
+
+    def test_scopes_are_independent(self):
+        allocate_slugs('test.slug', ['phone'])
+        self.assertEqual(allocate_slugs('other.slug', ['phone']), ['phone'])
+
+    def test_chunks(self):
+        bases = [f'base-{i % 1500}' for i in range(3000)]
+        slugs = allocate_slugs('test.slug', bases)
+        self.assertEqual(len(set(slugs)), len(slugs))
+        self.assertEqual(slugs[1500], 'base-0--2')
+
+    def test_registered_slugs_are_skipped(self):
+        register_slugs('test.slug', ['phone', 'phone--4', 'case--2', None])
+        self.assertEqual(allocate_slugs('test.slug', ['phone', 'case', 'new']), ['phone--5', 'case--3', 'new'])
+
+    def test_split_slug(self):
+        self.assertEqual(split_slug('iphone-case--3'), ('iphone-case', 3))
+        self.assertEqual(split_slug('iphone-case-3'), ('iphone-case-3', 1))
+
+
+class UniqueSlugFieldTests(TestCase):
+
+    def test_slugs_are_allocated_on_save(self):
+        first = Category.objects.create(name='Phones', image='c.png')
+        second = Category.objects.create(name='Phones!', image='c.png')
+        bulk = Category.objects.bulk_create([Category(name='phones', image='c.png'), Category(name='Cases', image='c.png')])
+        self.assertEqual([first.slug, second.slug] + [category.slug for category in bulk],
+                         ['phones', 'phones--2', 'phones--3', 'cases'])
+
+    def test_always_update_only_when_the_source_changes(self):
+        category = Category.objects.create(name='Phones', image='c.png')
+        Category.objects.filter(pk=category.pk).update(slug='phones-2')
+        category = Category.objects.get(pk=category.pk)
+        category.image = 'd.png'
+        category.save()
+        self.assertEqual(category.slug, 'phones-2')
+        category.name = 'Smart phones'
+        category.save()
+        self.assertEqual(category.slug, 'smart-phones')
+
+
+class SeedMarketplaceTests(SimpleTestCase):
+
+    def rows(self, *args):
+        command = SeedMarketplaceCommand()
+        options = vars(command.create_parser('manage.py', 'seed_marketplace').parse_args(
+            ['--users', '20', '--sellers', '5', '--categories', '3', '--products', '50', *args]))
+        command.configure(options)
+        return list(command.seller_rows()), list(command.category_rows()), list(command.product_rows())
+
+    def test_same_seed_gives_the_same_rows(self):
+        self.assertEqual(self.rows('--seed', '3'), self.rows('--seed', '3'))
+        self.assertNotEqual(self.rows('--seed', '3'), self.rows('--seed', '4'))
+
+    def test_slugs_are_unique_and_independent_of_the_database(self):
+        sellers, categories, products = self.rows()
+        for rows, position in ((sellers, 5), (categories, 4), (products, 7)):
+            slugs = [row[position] for row in rows]
+            self.assertEqual(len(set(slugs)), len(slugs))
+        self.assertEqual(products[0][7], slugify(f'{products[0][6]} 1-0'))
+
+    def test_timestamps_end_at_until(self):
+        _, _, products = self.rows('--until', '2025-06-01', '--days', '10')
+        until = datetime(2025, 6, 1, tzinfo=timezone.utc)
+        self.assertTrue(all(until - timedelta(days=10) < row[1] <= until for row in products))
+
+
+class BenchTests(SimpleTestCase):
+
+    def test_percentile(self):
+        self.assertEqual(percentile([10, 20, 30, 40], 50), 25)
+        self.assertEqual(percentile([10, 20, 30, 40], 100), 40)
+        self.assertIsNone(percentile([], 99))
+
+    def compare(self, results, baseline):
+        with tempfile.NamedTemporaryFile('w', suffix='.json') as f:
+            json.dump({'commit': 'abc', 'results': baseline}, f)
+            f.flush()
+            command = BenchCommand(stdout=StringIO())
+            command.compare({'results': results}, f.name, threshold=0.15)
+            return command.stdout.getvalue()
+
+    def test_compare_within_threshold(self):
+        result = {'p50_ms': 11, 'p95_ms': 22, 'queries': 3}
+        self.assertIn('No regressions', self.compare({'products': result},
+                                                    {'products': {'p50_ms': 10, 'p95_ms': 20, 'queries': 3}}))
+
+    def test_compare_reports_slowdowns_and_extra_queries(self):
+        baseline = {'products': {'p50_ms': 10, 'p95_ms': 20, 'queries': 3}}
+        with self.assertRaisesMessage(CommandError, '1 regression(s)'):
+            self.compare({'products': {'p50_ms': 12, 'p95_ms': 20, 'queries': 3}}, baseline)
+        with self.assertRaisesMessage(CommandError, '1 regression(s)'):
+            self.compare({'products': {'p50_ms': 10, 'p95_ms': 20, 'queries': 4}}, baseline)
+
+
+class TrafficCaptureTests(SimpleTestCase):
+
+    def test_scrub_and_shape(self):
+        body = {'email': 'a@b.c', 'password': 'x', 'items': [{'refresh_token': 't', 'quantity': 2}]}
+        self.assertEqual(scrub(body), {'email': 'a@b.c', 'password': '***',
+                                       'items': [{'refresh_token': '***', 'quantity': 2}]})
+        self.assertEqual(shape(body), {'email': 'str', 'password': 'str', 'items': [{'refresh_token': 'str',
+                                                                                     'quantity': 'int'}]})
+        self.assertEqual(placeholder_body(shape(body)), {'email': 'x', 'password': 'x',
+                                                          'items': [{'refresh_token': 'x', 'quantity': 1}]})
+
+    def test_records_scrubbed_requests(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'traffic.jsonl')
+            config = {'ENABLED': True, 'SAMPLE_RATE': 1.0, 'INCLUDE_BODY': True, 'PATH': path}
+            with override_settings(TRAFFIC_CAPTURE=config):
+                middleware = TrafficCaptureMiddleware(lambda request: HttpResponse(status=201))
+            request = RequestFactory().post('/shop/cart/?token=abc', {'slug': 'phone', 'password': 'x'},
+                                            content_type='application/json')
+            middleware(request)
+            middleware.file.close()
+            with open(path) as f:
+                record = json.loads(f.readline())
+        self.assertEqual((record['method'], record['path'], record['status']), ('POST', '/shop/cart/', 201))
+        self.assertEqual(record['query'], {'token': '***'})
+        self.assertEqual(record['body'], {'slug': 'phone', 'password': '***'})
+        self.assertEqual(record['body_shape'], {'slug': 'str', 'password': 'str'})
+
+
+class ProfilingTests(TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        config = {**settings.PROFILING, 'ENABLED': True, 'DIR': directory.name}
+        override = override_settings(PROFILING=config)
+        override.enable()
+        self.addCleanup(override.disable)
+        cache.delete('profiling:last-run')
+        self.directory = directory.name
+        self.middleware = ProfilingMiddleware(lambda request: HttpResponse('ok'))
+
+    def request(self, is_staff):
+        request = RequestFactory().get('/shop/products/?_profile=1')
+        request.user = User.objects.get_or_create(email=f'{is_staff}@example.com',
+                                                  defaults={'first_name': 'A', 'last_name': 'A', 'is_staff': is_staff})[0]
+        return self.middleware(request)
+
+    def test_staff_request_is_profiled_once_per_interval(self):
+        response = self.request(is_staff=True)
+        profile_id = response['X-Profile-Id']
+        self.assertEqual(sorted(os.listdir(self.directory)),
+                         [f'{profile_id}.alloc.txt', f'{profile_id}.collapsed', f'{profile_id}.json'])
+        self.assertNotIn('X-Profile-Id', self.request(is_staff=True))
+
+    def test_other_users_are_not_profiled(self):
+        self.assertNotIn('X-Profile-Id', self.request(is_staff=False))
+        self.assertEqual(os.listdir(self.directory), [])
+
+
+class SlowQueryLogTests(TestCase):
+
+    def test_fingerprint_ignores_literals_and_whitespace(self):
+        self.assertEqual(sql_fingerprint("SELECT * FROM t WHERE a = 1 AND b = 'x'"),
+                         sql_fingerprint("SELECT *  FROM t\nWHERE a = 25 AND b = 'it''s'"))
+        self.assertNotEqual(sql_fingerprint('SELECT a FROM t'), sql_fingerprint('SELECT b FROM t'))
+
+    def test_queries_over_the_threshold_are_recorded(self):
+        config = {**settings.SLOW_QUERY_LOG, 'THRESHOLD_MS': 0, 'PATH': ''}
+        slow_queries.clear()
+        with override_settings(SLOW_QUERY_LOG=config), connection.execute_wrapper(SlowQueryLogger('default')):
+            User.objects.filter(email='nobody@example.com').exists()
+            deadline = time.monotonic() + 5
+            while not slow_queries and time.monotonic() < deadline:
+                time.sleep(0.01)
+        entry = slow_queries[-1]
+        self.assertIn('accounts_user', entry['sql'])
+        self.assertEqual(entry['sql_fingerprint'], sql_fingerprint(entry['sql']))
+        self.assertTrue(entry['call_site'].startswith('apps/common/tests.py:'))
+        self.assertIsNone(entry['explain'])
+
+
+class SQLCommenterTests(TestCase):
+
+    def test_statements_get_the_request_tags(self):
+        statements = []
+
+        def capture(execute, sql, params, many, context):
+            statements.append(sql)
+            return execute(sql, params, many, context)
+
+        # The timings of the tagged statements are not written by this test
+        self.addCleanup(discard_buffers)
+        token = query_tags.set({'controller': 'ProductsView', 'action': 'get', 'request_id': "a'b*/"})
+        try:
+            with connection.execute_wrapper(SQLCommenter(['controller', 'action', 'request_id'])), \
+                    connection.execute_wrapper(capture):
+                User.objects.filter(email='nobody@example.com').exists()
+        finally:
+            query_tags.reset(token)
+        self.assertTrue(statements[0].endswith(
+            " /*action='get',controller='ProductsView',request_id='a%%27b%%2A%%2F'*/"))
+
+    def test_endpoint_time_reaches_sql_tag_stats(self):
+        self.addCleanup(discard_buffers)
+        client = APIClient()
+        client.force_authenticate(User.objects.create_user(first_name='A', last_name='A', email='a@example.com',
+                                                           password='x'))
+        response = client.get('/shop/categories/', HTTP_X_REQUEST_ID='bench-1')
+        self.assertEqual(response['X-Request-ID'], 'bench-1')
+        tag_stats.flush()
+        stats = SqlTagStats.objects.get(controller='CategoriesView', action='get')
+        self.assertEqual(stats.route, 'shop/categories/')
+        self.assertGreaterEqual(stats.statements, 1)
+
+
+class QueryBudgetTests(TestCase):
+
+    def setUp(self):
+        self.addCleanup(discard_buffers)
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user(first_name='A', last_name='A', email='a@example.com',
+                                                                password='x'))
+        patcher = mock.patch.object(CategoriesView, 'query_budget', QueryBudget(queries=0))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_violation_is_logged(self):
+        before = budget_violations['CategoriesView']
+        with self.assertLogs('apps.common.db', 'WARNING') as logs:
+            response = self.client.get('/shop/categories/')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('CategoriesView exceeded its query budget: 1 queries > 0', logs.output[0])
+        self.assertEqual(budget_violations['CategoriesView'], before + 1)
+
+    def test_violation_raises_when_enabled(self):
+        with override_settings(QUERY_BUDGETS={**settings.QUERY_BUDGETS, 'RAISE': True}):
+            with self.assertRaisesMessage(QueryBudgetExceeded, 'exceeded its budget of 0 queries'):
+                self.client.get('/shop/categories/')
+
+    def test_statement_timeout_only_on_postgres(self):
+        tracker = QueryBudgetTracker(RequestFactory().get('/'))
+        budget = QueryBudget(db_ms=100, statement_timeout=True)
+        view = mock.Mock()
+        self.assertIsNone(tracker.run_view('View', budget, view, None, (), {}))
+        view.assert_not_called()
+        self.assertIs(tracker.budget, budget)
+
+
+class StreamJsonListTests(TestCase):
+
+    def test_matches_the_serializer_output(self):
+        for i in range(7):
+            Category.objects.create(name=f'Category "{i}" ё', image='c.png')
+        categories = Category.objects.order_by('name')
+        pieces = list(iter_json_list(categories, CategorySerializer, chunk_size=3, buffer_size=100))
+        self.assertGreater(len(pieces), 1)
+        expected = json.dumps(CategorySerializer(categories, many=True).data)
+        self.assertEqual(json.loads(b''.join(pieces)), json.loads(expected))
+
+    def test_empty_list(self):
+        self.assertEqual(b''.join(iter_json_list(Category.objects.none(), CategorySerializer, chunk_size=3)), b'[]')
+
+
+@job(name='tests.flaky', queue='tests', max_attempts=2, backoff=0)
+def flaky(fail):
+    if fail:
+        raise ValueError('flaky failed')
+
+
+class JobTests(TestCase):
+
+    def test_enqueue_is_idempotent_until_the_job_failed(self):
+        first = enqueue('tests.flaky', {'fail': False}, idempotency_key='key')
+        self.assertEqual(enqueue('tests.flaky', {'fail': False}, idempotency_key='key'), first)
+        Job.objects.filter(id=first.id).update(status='FAILED')
+        second = enqueue('tests.flaky', {'fail': False}, idempotency_key='key')
+        self.assertNotEqual(second, first)
+        first.refresh_from_db()
+        self.assertEqual((first.status, first.idempotency_key, second.idempotency_key), ('FAILED', None, 'key'))
+
+    def test_claim_takes_due_jobs_of_the_queues(self):
+        later = flaky.enqueue(fail=False, delay=60)
+        due = flaky.enqueue(fail=False)
+        self.assertIsNone(claim(['other'], 'worker'))
+        claimed = claim(['tests'], 'worker')
+        self.assertEqual((claimed.id, claimed.status, claimed.attempts, claimed.locked_by), (due.id, 'RUNNING', 1, 'worker'))
+        self.assertIsNone(claim(['tests'], 'worker'))
+        self.assertEqual(Job.objects.get(id=later.id).status, 'QUEUED')
+
+    def test_failed_attempts_are_retried_until_max_attempts(self):
+        queued = flaky.enqueue(fail=True)
+        with self.assertLogs('apps.common.jobs', 'WARNING'):
+            execute(claim(['tests'], 'worker'))
+        queued.refresh_from_db()
+        self.assertEqual((queued.status, queued.attempts, queued.locked_by), ('QUEUED', 1, ''))
+        self.assertIn('flaky failed', queued.last_error)
+
+        with self.assertLogs('apps.common.jobs', 'ERROR'):
+            execute(claim(['tests'], 'worker'))
+        queued.refresh_from_db()
+        self.assertEqual((queued.status, queued.attempts), ('FAILED', 2))
+        self.assertIsNotNone(queued.finished_at)
+
+        flaky.enqueue(fail=False)
+        execute(claim(['tests'], 'worker'))
+        self.assertEqual(Job.objects.filter(status='SUCCEEDED').count(), 1)
+
+    def test_requeue_stale(self):
+        long_ago = datetime.now(timezone.utc) - timedelta(minutes=10)
+        retried = Job.objects.create(name='tests.flaky', queue='tests', status='RUNNING', attempts=1, max_attempts=2,
+                                     locked_by='dead', started_at=long_ago, heartbeat_at=long_ago)
+        exhausted = Job.objects.create(name='tests.flaky', queue='tests', status='RUNNING', attempts=2,
+                                       max_attempts=2, locked_by='dead', started_at=long_ago)
+        alive = Job.objects.create(name='tests.flaky', queue='tests', status='RUNNING', attempts=1,
+                                   locked_by='alive', started_at=long_ago, heartbeat_at=datetime.now(timezone.utc))
+        with self.assertLogs('apps.common.jobs', 'ERROR'):
+            self.assertEqual(requeue_stale(60), 2)
+        self.assertEqual([Job.objects.get(id=job.id).status for job in (retried, exhausted, alive)],
+                         ['QUEUED', 'FAILED', 'RUNNING'])
+
+    def test_purge_jobs(self):
+        now = datetime.now(timezone.utc)
+        for status, days in (('SUCCEEDED', 8), ('SUCCEEDED', 1), ('FAILED', 8), ('FAILED', 31), ('QUEUED', 40)):
+            Job.objects.create(name='tests.flaky', queue='tests', status=status,
+                               finished_at=now - timedelta(days=days), idempotency_key=f'{status}-{days}')
+        purge_jobs()
+        self.assertEqual(sorted(Job.objects.values_list('idempotency_key', flat=True)),
+                         ['FAILED-8', 'QUEUED-40', 'SUCCEEDED-1'])
+
+    def test_cron(self):
+        cron = Cron('*/15 9-17 * * 1-5')
+        self.assertTrue(cron.matches(datetime(2026, 1, 5, 9, 30)))  # Monday
+        self.assertFalse(cron.matches(datetime(2026, 1, 5, 9, 31)))
+        self.assertFalse(cron.matches(datetime(2026, 1, 4, 9, 30)))  # Sunday
+        # Both day fields restricted: either matches
+        either = Cron('0 0 1 * 0')
+        self.assertTrue(either.matches(datetime(2026, 1, 1)))
+        self.assertTrue(either.matches(datetime(2026, 1, 4)))
+        self.assertFalse(either.matches(datetime(2026, 1, 5)))
+        for expression in ('* * *', '60 * * * *', '* * 0 * *'):
+            with self.assertRaises(ValueError):
+                Cron(expression)
+
+
+def png_bytes(size=(40, 20), exif=None):
+    output = io.BytesIO()
+    Image.new('RGBA', size, (255, 0, 0, 128)).save(output, 'PNG', exif=exif)
+    return output.getvalue()
+
+
+@override_settings(IMAGE_VARIANTS={'SIZES': {'thumb': 8, 'card': 16}, 'FORMATS': {'webp': 80, 'jpeg': 85}})
+class ImageVariantsTests(TestCase):
+
+    def setUp(self):
+        use_temporary_media(self)
+
+    def test_saving_an_image_enqueues_its_variants(self):
+        category = Category.objects.create(name='Phones', image=SimpleUploadedFile('c.png', png_bytes()))
+        queued = Job.objects.get(name='common.generate_image_variants')
+        self.assertEqual(queued.kwargs, {'model': 'shop.category', 'pks': [str(category.pk)]})
+        execute(claim([queued.queue], 'worker'))
+
+        category.refresh_from_db()
+        variants = category.image_variants['image']
+        self.assertEqual(variants['source'], category.image.name)
+        for variant, size in (('thumb', (8, 4)), ('card', (16, 8))):
+            for file_format in ('webp', 'jpeg'):
+                with default_storage.open(variants[variant][file_format]) as f, Image.open(f) as image:
+                    self.assertEqual((image.format.lower(), image.size), (file_format, size))
+
+        # Variants are up to date, saving again enqueues nothing
+        category.save()
+        self.assertEqual(Job.objects.filter(name='common.generate_image_variants').count(), 1)
+
+    def test_exif_orientation_is_applied_and_dropped(self):
+        exif = Image.Exif()
+        exif[0x0112] = 6  # rotated 90 degrees
+        name = default_storage.save('rotated.png', SimpleUploadedFile('rotated.png', png_bytes(exif=exif)))
+        variants = generate_variants(default_storage, name)
+        with default_storage.open(variants['card']['jpeg']) as f, Image.open(f) as image:
+            self.assertEqual(image.size, (8, 16))
+            self.assertNotIn(0x0112, image.getexif())
+
+
+class ContentAddressedStorageTests(TestCase):
+
+    def setUp(self):
+        use_temporary_media(self)
+
+    def test_same_content_is_stored_once(self):
+        first = default_storage.save('category_images/a.png', SimpleUploadedFile('a.png', png_bytes()))
+        second = default_storage.save('product_images/b.PNG', SimpleUploadedFile('b.PNG', png_bytes()))
+        other = default_storage.save('product_images/c.png', SimpleUploadedFile('c.png', png_bytes((4, 4))))
+        self.assertEqual(first, second)
+        self.assertRegex(first, r'^cas/[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}\.png$')
+        self.assertNotEqual(other, first)
+        self.assertEqual(sorted(MediaBlob.objects.values_list('name', flat=True)), sorted([first, other]))
+
+        # Blobs may be shared, only collect_blobs deletes them
+        default_storage.delete(first)
+        self.assertTrue(default_storage.exists(first))
+
+    def test_collect_blobs(self):
+        used = Category.objects.create(name='Phones', image=SimpleUploadedFile('a.png', png_bytes())).image.name
+        unused = default_storage.save('b.png', SimpleUploadedFile('b.png', png_bytes((4, 4))))
+        variants = generate_variants(default_storage, unused)
+        recent = default_storage.save('c.png', SimpleUploadedFile('c.png', png_bytes((6, 6))))
+        MediaBlob.objects.exclude(name=recent).update(last_used_at=datetime.now(timezone.utc) - timedelta(hours=2))
+
+        self.assertEqual(collect_blobs(default_storage, timedelta(hours=1)), 1)
+        self.assertEqual(sorted(MediaBlob.objects.values_list('name', 'refcount')), sorted([(used, 1), (recent, 0)]))
+        self.assertFalse(default_storage.exists(unused))
+        self.assertFalse(default_storage.exists(variants['thumb']['webp']))
+        self.assertTrue(default_storage.exists(used) and default_storage.exists(recent))
+
+
+class WriteBehindBufferTests(SimpleTestCase):
+
+    def buffer(self, write, **kwargs):
+        buffer = WriteBehindBuffer('tests.counter', write, interval=60, **kwargs)
+
+        def cleanup():
+            if buffer.timer is not None:
+                buffer.timer.cancel()
+            buffers.pop('tests.counter')
+        self.addCleanup(cleanup)
+        return buffer
+
+    def test_failed_write_is_retried_after_the_interval(self):
+        write = mock.Mock(side_effect=[ConnectionError('down'), None])
+        buffer = self.buffer(write, max_pending=2)
+        buffer.add('a', 2)
+        with self.assertLogs('apps.common.counters', 'ERROR'):
+            self.assertEqual(buffer.flush(), 0)
+        retry = buffer.timer
+        self.addCleanup(retry.cancel)
+        self.assertGreater(buffer.error_until, time.time() + 50)
+
+        # A full batch does not cut the backoff short
+        buffer.add('b')
+        buffer.add('a')
+        self.assertIs(buffer.timer, retry)
+        self.assertEqual(buffer.backlog()['last_error'], "ConnectionError('down')")
+
+        self.assertEqual(buffer.flush(), 2)
+        write.assert_called_with({'a': 3, 'b': 1})
+        self.assertIsNone(buffer.error_until)
+        self.assertEqual(buffer.backlog()['flushed_keys'], 2)
+
+    def test_new_keys_beyond_max_keys_are_dropped(self):
+        buffer = self.buffer(mock.Mock(), max_keys=2)
+        for key in ('a', 'b', 'c', 'a', 'd'):
+            buffer.add(key)
+        backlog = buffer.backlog()
+        self.assertEqual((backlog['pending_keys'], backlog['pending_total'], backlog['dropped_increments']), (2, 3, 2))
@@ -0,0 +1,10 @@
+from django.urls import path
+
+from apps.common.views import CountersView, JobQueuesView, SlowQueriesView, QueryBudgetViolationsView
+
+urlpatterns = [
+    path('slow-queries/', SlowQueriesView.as_view()),
+    path('query-budgets/', QueryBudgetViolationsView.as_view()),
+    path('jobs/', JobQueuesView.as_view()),
+    path('counters/', CountersView.as_view()),
+]
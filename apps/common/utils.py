@@ -1,4 +1,5 @@
 import secrets
+from itertools import islice
 
 from apps.common.models import BaseModel
 
@@ -27,3 +28,31 @@ def set_dict_attr(obj, data):
     for attr, value in data.items():
         setattr(obj, attr, value)  # Или obj.attr = value для каждого атрибута
     return obj
+
+
+def percentile(values, pct):
+    """
+    Return the pct-th percentile (0-100) of a sorted list using linear interpolation.
+
+    Args:
+        values (list): Sorted numbers.
+        pct (float): Percentile to compute.
+
+    Returns:
+        float: The percentile value, or None for an empty list.
+    """
+
+    if not values:
+        return None
+    rank = (len(values) - 1) * pct / 100
+    low = int(rank)
+    high = min(low + 1, len(values) - 1)
+    return values[low] + (values[high] - values[low]) * (rank - low)
+
+
+def batched(iterable, size):
+    """Yield lists of up to `size` items from `iterable`."""
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
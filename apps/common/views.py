@@ -1,3 +1,96 @@
-from django.shortcuts import render
+import json
+from collections import deque
 
-# Create your views here.
+from django.conf import settings
+from drf_spectacular.utils import extend_schema, OpenApiParameter, OpenApiTypes
+from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from apps.common.counters import backlog
+from apps.common.db import budget_violations, slow_queries
+from apps.common.jobs import queue_stats
+
+
+tags = ['Common']
+
+
+class SlowQueriesView(APIView):
+    permission_classes = [IsAdminUser]
+
+    @extend_schema(
+        summary='Медленные SQL-запросы',
+        description="""
+            Этот эндпоинт возвращает последние медленные SQL-запросы с планами EXPLAIN.
+            По умолчанию из памяти текущего процесса, с source=file - из общего журнала всех процессов.
+        """,
+        tags=tags,
+        parameters=[
+            OpenApiParameter(name='source', description='memory или file', required=False, type=OpenApiTypes.STR),
+            OpenApiParameter(name='limit', description='Количество записей, по умолчанию 100', required=False,
+                             type=OpenApiTypes.INT),
+        ],
+    )
+    def get(self, request, *args, **kwargs):
+        try:
+            limit = max(int(request.query_params.get('limit', 100)), 1)
+        except ValueError:
+            return Response({'message': 'limit должен быть числом'}, status=400)
+
+        path = settings.SLOW_QUERY_LOG['PATH']
+        if request.query_params.get('source') == 'file' and path:
+            try:
+                with open(path, encoding='utf-8') as f:
+                    entries = [json.loads(line) for line in deque(f, maxlen=limit)]
+            except FileNotFoundError:
+                entries = []
+        else:
+            entries = list(slow_queries)[-limit:]
+        entries.sort(key=lambda entry: entry['duration_ms'], reverse=True)
+        return Response({'count': len(entries), 'results': entries})
+
+
+class QueryBudgetViolationsView(APIView):
+    permission_classes = [IsAdminUser]
+
+    @extend_schema(
+        summary='Превышения бюджетов запросов',
+        description="""
+            Этот эндпоинт возвращает число превышений бюджетов запросов к БД по view в текущем процессе.
+        """,
+        tags=tags,
+    )
+    def get(self, request, *args, **kwargs):
+        return Response(dict(budget_violations.most_common()))
+
+
+class JobQueuesView(APIView):
+    permission_classes = [IsAdminUser]
+
+    @extend_schema(
+        summary='Состояние очередей фоновых задач',
+        description="""
+            Этот эндпоинт возвращает по каждой очереди число готовых к запуску, отложенных, выполняемых
+            и упавших задач, возраст самой старой готовой задачи и среднее ожидание и время выполнения
+            задач за последний час, в секундах.
+        """,
+        tags=tags,
+    )
+    def get(self, request, *args, **kwargs):
+        return Response(queue_stats())
+
+
+class CountersView(APIView):
+    permission_classes = [IsAdminUser]
+
+    @extend_schema(
+        summary='Незаписанные счетчики',
+        description="""
+            Этот эндпоинт возвращает по каждому буферу счетчиков (apps.common.counters) ответившего процесса
+            число ключей и сумму еще не записанных в базу прибавлений, возраст самого старого из них в секундах,
+            число записанных ключей, время последней записи и последнюю ошибку записи.
+        """,
+        tags=tags,
+    )
+    def get(self, request, *args, **kwargs):
+        return Response(backlog())
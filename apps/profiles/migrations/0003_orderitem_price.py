@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-19 08:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('profiles', '0002_rename_zip_code_order_zipcode'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='orderitem',
+            name='price',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True),
+        ),
+    ]
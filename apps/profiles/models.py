@@ -1,6 +1,7 @@
 from django.db import models
 
 from apps.accounts.models import User
+from apps.common.jobs import enqueue
 from apps.common.models import BaseModel
 from apps.common.utils import generate_unique_code
 from apps.shop.models import Product
@@ -68,14 +69,28 @@ class Order(BaseModel):
     country = models.CharField(null=True, max_length=100)
     zipcode = models.CharField(null=True, max_length=6)
 
+    class Meta:
+        indexes = [
+            # New orders of the incremental jobs, see apps.shop.related
+            models.Index(fields=['created_at'], name='order_created_idx'),
+        ]
 
     def __str__(self):
         return f'{self.user.full_name}\'s order'
 
     def save(self, *args, **kwargs):
-        if not self.created_at:
+        adding = not self.created_at
+        if adding:
             self.tx_ref = generate_unique_code(Order, 'tx_ref')
         super().save(*args, **kwargs)
+        if not adding:
+            # Keep the per-seller copies of the statuses in sync, see SellerOrder.
+            # Imported here, apps.sellers depends on this module
+            from apps.sellers.orders import sync_seller_orders
+
+            if sync_seller_orders(self):
+                # The payment status decides whether the order counts in the sales stats
+                enqueue('sellers.refresh_order_rollups', {'order_id': str(self.id)})
 
     @property
     def get_cart_subtotal(self):
@@ -97,19 +112,27 @@ class OrderItem(BaseModel):
         order (ForeignKey): The order to which this item belongs.
         product (ForeignKey): The product associated with this order item.
         quantity (int): The quantity of the product ordered.
+        price (Decimal): The unit price at checkout.
     """
 
     user = models.ForeignKey(User, on_delete=models.CASCADE, blank=True, null=True)
     order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='orderitems', null=True, blank=True)
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
     quantity = models.PositiveIntegerField(default=1)
+    # Unit price at checkout, null for items still in the cart and for older orders
+    price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
 
     class Meta:
         ordering = ['-created_at']
 
+    @property
+    def unit_price(self):
+        # Items still in the cart and of orders placed before the price snapshot use the current price
+        return self.price if self.price is not None else self.product.price_current
+
     @property
     def get_total(self):
-        return self.product.price_current * self.quantity
+        return self.unit_price * self.quantity
 
     def __str__(self):
         return self.product.name
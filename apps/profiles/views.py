@@ -4,6 +4,8 @@ from rest_framework.response import Response
 from rest_framework.views import APIView
 from drf_spectacular.utils import extend_schema
 
+from apps.common.db import QueryBudget
+from apps.common.responses import stream_json_list
 from apps.common.utils import set_dict_attr
 from apps.common.permissions import IsOwner
 from apps.profiles.serializers import ProfileSerializer, ShippingAddressSerializer
@@ -162,6 +164,7 @@ class ShippingAddressViewID(APIView):
 class OrdersView(APIView):
     serializer_class = OrderSerializer
     permission_classes = [IsOwner]
+    query_budget = QueryBudget(queries=6, db_ms=500)
 
     @extend_schema(
         operation_id="orders_view",
@@ -176,8 +179,7 @@ class OrdersView(APIView):
         orders = (Order.objects.filter(user=user).select_related("user")
                   .prefetch_related("orderitems", "orderitems__product")
                   .order_by("-created_at"))
-        serializer = self.serializer_class(orders, many=True)
-        return Response(data=serializer.data, status=200)
+        return stream_json_list(request, orders, self.serializer_class)
 
 
 class OrderItemsView(APIView):
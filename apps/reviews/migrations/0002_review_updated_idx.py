@@ -0,0 +1,20 @@
+# Generated by Django 5.2.8 on 2026-10-19 09:59
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reviews', '0001_initial'),
+        ('shop', '0009_product_counters'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['updated_at'], name='review_updated_idx'),
+        ),
+    ]
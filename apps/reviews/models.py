@@ -13,6 +13,10 @@ class Review(IsDeletedModel):
 
     class Meta:
         unique_together = ['user', 'product']
+        indexes = [
+            # Catalog deltas pick up the products reviewed since the last run, see apps.shop.snapshot
+            models.Index(fields=['updated_at'], name='review_updated_idx'),
+        ]
 
     def __str__(self):
         return f'{self.user.full_name}--{self.product.name}'
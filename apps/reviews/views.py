@@ -12,9 +12,14 @@ from rest_framework.permissions import IsAuthenticated
 from .serializers import ReviewCreateSerializer
 from .models import Review
 from ..common.permissions import IsSeller, IsOwner
+from ..common.responses import stream_json_list
 from ..common.utils import set_dict_attr
 from ..profiles.models import Order
+from ..sellers.analytics import enqueue_rating_refresh
+from ..sellers.storefront import adjust_storefront
+from ..shop.cache import invalidate_products
 from ..shop.models import Product
+from ..shop.trending import record
 
 
 tags = ['Reviews']
@@ -44,6 +49,10 @@ class ReviewCreateView(APIView):
             raise ValidationError('Вы уже оставляли отзыв на этот товар')
 
         order = Review.objects.create(user=user, product=product, rating=data['rating'], text=data['text'])
+        adjust_storefront(product.seller_id, rating_sum=order.rating, rating_count=1)
+        invalidate_products([product.slug])
+        enqueue_rating_refresh(order)
+        record(product.slug, 'review')
         serializer = ReviewCreateSerializer(order)
         return Response(serializer.data)
 
@@ -61,9 +70,8 @@ class ReviewListView(APIView):
         product = Product.objects.select_related("seller", "seller__user").get_or_none(slug=kwargs["slug"])
         if not product:
             return Response({"message": "Нет продукта с таким slug"}, status=status.HTTP_404_NOT_FOUND)
-        reviews = Review.objects.filter(product=product)
-        serializer = self.serializer_class(reviews, many=True)
-        return Response(serializer.data)
+        reviews = Review.objects.filter(product=product).select_related("user", "product")
+        return stream_json_list(request, reviews, self.serializer_class)
 
 
 class MyReviewsListView(APIView):
@@ -77,9 +85,8 @@ class MyReviewsListView(APIView):
     )
     def get(self, request, *args, **kwargs):
         user = request.user
-        reviews = Review.objects.filter(user=user)
-        serializer = self.serializer_class(reviews, many=True)
-        return Response(serializer.data)
+        reviews = Review.objects.filter(user=user).select_related("user", "product")
+        return stream_json_list(request, reviews, self.serializer_class)
 
 
 class MyReviewDetailView(APIView):
@@ -97,6 +104,8 @@ class MyReviewDetailView(APIView):
                             code=status.HTTP_404_NOT_FOUND)
 
         self.check_object_permissions(self.request, queryset)
+        # The product is already loaded, the storefront counters need its seller
+        queryset.product = product
 
         return queryset
 
@@ -122,8 +131,13 @@ class MyReviewDetailView(APIView):
         serializer = self.serializer_class(review, data=request.data)
         serializer.is_valid(raise_exception=True)
         data = serializer.validated_data
+        previous_rating = review.rating
         review = set_dict_attr(review, data)
-        review.save()
+        with transaction.atomic():
+            review.save()
+            adjust_storefront(review.product.seller_id, rating_sum=review.rating - previous_rating)
+        invalidate_products([kwargs['slug']])
+        enqueue_rating_refresh(review)
         serializer = self.serializer_class(review)
         return Response(serializer.data)
 
@@ -143,5 +157,9 @@ class MyReviewDetailView(APIView):
     def delete(self, request, *args, **kwargs):
         user = request.user
         review = self.get_object(user, kwargs['slug'])
-        review.hard_delete()
+        with transaction.atomic():
+            review.hard_delete()
+            adjust_storefront(review.product.seller_id, rating_sum=-review.rating, rating_count=-1)
+        invalidate_products([kwargs['slug']])
+        enqueue_rating_refresh(review)
         return Response(data={"message": "Отзыв успешно удален"}, status=200)
@@ -1,9 +1,48 @@
 from django.contrib import admin
 
-from .models import Seller
+from .models import Seller, SellerExport, ProductImport, ImageUpload, SellerOrder, SellerDailyStats, ProductDailyStats
 
 
 
 @admin.register(Seller)
 class SellerAdmin(admin.ModelAdmin):
-    pass
+    list_display = ('business_name', 'is_approved', 'product_count', 'rating_count', 'units_sold')
+    readonly_fields = ('product_count', 'rating_sum', 'rating_count', 'units_sold')
+
+
+@admin.register(SellerExport)
+class SellerExportAdmin(admin.ModelAdmin):
+    list_display = ('seller', 'kind', 'file_format', 'status', 'row_count', 'created_at', 'finished_at')
+    list_filter = ('kind', 'status')
+
+
+@admin.register(ProductImport)
+class ProductImportAdmin(admin.ModelAdmin):
+    list_display = ('seller', 'file_format', 'status', 'processed_rows', 'created_count', 'error_count', 'created_at')
+    list_filter = ('status',)
+
+
+@admin.register(ImageUpload)
+class ImageUploadAdmin(admin.ModelAdmin):
+    list_display = ('seller', 'filename', 'size', 'received', 'status', 'created_at')
+    list_filter = ('status',)
+
+
+@admin.register(SellerOrder)
+class SellerOrderAdmin(admin.ModelAdmin):
+    list_display = ('order', 'seller', 'subtotal', 'item_count', 'delivery_status', 'payment_status', 'created_at')
+    list_filter = ('delivery_status', 'payment_status', 'in_rollups')
+
+
+@admin.register(SellerDailyStats)
+class SellerDailyStatsAdmin(admin.ModelAdmin):
+    list_display = ('date', 'seller', 'orders', 'units', 'revenue', 'rating_count')
+    list_select_related = ('seller',)
+    date_hierarchy = 'date'
+
+
+@admin.register(ProductDailyStats)
+class ProductDailyStatsAdmin(admin.ModelAdmin):
+    list_display = ('date', 'product', 'seller', 'orders', 'units', 'revenue', 'rating_count')
+    list_select_related = ('product', 'seller')
+    date_hierarchy = 'date'
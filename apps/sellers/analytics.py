@@ -0,0 +1,256 @@
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+from django.db import connection, transaction
+from django.db.models import Count, Min, DecimalField, ExpressionWrapper, F, Q, Sum
+from django.db.models.functions import Coalesce, TruncDate
+from django.utils import timezone
+
+from apps.common.jobs import enqueue
+from apps.profiles.models import Order, OrderItem
+from apps.reviews.models import Review
+from apps.shop.models import Product
+from apps.sellers.models import ProductDailyStats, SellerDailyStats, SellerOrder
+
+
+# Orders with these payment statuses are not counted as sales
+EXCLUDED_PAYMENT_STATUSES = ('CANCELLED', 'FAILED')
+SALES_FIELDS = ('orders', 'units', 'revenue')
+RATING_FIELDS = ('rating_sum', 'rating_count')
+
+
+def item_revenue():
+    # Items of orders placed before the price snapshot existed fall back to the current price
+    return ExpressionWrapper(
+        Coalesce(F('price'), F('product__price_current')) * F('quantity'),
+        output_field=DecimalField(max_digits=14, decimal_places=2),
+    )
+
+
+def upsert_stats(model, rows, fields, add):
+    """
+    Write daily stats rows with one INSERT ... ON CONFLICT per call.
+
+    Args:
+        model: SellerDailyStats or ProductDailyStats.
+        rows (list): Dicts with the key columns and `fields`.
+        fields (tuple): Stat columns to write, the others are left unchanged.
+        add (bool): Add the values to an existing row instead of replacing them.
+    """
+
+    if not rows:
+        return
+    keys = ['product', 'seller', 'date'] if model is ProductDailyStats else ['seller', 'date']
+    # New rows get zeros for the stats not written
+    columns = [model._meta.get_field(name) for name in [*keys, *SALES_FIELDS, *RATING_FIELDS]]
+    conflict = ['product_id' if model is ProductDailyStats else 'seller_id', 'date']
+    quote = connection.ops.quote_name
+    table = quote(model._meta.db_table)
+    if add:
+        updates = [f'{quote(name)} = {table}.{quote(name)} + EXCLUDED.{quote(name)}' for name in fields]
+    else:
+        updates = [f'{quote(name)} = EXCLUDED.{quote(name)}' for name in fields]
+    params = []
+    for row in rows:
+        params.extend(
+            field.get_db_prep_value(row.get(field.name, 0), connection, prepared=False) for field in columns
+        )
+    placeholders = f'({", ".join(["%s"] * len(columns))})'
+    sql = (
+        f'INSERT INTO {table} ({", ".join(quote(field.column) for field in columns)}) '
+        f'VALUES {", ".join([placeholders] * len(rows))} '
+        f'ON CONFLICT ({", ".join(quote(name) for name in conflict)}) DO UPDATE SET {", ".join(updates)}'
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+
+
+def refresh_order_rollups(order_id):
+    """
+    Bring the contribution of an order to the daily stats in line with its payment status.
+
+    The SellerOrder rows of the order record whether it is counted, so running
+    this again (a job retry, a repeated status change) never counts it twice.
+    """
+
+    with transaction.atomic():
+        seller_orders = list(SellerOrder.objects.select_for_update().select_related('order').filter(order_id=order_id)
+                             .order_by('id'))
+        if not seller_orders:
+            return
+        order = seller_orders[0].order
+        counted = order.payment_status not in EXCLUDED_PAYMENT_STATUSES
+        changed = [seller_order for seller_order in seller_orders if seller_order.in_rollups != counted]
+        if not changed:
+            return
+        sign = 1 if counted else -1
+        date = timezone.localdate(order.created_at)
+        items = (
+            OrderItem.objects.filter(order_id=order_id, product__seller_id__in=[so.seller_id for so in changed])
+            .values('product_id', 'product__seller_id')
+            .annotate(units=Sum('quantity'), revenue=Sum(item_revenue()))
+            .order_by()
+        )
+        products = []
+        sellers = defaultdict(lambda: {'orders': sign, 'units': 0, 'revenue': Decimal(0)})
+        for item in items:
+            seller_id = item['product__seller_id']
+            products.append({
+                'product': item['product_id'], 'seller': seller_id, 'date': date,
+                'orders': sign, 'units': sign * item['units'], 'revenue': sign * item['revenue'],
+            })
+            sellers[seller_id]['units'] += sign * item['units']
+            sellers[seller_id]['revenue'] += sign * item['revenue']
+        upsert_stats(ProductDailyStats, products, SALES_FIELDS, add=True)
+        upsert_stats(SellerDailyStats, [{'seller': seller_id, 'date': date, **stats}
+                                        for seller_id, stats in sellers.items()], SALES_FIELDS, add=True)
+        SellerOrder.objects.filter(id__in=[so.id for so in changed]).update(in_rollups=counted)
+
+
+def refresh_rating_rollups(product_id, date):
+    """Recompute the ratings of a product and its seller for one day from the reviews."""
+
+    start = timezone.make_aware(datetime.combine(date, time.min))
+    end = start + timedelta(days=1)
+    with transaction.atomic():
+        review = Review.objects.filter(
+            product_id=product_id, is_deleted=False, created_at__gte=start, created_at__lt=end,
+        ).aggregate(rating_sum=Coalesce(Sum('rating'), 0), rating_count=Count('id'))
+        seller_id = Product.objects.filter(id=product_id).values_list('seller_id', flat=True).first()
+        if seller_id is None:
+            return
+        upsert_stats(ProductDailyStats, [{'product': product_id, 'seller': seller_id, 'date': date, **review}],
+                     RATING_FIELDS, add=False)
+        seller = ProductDailyStats.objects.filter(seller_id=seller_id, date=date).aggregate(
+            rating_sum=Coalesce(Sum('rating_sum'), 0), rating_count=Coalesce(Sum('rating_count'), 0))
+        upsert_stats(SellerDailyStats, [{'seller': seller_id, 'date': date, **seller}], RATING_FIELDS, add=False)
+
+
+def enqueue_rating_refresh(review):
+    """Queue the refresh of the ratings of the day a review was left, after it changed."""
+    enqueue('sellers.refresh_rating_rollups', {
+        'product_id': str(review.product_id), 'day': timezone.localdate(review.created_at).isoformat(),
+    })
+
+
+def rebuild_rollups(date_from, date_to):
+    """
+    Recompute the daily stats of [date_from, date_to] from orders and reviews in one
+    transaction, returning the number of written (seller, product) rows.
+
+    The SellerOrder rows of the range are locked first, like refresh_order_rollups
+    does for one order, so an order refresh either commits before the orders are
+    read or waits and then finds in_rollups already matching.
+    """
+
+    start = timezone.make_aware(datetime.combine(date_from, time.min))
+    end = timezone.make_aware(datetime.combine(date_to + timedelta(days=1), time.min))
+    sold = Q(order__created_at__gte=start, order__created_at__lt=end, product__seller__isnull=False) & ~Q(
+        order__payment_status__in=EXCLUDED_PAYMENT_STATUSES)
+    empty = lambda: dict.fromkeys((*SALES_FIELDS, *RATING_FIELDS), 0)
+    products = defaultdict(empty)
+    sellers = defaultdict(empty)
+
+    with transaction.atomic():
+        in_range = SellerOrder.objects.filter(created_at__gte=start, created_at__lt=end)
+        list(in_range.select_for_update().order_by('id').values_list('id', flat=True))
+        items = OrderItem.objects.filter(sold).annotate(date=TruncDate('order__created_at'))
+        for row in (items.values('product_id', 'product__seller_id', 'date')
+                    .annotate(orders=Count('order_id', distinct=True), units=Sum('quantity'),
+                              revenue=Sum(item_revenue())).order_by()):
+            key = (row['product_id'], row['product__seller_id'], row['date'])
+            products[key].update(orders=row['orders'], units=row['units'], revenue=row['revenue'])
+        for row in (items.values('product__seller_id', 'date')
+                    .annotate(orders=Count('order_id', distinct=True), units=Sum('quantity'),
+                              revenue=Sum(item_revenue())).order_by()):
+            key = (row['product__seller_id'], row['date'])
+            sellers[key].update(orders=row['orders'], units=row['units'], revenue=row['revenue'])
+        reviews = (
+            Review.objects.filter(is_deleted=False, created_at__gte=start, created_at__lt=end,
+                                  product__seller__isnull=False)
+            .annotate(date=TruncDate('created_at'))
+            .values('product_id', 'product__seller_id', 'date')
+            .annotate(rating_sum=Sum('rating'), rating_count=Count('id'))
+            .order_by()
+        )
+        for row in reviews:
+            seller_key = (row['product__seller_id'], row['date'])
+            products[(row['product_id'], *seller_key)].update(rating_sum=row['rating_sum'],
+                                                              rating_count=row['rating_count'])
+            sellers[seller_key]['rating_sum'] += row['rating_sum']
+            sellers[seller_key]['rating_count'] += row['rating_count']
+
+        ProductDailyStats.objects.filter(date__gte=date_from, date__lte=date_to).delete()
+        SellerDailyStats.objects.filter(date__gte=date_from, date__lte=date_to).delete()
+        ProductDailyStats.objects.bulk_create(
+            [ProductDailyStats(product_id=product_id, seller_id=seller_id, date=date, **stats)
+             for (product_id, seller_id, date), stats in products.items()], batch_size=1000)
+        SellerDailyStats.objects.bulk_create(
+            [SellerDailyStats(seller_id=seller_id, date=date, **stats)
+             for (seller_id, date), stats in sellers.items()], batch_size=1000)
+        in_range.exclude(order__payment_status__in=EXCLUDED_PAYMENT_STATUSES).update(in_rollups=True)
+        in_range.filter(order__payment_status__in=EXCLUDED_PAYMENT_STATUSES).update(in_rollups=False)
+    return len(sellers), len(products)
+
+
+def backfill_rollups(date_from=None, date_to=None, batch_days=31):
+    """
+    Rebuild the daily stats from the first order (or `date_from`) to today (or
+    `date_to`), `batch_days` days per transaction, and return the number of
+    written (seller, product) rows. Rerunning it for a range is safe.
+    """
+
+    if date_from is None:
+        first = Order.objects.aggregate(first=Min('created_at'))['first']
+        if first is None:
+            return 0, 0
+        date_from = timezone.localdate(first)
+    date_to = date_to or timezone.localdate()
+    sellers = products = 0
+    while date_from <= date_to:
+        batch_to = min(date_from + timedelta(days=batch_days - 1), date_to)
+        batch = rebuild_rollups(date_from, batch_to)
+        sellers, products = sellers + batch[0], products + batch[1]
+        date_from = batch_to + timedelta(days=1)
+    return sellers, products
+
+
+def daily_series(stats, date_from, date_to):
+    """Time series of a daily stats queryset over [date_from, date_to], days without data are zeros."""
+
+    rows = {row['date']: row for row in stats.filter(date__gte=date_from, date__lte=date_to).values(
+        'date', *SALES_FIELDS, *RATING_FIELDS)}
+    series = []
+    totals = dict.fromkeys((*SALES_FIELDS, *RATING_FIELDS), 0)
+    day = date_from
+    while day <= date_to:
+        row = rows.get(day) or {'date': day, **dict.fromkeys((*SALES_FIELDS, *RATING_FIELDS), 0)}
+        for field in totals:
+            totals[field] += row[field]
+        series.append(stats_point(row))
+        day += timedelta(days=1)
+    return {'date_from': date_from, 'date_to': date_to, 'totals': stats_point(totals), 'series': series}
+
+
+def stats_point(row):
+    point = {field: row[field] for field in SALES_FIELDS}
+    if 'date' in row:
+        point = {'date': row['date'], **point}
+    point['revenue'] = Decimal(point['revenue']).quantize(Decimal('0.01'))
+    point['reviews'] = row['rating_count']
+    point['avg_rating'] = round(row['rating_sum'] / row['rating_count'], 2) if row['rating_count'] else None
+    return point
+
+
+def top_products(seller, date_from, date_to, limit):
+    """Products of a seller with the highest revenue over [date_from, date_to]."""
+
+    rows = (
+        ProductDailyStats.objects.filter(seller=seller, date__gte=date_from, date__lte=date_to)
+        .values('product__slug', 'product__name')
+        .annotate(**{field: Sum(field) for field in (*SALES_FIELDS, *RATING_FIELDS)})
+        .order_by('-revenue', '-units')[:limit]
+    )
+    return [{'product__slug': row['product__slug'], 'product__name': row['product__name'], **stats_point(row)}
+            for row in rows]
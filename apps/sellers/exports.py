@@ -0,0 +1,179 @@
+import csv
+import json
+import tempfile
+
+from django.core.files import File
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Count, DecimalField, ExpressionWrapper, F, Q, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from apps.profiles.models import Order, OrderItem
+from apps.sellers.models import SellerExport
+from apps.shop.models import Product
+
+
+CHUNK_SIZE = 2000
+
+CONTENT_TYPES = {
+    'csv': 'text/csv; charset=utf-8',
+    'jsonl': 'application/x-ndjson',
+}
+
+
+def unit_price(prefix=''):
+    # Price at checkout, the current one for orders placed before it was recorded
+    return Coalesce(F(f'{prefix}price'), F(f'{prefix}product__price_current'),
+                    output_field=DecimalField(max_digits=10, decimal_places=2))
+
+
+def line_total(prefix=''):
+    return ExpressionWrapper(
+        F(f'{prefix}quantity') * unit_price(prefix),
+        output_field=DecimalField(max_digits=12, decimal_places=2),
+    )
+
+
+def orders_queryset(seller):
+    own_items = Q(orderitems__product__seller=seller)
+    return (
+        Order.objects.filter(own_items)
+        .annotate(
+            items=Sum('orderitems__quantity', filter=own_items),
+            lines=Count('orderitems', filter=own_items),
+            subtotal=Sum(line_total('orderitems__'), filter=own_items),
+        )
+        .order_by('created_at', 'id')
+        .values_list(
+            'tx_ref', 'created_at', 'delivery_status', 'payment_status', 'date_delivered', 'full_name', 'email',
+            'phone', 'address', 'city', 'country', 'zipcode', 'lines', 'items', 'subtotal',
+        )
+    )
+
+
+def order_items_queryset(seller):
+    return (
+        OrderItem.objects.filter(product__seller=seller, order__isnull=False)
+        .annotate(unit_price=unit_price(), total=line_total())
+        .order_by('order__created_at', 'id')
+        .values_list(
+            'order__tx_ref', 'order__created_at', 'order__delivery_status', 'order__payment_status',
+            'product__slug', 'product__name', 'quantity', 'unit_price', 'total',
+        )
+    )
+
+
+def products_queryset(seller):
+    return (
+        Product.objects.filter(seller=seller)
+        .order_by('created_at', 'id')
+        .values_list(
+            'slug', 'name', 'category__name', 'price_current', 'price_old', 'in_stock', 'created_at', 'updated_at',
+        )
+    )
+
+
+# kind -> (queryset builder, column names, field used by the date filters)
+EXPORTS = {
+    'orders': (
+        orders_queryset,
+        ('tx_ref', 'created_at', 'delivery_status', 'payment_status', 'date_delivered', 'full_name', 'email',
+         'phone', 'address', 'city', 'country', 'zipcode', 'lines', 'items', 'subtotal'),
+        'created_at',
+    ),
+    'order_items': (
+        order_items_queryset,
+        ('tx_ref', 'ordered_at', 'delivery_status', 'payment_status', 'product_slug', 'product_name',
+         'quantity', 'price', 'total'),
+        'order__created_at',
+    ),
+    'products': (
+        products_queryset,
+        ('slug', 'name', 'category', 'price_current', 'price_old', 'in_stock', 'created_at', 'updated_at'),
+        'created_at',
+    ),
+}
+
+
+def export_rows(seller, kind, date_from=None, date_to=None):
+    """
+    Return the column names and the rows of an export.
+
+    Rows are plain tuples read from a server-side cursor, with every join done
+    in the SQL query, so no model instances are built.
+    """
+
+    build, columns, date_field = EXPORTS[kind]
+    queryset = build(seller)
+    if date_from:
+        queryset = queryset.filter(**{f'{date_field}__date__gte': date_from})
+    if date_to:
+        queryset = queryset.filter(**{f'{date_field}__date__lte': date_to})
+    return columns, queryset.iterator(chunk_size=CHUNK_SIZE)
+
+
+class Echo:
+    """File-like object whose write() returns the value, for csv.writer."""
+
+    def write(self, value):
+        return value
+
+
+def iter_csv(columns, rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(columns)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def iter_jsonl(columns, rows):
+    for row in rows:
+        yield json.dumps(dict(zip(columns, row)), cls=DjangoJSONEncoder, ensure_ascii=False) + '\n'
+
+
+WRITERS = {
+    'csv': iter_csv,
+    'jsonl': iter_jsonl,
+}
+
+
+def iter_export(seller, kind, file_format, date_from=None, date_to=None):
+    columns, rows = export_rows(seller, kind, date_from, date_to)
+    return WRITERS[file_format](columns, rows)
+
+
+def file_name(kind, file_format, seller):
+    return f'{seller.slug or seller.id}-{kind}-{timezone.localdate():%Y%m%d}.{file_format}'
+
+
+def run_export(export):
+    """Write a SellerExport to its file and update its status."""
+
+    export.status = 'RUNNING'
+    export.save(update_fields=['status', 'updated_at'])
+    try:
+        with tempfile.TemporaryFile('w+b') as tmp:
+            rows = 0
+            for line in iter_export(export.seller, export.kind, export.file_format, export.date_from, export.date_to):
+                tmp.write(line.encode())
+                rows += 1
+            if export.file_format == 'csv':
+                rows -= 1  # header
+            tmp.seek(0)
+            export.file.save(file_name(export.kind, export.file_format, export.seller), File(tmp), save=False)
+        export.row_count = rows
+        export.status = 'SUCCESS'
+    except Exception as exc:
+        export.status = 'FAILED'
+        export.error = str(exc)
+        raise
+    finally:
+        export.finished_at = timezone.now()
+        export.save()
+
+
+def start_export(export):
+    """Queue the export for a background worker, so it does not hold a web worker."""
+    from apps.sellers.tasks import process_export
+
+    process_export.enqueue(export_id=str(export.id))
@@ -0,0 +1,283 @@
+import csv
+import http.client
+import io
+import ipaddress
+import json
+import os
+import socket
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+from urllib.request import HTTPHandler, HTTPRedirectHandler, HTTPSHandler, ProxyHandler, build_opener
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.utils import timezone
+from PIL import Image
+
+from apps.common.jobs import enqueue
+from apps.common.utils import batched
+from apps.sellers.models import ProductImport
+from apps.sellers.serializers import ProductImportRowSerializer
+from apps.sellers.storefront import adjust_storefront
+from apps.shop.models import Category, Product
+
+
+BATCH_SIZE = 500
+IMAGE_FIELDS = ('image1', 'image2', 'image3')
+IMAGE_WORKERS = 8
+IMAGE_TIMEOUT = 10
+MAX_IMAGE_SIZE = 10 * 1024 * 1024
+
+
+class ImageError(Exception):
+    pass
+
+
+def read_rows(source, file_format):
+    """Yield the rows of an import file as dicts, or the error of an unreadable JSONL line."""
+
+    text = io.TextIOWrapper(source, encoding='utf-8-sig', newline='')
+    if file_format == 'csv':
+        yield from csv.DictReader(text)
+        return
+    for line in text:
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as exc:
+            yield ValueError(f'Некорректный JSON: {exc}')
+            continue
+        yield row if isinstance(row, dict) else ValueError('Строка должна быть JSON-объектом')
+
+
+def public_connection(address, timeout=socket._GLOBAL_DEFAULT_TIMEOUT, source_address=None):
+    """
+    socket.create_connection that only connects to public addresses: the host is
+    resolved here and the checked address is the one connected to, so a seller's
+    URL (or a redirect, or a DNS answer changing in between) cannot reach the
+    internal network, loopback or the cloud metadata service.
+    """
+
+    host, port = address
+    try:
+        infos = socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)
+    except socket.gaierror as exc:
+        raise OSError(f'не удалось найти адрес {host}: {exc}')
+    for family, type_, proto, _, sockaddr in infos:
+        # is_global is False for private, loopback, link-local (169.254.169.254), reserved...
+        ip = ipaddress.ip_address(sockaddr[0].split('%')[0])
+        if not ip.is_global or ip.is_multicast:
+            raise OSError(f'адрес {ip} недоступен')
+    error = None
+    for family, type_, proto, _, sockaddr in infos:
+        sock = socket.socket(family, type_, proto)
+        try:
+            if timeout is not socket._GLOBAL_DEFAULT_TIMEOUT:
+                sock.settimeout(timeout)
+            if source_address:
+                sock.bind(source_address)
+            sock.connect(sockaddr)
+            return sock
+        except OSError as exc:
+            sock.close()
+            error = exc
+    raise error or OSError(f'не удалось найти адрес {host}')
+
+
+class PublicHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._create_connection = public_connection
+
+
+class PublicHTTPSConnection(http.client.HTTPSConnection):
+    # The certificate is still checked against the host name
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._create_connection = public_connection
+
+
+class PublicHTTPHandler(HTTPHandler):
+    def http_open(self, req):
+        return self.do_open(PublicHTTPConnection, req)
+
+
+class PublicHTTPSHandler(HTTPSHandler):
+    def https_open(self, req):
+        return self.do_open(PublicHTTPSConnection, req, context=self._context)
+
+
+class PublicRedirectHandler(HTTPRedirectHandler):
+    max_redirections = 5
+
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        if urlsplit(newurl).scheme not in ('http', 'https'):
+            raise OSError(f'перенаправление на {newurl} запрещено')
+        return super().redirect_request(req, fp, code, msg, headers, newurl)
+
+
+# No proxies: the connection must go to the checked address itself
+image_opener = build_opener(ProxyHandler({}), PublicHTTPHandler, PublicHTTPSHandler, PublicRedirectHandler)
+
+
+def load_image(reference, archive):
+    """Read an image from a URL or from the uploaded archive and store it, returning the stored name."""
+
+    if reference.startswith(('http://', 'https://')):
+        try:
+            with image_opener.open(reference, timeout=IMAGE_TIMEOUT) as response:
+                data = response.read(MAX_IMAGE_SIZE + 1)
+        except (OSError, ValueError) as exc:
+            raise ImageError(f'Не удалось загрузить {reference}: {exc}')
+        name = os.path.basename(urlsplit(reference).path)
+    elif archive is not None:
+        try:
+            # The declared size can lie, the read is bounded as well
+            if archive.getinfo(reference).file_size > MAX_IMAGE_SIZE:
+                raise ImageError(f'{reference} больше {MAX_IMAGE_SIZE // (1024 * 1024)} МБ')
+            with archive.open(reference) as file:
+                data = file.read(MAX_IMAGE_SIZE + 1)
+        except KeyError:
+            raise ImageError(f'{reference} нет в архиве')
+        except (OSError, zipfile.BadZipFile, RuntimeError, NotImplementedError) as exc:
+            raise ImageError(f'Не удалось прочитать {reference} из архива: {exc}')
+        name = os.path.basename(reference)
+    else:
+        raise ImageError(f'{reference} не является URL, а архив не загружен')
+
+    if len(data) > MAX_IMAGE_SIZE:
+        raise ImageError(f'{reference} больше {MAX_IMAGE_SIZE // (1024 * 1024)} МБ')
+    try:
+        Image.open(io.BytesIO(data)).verify()
+    except Exception:
+        raise ImageError(f'{reference} не является изображением')
+    field = Product._meta.get_field('image1')
+    return default_storage.save(field.generate_filename(None, name or 'image'), ContentFile(data))
+
+
+def load_images(row, archive):
+    images = {}
+    try:
+        for field in IMAGE_FIELDS:
+            if row.get(field):
+                images[field] = load_image(row[field], archive)
+    except ImageError as exc:
+        delete_files(images.values())
+        return {field: [str(exc)]}
+    return images
+
+
+def delete_files(names):
+    for name in names:
+        default_storage.delete(name)
+
+
+class Importer:
+    """
+    Creates the products of a ProductImport batch by batch.
+
+    Each batch of BATCH_SIZE rows is validated, categories are resolved from a
+    map loaded once per import, images are fetched in parallel and the products
+    are inserted with a single bulk_create, which also allocates their slugs in
+    one query. Progress is saved after every batch.
+    """
+
+    def __init__(self, product_import):
+        self.product_import = product_import
+        self.seller = product_import.seller
+        self.categories = dict(Category.objects.values_list('slug', 'id'))
+        self.archive = None
+
+    def run(self):
+        product_import = self.product_import
+        product_import.status = 'RUNNING'
+        product_import.save(update_fields=['status', 'updated_at'])
+        try:
+            with product_import.source.open('rb') as source, ThreadPoolExecutor(IMAGE_WORKERS) as pool:
+                if product_import.archive:
+                    self.archive = zipfile.ZipFile(product_import.archive.open('rb'))
+                rows = enumerate(read_rows(source, product_import.file_format), start=1)
+                for batch in batched(rows, BATCH_SIZE):
+                    self.import_batch(batch, pool)
+            product_import.status = 'SUCCESS'
+        except Exception as exc:
+            product_import.status = 'FAILED'
+            product_import.error = str(exc)
+            raise
+        finally:
+            if self.archive is not None:
+                self.archive.close()
+            product_import.finished_at = timezone.now()
+            product_import.save()
+
+    def import_batch(self, batch, pool):
+        errors = []
+        valid = []
+        for number, row in batch:
+            row_errors, data = self.validate(row)
+            if row_errors:
+                errors.append({'row': number, 'errors': row_errors})
+            else:
+                valid.append((number, data))
+
+        # Images are loaded only for rows that passed validation, replacing the references with stored names
+        products = []
+        for (number, data), images in zip(valid, pool.map(lambda item: load_images(item[1], self.archive), valid)):
+            if any(isinstance(value, list) for value in images.values()):
+                errors.append({'row': number, 'errors': images})
+                continue
+            data.update(images)
+            products.append(Product(seller=self.seller, **data))
+
+        self.insert(products)
+        self.save_progress(len(batch), len(products), errors)
+
+    def validate(self, row):
+        if isinstance(row, Exception):
+            return {'non_field_errors': [str(row)]}, None
+        serializer = ProductImportRowSerializer(data=row)
+        if not serializer.is_valid():
+            return serializer.errors, None
+        data = dict(serializer.validated_data)
+        category_id = self.categories.get(data.pop('category_slug'))
+        if category_id is None:
+            return {'category_slug': ['Категория не существует!']}, None
+        data['category_id'] = category_id
+        return None, data
+
+    def insert(self, products):
+        # bulk_create allocates the slugs of the whole batch with one query
+        try:
+            with transaction.atomic():
+                Product.objects.bulk_create(products)
+                adjust_storefront(self.seller.id, product_count=len(products))
+        except Exception:
+            delete_files(getattr(product, field).name for product in products for field in IMAGE_FIELDS
+                         if getattr(product, field))
+            raise
+        if products:
+            # bulk_create sends no post_save, queue the image variants of the batch with one job
+            enqueue('common.generate_image_variants',
+                    {'model': Product._meta.label_lower, 'pks': [str(product.pk) for product in products]})
+
+    def save_progress(self, processed, created, errors):
+        product_import = self.product_import
+        product_import.processed_rows += processed
+        product_import.created_count += created
+        product_import.error_count += len(errors)
+        product_import.errors.extend(errors)
+        product_import.save(update_fields=['processed_rows', 'created_count', 'error_count', 'errors', 'updated_at'])
+
+
+def run_import(product_import):
+    Importer(product_import).run()
+
+
+def start_import(product_import):
+    """Queue the import for a background worker, so it does not hold a web worker."""
+    from apps.sellers.tasks import process_import
+
+    process_import.enqueue(import_id=str(product_import.id))
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.8 on 2026-10-19 08:23
+
+import apps.sellers.models
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sellers', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SellerExport',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('kind', models.CharField(choices=[('orders', 'Заказы'), ('order_items', 'Позиции заказов'), ('products', 'Товары')], max_length=20)),
+                ('file_format', models.CharField(choices=[('csv', 'CSV'), ('jsonl', 'JSON Lines')], max_length=10)),
+                ('date_from', models.DateField(blank=True, null=True)),
+                ('date_to', models.DateField(blank=True, null=True)),
+                ('status', models.CharField(choices=[('PENDING', 'В ОЖИДАНИИ'), ('RUNNING', 'ВЫПОЛНЯЕТСЯ'), ('SUCCESS', 'ГОТОВО'), ('FAILED', 'ОШИБКА')], default='PENDING', max_length=20)),
+                ('row_count', models.PositiveIntegerField(default=0)),
+                ('file', models.FileField(blank=True, upload_to=apps.sellers.models.export_upload_to)),
+                ('error', models.TextField(blank=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('seller', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='exports', to='sellers.seller')),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.8 on 2026-10-19 08:25
+
+import apps.sellers.models
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sellers', '0002_seller_export'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductImport',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('file_format', models.CharField(choices=[('csv', 'CSV'), ('jsonl', 'JSON Lines')], max_length=10)),
+                ('source', models.FileField(upload_to=apps.sellers.models.import_upload_to)),
+                ('archive', models.FileField(blank=True, upload_to=apps.sellers.models.import_upload_to)),
+                ('status', models.CharField(choices=[('PENDING', 'В ОЖИДАНИИ'), ('RUNNING', 'ВЫПОЛНЯЕТСЯ'), ('SUCCESS', 'ГОТОВО'), ('FAILED', 'ОШИБКА')], default='PENDING', max_length=20)),
+                ('processed_rows', models.PositiveIntegerField(default=0)),
+                ('created_count', models.PositiveIntegerField(default=0)),
+                ('error_count', models.PositiveIntegerField(default=0)),
+                ('errors', models.JSONField(blank=True, default=list)),
+                ('error', models.TextField(blank=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('seller', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='imports', to='sellers.seller')),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
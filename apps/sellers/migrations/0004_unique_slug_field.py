@@ -0,0 +1,42 @@
+# Generated by Django 5.2.8 on 2026-10-19 08:29
+
+import apps.common.fields
+from django.db import migrations
+
+from apps.common.fields import allocate_slugs, register_slugs, split_slug
+
+
+def register_existing_slugs(apps, schema_editor):
+    """Register seller slugs and re-allocate duplicates, the old field was not unique."""
+
+    using = schema_editor.connection.alias
+    Seller = apps.get_model('sellers', 'Seller')
+    sellers = Seller.objects.using(using).exclude(slug=None).order_by('created_at').values_list('id', 'slug')
+    seen = set()
+    duplicates = []
+    for seller_id, slug in sellers.iterator(chunk_size=10_000):
+        if slug in seen:
+            duplicates.append((seller_id, slug))
+        seen.add(slug)
+    register_slugs('sellers.seller.slug', seen, using)
+    if duplicates:
+        slugs = allocate_slugs('sellers.seller.slug', [split_slug(slug)[0] for _, slug in duplicates], using)
+        for (seller_id, _), slug in zip(duplicates, slugs):
+            Seller.objects.using(using).filter(id=seller_id).update(slug=slug)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sellers', '0003_productimport'),
+        ('common', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(register_existing_slugs, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='seller',
+            name='slug',
+            field=apps.common.fields.UniqueSlugField(always_update=True, null=True, populate_from='business_name'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.8 on 2026-10-19 08:41
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sellers', '0004_unique_slug_field'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImageUpload',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('filename', models.CharField(max_length=255)),
+                ('size', models.PositiveIntegerField()),
+                ('received', models.PositiveIntegerField(default=0)),
+                ('status', models.CharField(choices=[('RECEIVING', 'ЗАГРУЖАЕТСЯ'), ('ASSEMBLING', 'ОБРАБОТКА'), ('READY', 'ГОТОВО'), ('FAILED', 'ОШИБКА')], default='RECEIVING', max_length=20)),
+                ('file', models.ImageField(blank=True, upload_to='product_images/')),
+                ('error', models.TextField(blank=True)),
+                ('seller', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='image_uploads', to='sellers.seller')),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.8 on 2026-10-19 08:43
+
+import django.db.models.deletion
+import django.utils.timezone
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('profiles', '0002_rename_zip_code_order_zipcode'),
+        ('sellers', '0005_imageupload'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SellerOrder',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('subtotal', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('item_count', models.PositiveIntegerField()),
+                ('delivery_status', models.CharField(default='PENDING', max_length=20)),
+                ('payment_status', models.CharField(default='PENDING', max_length=20)),
+                ('date_delivered', models.DateTimeField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='seller_orders', to='profiles.order')),
+                ('seller', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='seller_orders', to='sellers.seller')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['seller', '-created_at'], name='seller_order_created_idx')],
+                'constraints': [models.UniqueConstraint(fields=('order', 'seller'), name='seller_order_order_seller_unique')],
+            },
+        ),
+    ]
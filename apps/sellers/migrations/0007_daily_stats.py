@@ -0,0 +1,54 @@
+# Generated by Django 5.2.8 on 2026-10-19 08:48
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sellers', '0006_seller_order'),
+        ('shop', '0004_image_variants'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sellerorder',
+            name='in_rollups',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.CreateModel(
+            name='ProductDailyStats',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('date', models.DateField()),
+                ('orders', models.IntegerField(default=0)),
+                ('units', models.IntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('rating_sum', models.IntegerField(default=0)),
+                ('rating_count', models.IntegerField(default=0)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_stats', to='shop.product')),
+                ('seller', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='product_daily_stats', to='sellers.seller')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['seller', 'date'], name='product_stats_seller_date_idx')],
+                'constraints': [models.UniqueConstraint(fields=('product', 'date'), name='product_daily_stats_unique')],
+            },
+        ),
+        migrations.CreateModel(
+            name='SellerDailyStats',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('date', models.DateField()),
+                ('orders', models.IntegerField(default=0)),
+                ('units', models.IntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('rating_sum', models.IntegerField(default=0)),
+                ('rating_count', models.IntegerField(default=0)),
+                ('seller', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_stats', to='sellers.seller')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('seller', 'date'), name='seller_daily_stats_unique')],
+            },
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.8 on 2026-10-19 08:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sellers', '0007_daily_stats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='seller',
+            name='product_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='seller',
+            name='rating_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='seller',
+            name='rating_sum',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='seller',
+            name='units_sold',
+            field=models.BigIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,63 @@
+# Generated by Django 5.2.8 on 2026-10-19 09:21
+
+import posixpath
+
+import apps.common.storage
+import apps.sellers.models
+from django.core.files.storage import default_storage
+from django.db import migrations, models
+
+from apps.common.storage import private_storage
+
+
+FILES = (('SellerExport', 'seller_exports', ['file']), ('ProductImport', 'product_imports', ['source', 'archive']))
+
+
+def copy_files(apps, schema_editor, source, target):
+    using = schema_editor.connection.alias
+    for model_name, directory, fields in FILES:
+        model = apps.get_model('sellers', model_name)
+        for field in fields:
+            rows = model.objects.using(using).exclude(**{field: ''}).values_list('id', field)
+            for row_id, name in rows.iterator(chunk_size=1000):
+                if not source.exists(name):
+                    continue
+                with source.open(name, 'rb') as file:
+                    new_name = target.save(posixpath.join(directory, str(row_id), posixpath.basename(name)), file)
+                model.objects.using(using).filter(id=row_id).update(**{field: new_name})
+
+
+def move_to_private_storage(apps, schema_editor):
+    """Copy the existing export and import files out of the public media, the blobs left there are collected."""
+    copy_files(apps, schema_editor, default_storage, private_storage())
+
+
+def move_to_public_storage(apps, schema_editor):
+    """Copy the files back to the public media, the private copies are kept."""
+    copy_files(apps, schema_editor, private_storage(), default_storage)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sellers', '0008_storefront_counters'),
+    ]
+
+    operations = [
+        migrations.RunPython(move_to_private_storage, move_to_public_storage),
+        migrations.AlterField(
+            model_name='productimport',
+            name='archive',
+            field=models.FileField(blank=True, storage=apps.common.storage.private_storage, upload_to=apps.sellers.models.import_upload_to),
+        ),
+        migrations.AlterField(
+            model_name='productimport',
+            name='source',
+            field=models.FileField(storage=apps.common.storage.private_storage, upload_to=apps.sellers.models.import_upload_to),
+        ),
+        migrations.AlterField(
+            model_name='sellerexport',
+            name='file',
+            field=models.FileField(blank=True, storage=apps.common.storage.private_storage, upload_to=apps.sellers.models.export_upload_to),
+        ),
+    ]
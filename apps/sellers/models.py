@@ -1,9 +1,10 @@
 from django.db import models
-
-from autoslug import AutoSlugField
+from django.utils import timezone
 
 from apps.accounts.models import User
+from apps.common.fields import UniqueSlugField
 from apps.common.models import BaseModel
+from apps.common.storage import private_storage
 
 
 class Seller(BaseModel):
@@ -12,7 +13,7 @@ class Seller(BaseModel):
 
     # Business Information
     business_name = models.CharField(max_length=255)
-    slug = AutoSlugField(populate_from='business_name', always_update=True, null=True)
+    slug = UniqueSlugField(populate_from='business_name', always_update=True, null=True)
     inn_identification_number = models.CharField(max_length=50)
     website_url = models.URLField(null=True)
     phone_number = models.CharField(max_length=20)
@@ -32,5 +33,257 @@ class Seller(BaseModel):
     # Status Fields
     is_approved = models.BooleanField(default=False)
 
+    # Storefront counters, kept up to date by apps.sellers.storefront
+    product_count = models.PositiveIntegerField(default=0)
+    rating_sum = models.BigIntegerField(default=0)
+    rating_count = models.PositiveIntegerField(default=0)
+    units_sold = models.BigIntegerField(default=0)
+
     def __str__(self):
         return f'Seller for {self.business_name}'
+
+    @property
+    def avg_rating(self):
+        # Average over all reviews of the seller's products
+        return round(self.rating_sum / self.rating_count, 2) if self.rating_count else None
+
+
+EXPORT_KIND_CHOICES = (
+    ("orders", "Заказы"),
+    ("order_items", "Позиции заказов"),
+    ("products", "Товары"),
+)
+
+EXPORT_FORMAT_CHOICES = (
+    ("csv", "CSV"),
+    ("jsonl", "JSON Lines"),
+)
+
+EXPORT_STATUS_CHOICES = (
+    ("PENDING", "В ОЖИДАНИИ"),
+    ("RUNNING", "ВЫПОЛНЯЕТСЯ"),
+    ("SUCCESS", "ГОТОВО"),
+    ("FAILED", "ОШИБКА"),
+)
+
+
+def export_upload_to(export, filename):
+    return f'seller_exports/{export.id}/{filename}'
+
+
+class SellerExport(BaseModel):
+    """
+    A background export of a seller's orders, order lines or products.
+
+    Attributes:
+        seller (ForeignKey): The seller whose data is exported.
+        kind (str): What is exported: orders, order_items or products.
+        file_format (str): csv or jsonl.
+        date_from (date): Only rows created on or after this date.
+        date_to (date): Only rows created on or before this date.
+        status (str): PENDING, RUNNING, SUCCESS or FAILED.
+        row_count (int): Number of exported rows.
+        file (FileField): The produced file, set once the export succeeded. Private,
+            downloaded through SellerExportFileView.
+        error (str): The error message of a failed export.
+        finished_at (datetime): When the export finished.
+    """
+
+    seller = models.ForeignKey(Seller, on_delete=models.CASCADE, related_name='exports')
+    kind = models.CharField(max_length=20, choices=EXPORT_KIND_CHOICES)
+    file_format = models.CharField(max_length=10, choices=EXPORT_FORMAT_CHOICES)
+    date_from = models.DateField(null=True, blank=True)
+    date_to = models.DateField(null=True, blank=True)
+    status = models.CharField(max_length=20, default='PENDING', choices=EXPORT_STATUS_CHOICES)
+    row_count = models.PositiveIntegerField(default=0)
+    file = models.FileField(upload_to=export_upload_to, storage=private_storage, blank=True)
+    error = models.TextField(blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f'{self.kind} export of {self.seller.business_name}'
+
+
+IMPORT_FORMAT_CHOICES = EXPORT_FORMAT_CHOICES
+
+IMPORT_STATUS_CHOICES = EXPORT_STATUS_CHOICES
+
+
+def import_upload_to(product_import, filename):
+    return f'product_imports/{product_import.id}/{filename}'
+
+
+class ProductImport(BaseModel):
+    """
+    A bulk catalog import of a seller.
+
+    Attributes:
+        seller (ForeignKey): The seller the products are created for.
+        file_format (str): csv or jsonl.
+        source (FileField): The uploaded rows, private like the archive.
+        archive (FileField): Optional zip archive with the images referenced by the rows.
+        status (str): PENDING, RUNNING, SUCCESS or FAILED.
+        processed_rows (int): Number of rows processed so far.
+        created_count (int): Number of created products.
+        error_count (int): Number of rejected rows.
+        errors (JSONField): Per-row error report, a list of {"row": n, "errors": {...}}.
+        error (str): The error that stopped the whole import.
+        finished_at (datetime): When the import finished.
+    """
+
+    seller = models.ForeignKey(Seller, on_delete=models.CASCADE, related_name='imports')
+    file_format = models.CharField(max_length=10, choices=IMPORT_FORMAT_CHOICES)
+    source = models.FileField(upload_to=import_upload_to, storage=private_storage)
+    archive = models.FileField(upload_to=import_upload_to, storage=private_storage, blank=True)
+    status = models.CharField(max_length=20, default='PENDING', choices=IMPORT_STATUS_CHOICES)
+    processed_rows = models.PositiveIntegerField(default=0)
+    created_count = models.PositiveIntegerField(default=0)
+    error_count = models.PositiveIntegerField(default=0)
+    errors = models.JSONField(default=list, blank=True)
+    error = models.TextField(blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f'Product import of {self.seller.business_name}'
+
+
+UPLOAD_STATUS_CHOICES = (
+    ("RECEIVING", "ЗАГРУЖАЕТСЯ"),
+    ("ASSEMBLING", "ОБРАБОТКА"),
+    ("READY", "ГОТОВО"),
+    ("FAILED", "ОШИБКА"),
+)
+
+
+class ImageUpload(BaseModel):
+    """
+    A resumable chunked upload of a product image, see apps.sellers.uploads.
+
+    The id is the upload token passed as image1_upload..image3_upload to the
+    product endpoints, a token can be used once.
+
+    Attributes:
+        seller (ForeignKey): The seller uploading the image.
+        filename (str): Original file name.
+        size (int): Declared size in bytes.
+        received (int): Bytes received so far, the offset to resume from.
+        status (str): RECEIVING, ASSEMBLING, READY or FAILED.
+        file (ImageField): The validated image, set once the upload is READY.
+        error (str): Why the image was rejected.
+    """
+
+    seller = models.ForeignKey(Seller, on_delete=models.CASCADE, related_name='image_uploads')
+    filename = models.CharField(max_length=255)
+    size = models.PositiveIntegerField()
+    received = models.PositiveIntegerField(default=0)
+    status = models.CharField(max_length=20, default='RECEIVING', choices=UPLOAD_STATUS_CHOICES)
+    file = models.ImageField(upload_to='product_images/', blank=True)
+    error = models.TextField(blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f'{self.filename} upload of {self.seller.business_name}'
+
+
+class SellerOrder(BaseModel):
+    """
+    The part of an order sold by one seller, created at checkout.
+
+    Lets a seller list their orders with an index scan on (seller, created_at)
+    instead of joining Order, OrderItem and Product and deduplicating.
+
+    Attributes:
+        seller (ForeignKey): The seller.
+        order (ForeignKey): The order.
+        subtotal (Decimal): Total of the seller's items at checkout prices.
+        item_count (int): Number of units of the seller's products in the order.
+        delivery_status (str): Copy of the order's delivery status, kept in sync by Order.save().
+        payment_status (str): Copy of the order's payment status.
+        date_delivered (datetime): Copy of the order's delivery date.
+        created_at (datetime): When the order was placed.
+        in_rollups (bool): Whether the order is counted in SellerDailyStats and ProductDailyStats.
+    """
+
+    seller = models.ForeignKey(Seller, on_delete=models.CASCADE, related_name='seller_orders')
+    order = models.ForeignKey('profiles.Order', on_delete=models.CASCADE, related_name='seller_orders')
+    subtotal = models.DecimalField(max_digits=12, decimal_places=2)
+    item_count = models.PositiveIntegerField()
+    delivery_status = models.CharField(max_length=20, default='PENDING')
+    payment_status = models.CharField(max_length=20, default='PENDING')
+    date_delivered = models.DateTimeField(null=True, blank=True)
+    # The order's time rather than auto_now_add, so that backfilled rows sort right
+    created_at = models.DateTimeField(default=timezone.now)
+    # Whether the order is counted in the daily stats, see apps.sellers.analytics
+    in_rollups = models.BooleanField(default=False)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['order', 'seller'], name='seller_order_order_seller_unique'),
+        ]
+        indexes = [
+            models.Index(fields=['seller', '-created_at'], name='seller_order_created_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.order_id} for {self.seller_id}'
+
+
+class DailyStats(models.Model):
+    """
+    Sales and reviews of one day, maintained by apps.sellers.analytics.
+
+    Attributes:
+        date (date): The day, in TIME_ZONE.
+        orders (int): Orders placed, not cancelled or failed.
+        units (int): Units sold in those orders.
+        revenue (Decimal): Revenue of those orders at checkout prices.
+        rating_sum (int): Sum of the ratings of the reviews left that day.
+        rating_count (int): Number of those reviews.
+    """
+
+    id = models.BigAutoField(primary_key=True)
+    date = models.DateField()
+    orders = models.IntegerField(default=0)
+    units = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    rating_sum = models.IntegerField(default=0)
+    rating_count = models.IntegerField(default=0)
+
+    class Meta:
+        abstract = True
+
+
+class SellerDailyStats(DailyStats):
+    seller = models.ForeignKey(Seller, on_delete=models.CASCADE, related_name='daily_stats')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['seller', 'date'], name='seller_daily_stats_unique'),
+        ]
+
+    def __str__(self):
+        return f'{self.seller_id} {self.date}'
+
+
+class ProductDailyStats(DailyStats):
+    product = models.ForeignKey('shop.Product', on_delete=models.CASCADE, related_name='daily_stats')
+    seller = models.ForeignKey(Seller, on_delete=models.CASCADE, related_name='product_daily_stats')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'date'], name='product_daily_stats_unique'),
+        ]
+        indexes = [
+            models.Index(fields=['seller', 'date'], name='product_stats_seller_date_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.product_id} {self.date}'
@@ -0,0 +1,98 @@
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import DecimalField, ExpressionWrapper, F, Sum
+from django.db.models.functions import Coalesce
+
+from apps.profiles.models import Order, OrderItem
+from apps.sellers.analytics import EXCLUDED_PAYMENT_STATUSES
+from apps.sellers.models import SellerOrder
+from apps.sellers.storefront import adjust_units_sold
+
+
+def create_seller_orders(order):
+    """
+    Create the SellerOrder rows of a new order with one INSERT.
+
+    Uses the order's items with their products, prefetched by the checkout.
+    """
+
+    totals = defaultdict(lambda: [Decimal(0), 0])
+    for item in order.orderitems.all():
+        seller_id = item.product.seller_id
+        if seller_id is not None:
+            totals[seller_id][0] += item.get_total
+            totals[seller_id][1] += item.quantity
+    SellerOrder.objects.bulk_create([
+        SellerOrder(
+            seller_id=seller_id, order=order, subtotal=subtotal, item_count=item_count,
+            delivery_status=order.delivery_status, payment_status=order.payment_status,
+            date_delivered=order.date_delivered, created_at=order.created_at,
+        )
+        for seller_id, (subtotal, item_count) in totals.items()
+    ])
+    if order.payment_status not in EXCLUDED_PAYMENT_STATUSES:
+        adjust_units_sold({seller_id: item_count for seller_id, (_, item_count) in totals.items()})
+
+
+def sync_seller_orders(order):
+    """
+    Copy the statuses of an updated order to its SellerOrder rows and return their number.
+
+    Units of an order whose payment gets cancelled or failed are taken out of
+    the sellers' units_sold, and put back if the payment recovers.
+    """
+
+    counted = order.payment_status not in EXCLUDED_PAYMENT_STATUSES
+    with transaction.atomic():
+        seller_orders = list(order.seller_orders.select_for_update().only('seller_id', 'item_count', 'payment_status'))
+        adjust_units_sold({
+            seller_order.seller_id: seller_order.item_count if counted else -seller_order.item_count
+            for seller_order in seller_orders
+            if (seller_order.payment_status not in EXCLUDED_PAYMENT_STATUSES) != counted
+        })
+        return order.seller_orders.update(
+            delivery_status=order.delivery_status, payment_status=order.payment_status,
+            date_delivered=order.date_delivered,
+        )
+
+
+def backfill_seller_orders(batch_size=1000):
+    """
+    Create the missing SellerOrder rows of existing orders, batch by batch, and
+    return their number. Subtotals use the prices at checkout of the items, or
+    the current product prices for items older than OrderItem.price.
+    """
+
+    created = 0
+    last_id = None
+    while True:
+        orders = Order.objects.filter(seller_orders__isnull=True).order_by('id')
+        if last_id is not None:
+            orders = orders.filter(id__gt=last_id)
+        batch = {order.id: order for order in orders.only(
+            'id', 'created_at', 'delivery_status', 'payment_status', 'date_delivered')[:batch_size]}
+        if not batch:
+            return created
+        last_id = max(batch)
+        rows = (
+            OrderItem.objects.filter(order_id__in=batch, product__seller__isnull=False)
+            .values('order_id', 'product__seller_id')
+            .annotate(
+                subtotal=Sum(ExpressionWrapper(Coalesce(F('price'), F('product__price_current')) * F('quantity'),
+                                               output_field=DecimalField(max_digits=12, decimal_places=2))),
+                item_count=Sum('quantity'),
+            )
+            .order_by()
+        )
+        seller_orders = []
+        for row in rows:
+            order = batch[row['order_id']]
+            seller_orders.append(SellerOrder(
+                seller_id=row['product__seller_id'], order_id=order.id, subtotal=row['subtotal'],
+                item_count=row['item_count'], delivery_status=order.delivery_status,
+                payment_status=order.payment_status, date_delivered=order.date_delivered,
+                created_at=order.created_at,
+            ))
+        created += len(SellerOrder.objects.bulk_create(seller_orders, ignore_conflicts=True))
@@ -1,5 +1,15 @@
+import zipfile
+from datetime import timedelta
+
+from django.conf import settings
+from django.urls import reverse
+from django.utils import timezone
+from drf_spectacular.utils import extend_schema_field, OpenApiTypes
 from rest_framework import serializers
 
+from apps.profiles.serializers import ShippingAddressSerializer
+from apps.sellers.models import EXPORT_FORMAT_CHOICES, EXPORT_KIND_CHOICES, IMPORT_FORMAT_CHOICES
+
 
 class SellerSerializer(serializers.Serializer):
     business_name = serializers.CharField(max_length=255)
@@ -19,3 +29,181 @@ class SellerSerializer(serializers.Serializer):
     bank_routing_number = serializers.CharField(max_length=50)
 
     is_approved = serializers.BooleanField(read_only=True)
+
+    product_count = serializers.IntegerField(read_only=True, help_text='Товары в продаже')
+    avg_rating = serializers.FloatField(read_only=True, allow_null=True,
+                                        help_text='Средняя оценка по всем отзывам на товары')
+    units_sold = serializers.IntegerField(read_only=True, help_text='Продано единиц товаров')
+
+
+class SellerExportSerializer(serializers.Serializer):
+    id = serializers.UUIDField(read_only=True)
+    kind = serializers.ChoiceField(choices=EXPORT_KIND_CHOICES)
+    file_format = serializers.ChoiceField(choices=EXPORT_FORMAT_CHOICES, default='csv')
+    date_from = serializers.DateField(required=False, allow_null=True)
+    date_to = serializers.DateField(required=False, allow_null=True)
+
+    status = serializers.CharField(read_only=True)
+    row_count = serializers.IntegerField(read_only=True)
+    file = serializers.SerializerMethodField(help_text='Ссылка для скачивания файла (с авторизацией)')
+    error = serializers.CharField(read_only=True)
+    created_at = serializers.DateTimeField(read_only=True)
+    finished_at = serializers.DateTimeField(read_only=True)
+
+    @extend_schema_field(OpenApiTypes.STR)
+    def get_file(self, obj):
+        # The file is private, only the seller downloads it through SellerExportFileView
+        return reverse('seller-export-file', kwargs={'id': obj.id}) if obj.file else None
+
+    def validate(self, attrs):
+        date_from, date_to = attrs.get('date_from'), attrs.get('date_to')
+        if date_from and date_to and date_from > date_to:
+            raise serializers.ValidationError({'date_to': 'date_to не может быть раньше date_from'})
+        return attrs
+
+
+class SellerExportQuerySerializer(SellerExportSerializer):
+    kind = None
+
+
+class ProductImportSerializer(serializers.Serializer):
+    id = serializers.UUIDField(read_only=True)
+    source = serializers.FileField(write_only=True, help_text='CSV или JSONL с товарами')
+    archive = serializers.FileField(write_only=True, required=False,
+                                    help_text='ZIP-архив с изображениями, на которые ссылаются строки')
+    file_format = serializers.ChoiceField(choices=IMPORT_FORMAT_CHOICES, required=False,
+                                          help_text='По умолчанию определяется по расширению файла')
+
+    status = serializers.CharField(read_only=True)
+    processed_rows = serializers.IntegerField(read_only=True)
+    created_count = serializers.IntegerField(read_only=True)
+    error_count = serializers.IntegerField(read_only=True)
+    error = serializers.CharField(read_only=True)
+    created_at = serializers.DateTimeField(read_only=True)
+    finished_at = serializers.DateTimeField(read_only=True)
+
+    def validate(self, attrs):
+        if 'file_format' not in attrs:
+            extension = attrs['source'].name.rsplit('.', 1)[-1].lower()
+            if extension not in dict(IMPORT_FORMAT_CHOICES):
+                raise serializers.ValidationError({'file_format': 'Укажите формат файла: csv или jsonl'})
+            attrs['file_format'] = extension
+        archive = attrs.get('archive')
+        if archive and not zipfile.is_zipfile(archive):
+            raise serializers.ValidationError({'archive': 'Архив должен быть в формате ZIP'})
+        return attrs
+
+
+class ProductImportDetailSerializer(ProductImportSerializer):
+    errors = serializers.JSONField(read_only=True)
+
+
+class ProductImportRowSerializer(serializers.Serializer):
+    name = serializers.CharField(max_length=100)
+    desc = serializers.CharField()
+    price_current = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=0)
+    price_old = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=0, required=False,
+                                         allow_null=True)
+    category_slug = serializers.SlugField()
+    in_stock = serializers.IntegerField(min_value=0, default=5)
+    image1 = serializers.CharField(help_text='URL или путь в архиве')
+    image2 = serializers.CharField(required=False, allow_blank=True)
+    image3 = serializers.CharField(required=False, allow_blank=True)
+
+
+
+class ProductDeltaListSerializer(serializers.ListSerializer):
+    def validate(self, attrs):
+        slugs = [delta['slug'] for delta in attrs]
+        if len(set(slugs)) != len(slugs):
+            raise serializers.ValidationError('slug не должен повторяться в одном пакете')
+        return attrs
+
+
+class ProductDeltaSerializer(serializers.Serializer):
+    slug = serializers.SlugField()
+    price_current = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=0, required=False)
+    in_stock = serializers.IntegerField(min_value=0, required=False)
+
+    class Meta:
+        list_serializer_class = ProductDeltaListSerializer
+
+    def validate(self, attrs):
+        if 'price_current' not in attrs and 'in_stock' not in attrs:
+            raise serializers.ValidationError('Укажите price_current и/или in_stock')
+        return attrs
+
+
+class ImageUploadSerializer(serializers.Serializer):
+    id = serializers.UUIDField(read_only=True, help_text='Токен загрузки')
+    filename = serializers.CharField(max_length=255)
+    size = serializers.IntegerField(min_value=1, help_text='Размер файла в байтах')
+    received = serializers.IntegerField(read_only=True)
+    status = serializers.CharField(read_only=True)
+    error = serializers.CharField(read_only=True)
+    created_at = serializers.DateTimeField(read_only=True)
+
+    def validate_size(self, value):
+        if value > settings.IMAGE_UPLOADS['MAX_SIZE']:
+            raise serializers.ValidationError(f'Размер файла больше {settings.IMAGE_UPLOADS["MAX_SIZE"]} байт')
+        return value
+
+
+class SellerOrderSerializer(serializers.Serializer):
+    tx_ref = serializers.CharField(source='order.tx_ref')
+    first_name = serializers.CharField(source='order.user.first_name')
+    last_name = serializers.CharField(source='order.user.last_name')
+    email = serializers.EmailField(source='order.user.email')
+    delivery_status = serializers.CharField()
+    payment_status = serializers.CharField()
+    date_delivered = serializers.DateTimeField()
+    shipping_details = ShippingAddressSerializer(source='order')
+    item_count = serializers.IntegerField(help_text='Количество единиц товаров продавца в заказе')
+    subtotal = serializers.DecimalField(max_digits=12, decimal_places=2,
+                                        help_text='Сумма товаров продавца по ценам на момент заказа')
+    total = serializers.DecimalField(max_digits=12, decimal_places=2, source='subtotal')
+    created_at = serializers.DateTimeField()
+
+
+ANALYTICS_MAX_DAYS = 366
+ANALYTICS_DEFAULT_DAYS = 30
+
+
+class AnalyticsQuerySerializer(serializers.Serializer):
+    date_from = serializers.DateField(required=False, help_text='По умолчанию 30 дней до date_to')
+    date_to = serializers.DateField(required=False, help_text='По умолчанию сегодня')
+    limit = serializers.IntegerField(min_value=1, max_value=100, default=20,
+                                     help_text='Количество товаров в рейтинге')
+
+    def validate(self, attrs):
+        date_to = attrs.setdefault('date_to', timezone.localdate())
+        date_from = attrs.setdefault('date_from', date_to - timedelta(days=ANALYTICS_DEFAULT_DAYS - 1))
+        if date_from > date_to:
+            raise serializers.ValidationError({'date_to': 'date_to не может быть раньше date_from'})
+        if (date_to - date_from).days >= ANALYTICS_MAX_DAYS:
+            raise serializers.ValidationError({'date_from': f'Период не может быть больше {ANALYTICS_MAX_DAYS} дней'})
+        return attrs
+
+
+class StatsPointSerializer(serializers.Serializer):
+    orders = serializers.IntegerField(help_text='Заказы, кроме отмененных и неуспешных')
+    units = serializers.IntegerField(help_text='Проданные единицы товаров')
+    revenue = serializers.DecimalField(max_digits=14, decimal_places=2, help_text='Выручка по ценам на момент заказа')
+    reviews = serializers.IntegerField(help_text='Новые отзывы')
+    avg_rating = serializers.FloatField(allow_null=True, help_text='Средняя оценка новых отзывов')
+
+
+class DailyStatsPointSerializer(StatsPointSerializer):
+    date = serializers.DateField()
+
+
+class AnalyticsSerializer(serializers.Serializer):
+    date_from = serializers.DateField()
+    date_to = serializers.DateField()
+    totals = StatsPointSerializer()
+    series = DailyStatsPointSerializer(many=True, help_text='По дням, дни без продаж - нули')
+
+
+class ProductStatsSerializer(StatsPointSerializer):
+    slug = serializers.SlugField(source='product__slug')
+    name = serializers.CharField(source='product__name')
@@ -0,0 +1,91 @@
+from django.db.models import Case, Count, F, IntegerField, OuterRef, Q, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
+
+from apps.reviews.models import Review
+from apps.sellers.analytics import EXCLUDED_PAYMENT_STATUSES
+from apps.sellers.models import Seller, SellerOrder
+from apps.shop.models import Product
+
+
+STOREFRONT_FIELDS = ('product_count', 'rating_sum', 'rating_count', 'units_sold')
+
+
+def adjust_storefront(seller_id, **deltas):
+    """
+    Add `deltas` to the storefront counters of a seller with one UPDATE.
+
+    Called in the transaction of the change it accounts for, so the counters
+    move together with the rows they count.
+    """
+
+    updates = {field: F(field) + delta for field, delta in deltas.items() if delta}
+    if seller_id is not None and updates:
+        Seller.objects.filter(id=seller_id).update(**updates)
+
+
+def adjust_units_sold(units):
+    """Add sold units to several sellers with one UPDATE, `units` maps seller ids to units."""
+
+    units = {seller_id: n for seller_id, n in units.items() if n}
+    if not units:
+        return
+    Seller.objects.filter(id__in=units).update(units_sold=F('units_sold') + Case(
+        *[When(id=seller_id, then=Value(n)) for seller_id, n in units.items()],
+        output_field=IntegerField(),
+    ))
+
+
+def remove_product(product):
+    """Take a soft deleted product and the ratings of its reviews out of its seller's counters."""
+
+    reviews = Review.objects.filter(product=product, is_deleted=False).aggregate(
+        rating_sum=Coalesce(Sum('rating'), 0), rating_count=Count('id'))
+    adjust_storefront(product.seller_id, product_count=-1, rating_sum=-reviews['rating_sum'],
+                      rating_count=-reviews['rating_count'])
+
+
+def counted_counters():
+    """Expressions computing every storefront counter of a seller from products, reviews and seller orders."""
+
+    def per_seller(queryset, expression):
+        value = queryset.filter(seller=OuterRef('pk')).values('seller').annotate(value=expression).values('value')
+        return Coalesce(Subquery(value), 0)
+
+    reviews = Review.objects.filter(is_deleted=False, product__is_deleted=False).annotate(seller=F('product__seller'))
+    return {
+        'product_count': per_seller(Product.objects.all(), Count('id')),
+        'rating_sum': per_seller(reviews, Sum('rating')),
+        'rating_count': per_seller(reviews, Count('id')),
+        'units_sold': per_seller(SellerOrder.objects.exclude(payment_status__in=EXCLUDED_PAYMENT_STATUSES),
+                                 Sum('item_count')),
+    }
+
+
+def reconcile_storefronts(batch_size=500):
+    """
+    Recompute the storefront counters of sellers whose stored values drifted
+    (rows written bypassing the views, admin deletes), batch by batch, and
+    return the number of corrected sellers.
+    """
+
+    drifted = Q()
+    for field in STOREFRONT_FIELDS:
+        drifted |= ~Q(**{field: F(f'counted_{field}')})
+    fixed = 0
+    last_id = None
+    while True:
+        sellers = Seller.objects.order_by('id')
+        if last_id is not None:
+            sellers = sellers.filter(id__gt=last_id)
+        batch = list(sellers.values_list('id', flat=True)[:batch_size])
+        if not batch:
+            return fixed
+        last_id = batch[-1]
+        ids = list(
+            Seller.objects.filter(id__in=batch)
+            .annotate(**{f'counted_{field}': value for field, value in counted_counters().items()})
+            .filter(drifted).values_list('id', flat=True)
+        )
+        if ids:
+            # Recounted in the UPDATE itself, so increments since the check are not lost
+            fixed += Seller.objects.filter(id__in=ids).update(**counted_counters())
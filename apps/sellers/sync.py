@@ -0,0 +1,57 @@
+from django.db import connection
+from django.utils import timezone
+
+from apps.shop.cache import invalidate_products
+from apps.shop.models import Product
+
+
+def apply_product_deltas(seller, deltas):
+    """
+    Apply a batch of price and stock changes of a seller with one UPDATE ... FROM (VALUES ...).
+
+    Only products of `seller` that are not deleted are touched. A new price moves the
+    previous one to price_old in SQL, and fields missing from a delta keep their
+    value. The cached data of the updated products is invalidated.
+
+    Args:
+        seller (Seller): The seller the products must belong to.
+        deltas (list): Dicts with slug and optional price_current and in_stock.
+
+    Returns:
+        list: Slugs of the updated products.
+    """
+
+    if not deltas:
+        return []
+    quote = connection.ops.quote_name
+    table = quote(Product._meta.db_table)
+    price_current, price_old, in_stock = (f'{table}.{quote(name)}' for name in ('price_current', 'price_old', 'in_stock'))
+
+    values = ', '.join(['(%s, CAST(%s AS NUMERIC), CAST(%s AS INTEGER))'] * len(deltas))
+    params = [Product._meta.get_field('updated_at').get_db_prep_value(timezone.now(), connection)]
+    for delta in deltas:
+        params.extend([delta['slug'], delta.get('price_current'), delta.get('in_stock')])
+    params.append(Product._meta.get_field('seller').target_field.get_db_prep_value(seller.pk, connection))
+
+    # VALUES columns are named column1..column3 both in Postgres and SQLite.
+    # SET expressions see the old row, so price_old gets the price before the update.
+    sql = f"""
+        UPDATE {table} SET
+            {quote('price_old')} = CASE
+                WHEN v.column2 IS NOT NULL AND v.column2 <> {price_current} THEN {price_current}
+                ELSE {price_old}
+            END,
+            {quote('price_current')} = COALESCE(v.column2, {price_current}),
+            {quote('in_stock')} = COALESCE(v.column3, {in_stock}),
+            {quote('updated_at')} = %s
+        FROM (VALUES {values}) AS v
+        WHERE {table}.{quote('slug')} = v.column1
+            AND {table}.{quote('seller_id')} = %s
+            AND NOT {table}.{quote('is_deleted')}
+        RETURNING {table}.{quote('slug')}
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        updated = [row[0] for row in cursor.fetchall()]
+    invalidate_products(updated)
+    return updated
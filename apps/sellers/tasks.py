@@ -0,0 +1,47 @@
+from datetime import date
+
+from apps.common.jobs import job
+from apps.sellers import analytics
+from apps.sellers.exports import run_export
+from apps.sellers.imports import run_import
+from apps.sellers.models import ImageUpload, ProductImport, SellerExport
+from apps.sellers.storefront import reconcile_storefronts
+from apps.sellers.uploads import assemble, purge_uploads
+
+
+@job(queue='sellers', max_attempts=1)
+def process_export(export_id):
+    run_export(SellerExport.objects.select_related('seller').get(id=export_id))
+
+
+# A retried import would create the products of the processed batches again
+@job(queue='sellers', max_attempts=1)
+def process_import(import_id):
+    run_import(ProductImport.objects.select_related('seller').get(id=import_id))
+
+
+@job(queue='images', max_attempts=3)
+def assemble_upload(upload_id):
+    upload = ImageUpload.objects.select_related('seller').get_or_none(id=upload_id, status='ASSEMBLING')
+    if upload is not None:
+        assemble(upload)
+
+
+@job(name='sellers.purge_uploads', max_attempts=3)
+def purge_uploads_job():
+    purge_uploads()
+
+
+@job(queue='analytics')
+def refresh_order_rollups(order_id):
+    analytics.refresh_order_rollups(order_id)
+
+
+@job(queue='analytics')
+def refresh_rating_rollups(product_id, day):
+    analytics.refresh_rating_rollups(product_id, date.fromisoformat(day))
+
+
+@job(name='sellers.reconcile_storefronts', max_attempts=3)
+def reconcile_storefronts_job():
+    reconcile_storefronts()
@@ -1,3 +1,341 @@
-from django.test import TestCase
+import csv
+import io
+import json
+import threading
+import uuid
+import zipfile
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.checks import run_checks
+from django.core.files.storage import default_storage
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from PIL import Image
+from rest_framework.test import APIClient
+
+from apps.accounts.models import User
+from apps.common.jobs import registry, work
+from apps.common.tests import discard_buffers, use_temporary_media
+from apps.profiles.models import Order, OrderItem, ShippingAddress
+from apps.sellers import imports
+from apps.sellers.analytics import rebuild_rollups, refresh_order_rollups
+from apps.sellers.models import ProductDailyStats, Seller, SellerDailyStats, SellerOrder
+from apps.sellers.orders import backfill_seller_orders
+from apps.sellers.storefront import reconcile_storefronts
+from apps.sellers.uploads import use_uploads
+from apps.shop.cache import product_cache_key
+from apps.shop.models import Category, Product
+
+
+def run_jobs():
+    """Run the due jobs of every queue in this thread until the queues are empty."""
+    work(sorted({func.queue for func in registry.values()}), threading.Event(), poll_interval=0, burst=True)
+
+
+def create_seller(email, name='Shop'):
+    user = User.objects.create_user(first_name='S', last_name='S', email=email, password='x', account_type='SELLER')
+    return Seller.objects.create(
+        user=user, business_name=name, inn_identification_number='1', phone_number='1',
+        business_description='-', business_address='-', city='-', postal_code='1', bank_name='-',
+        bank_bic_number='1', bank_account_number='1', bank_routing_number='1', is_approved=True,
+    )
+
+
+class SellerTestCase(TestCase):
+    """A seller with two products and a buyer with a shipping address, both with API clients."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = create_seller('seller@example.com')
+        cls.category = Category.objects.create(name='Phones', image='c.png')
+        cls.phone = Product.objects.create(seller=cls.seller, name='Phone', desc='-', category=cls.category,
+                                           price_current=Decimal('100.00'), in_stock=10, image1='p.png')
+        cls.case = Product.objects.create(seller=cls.seller, name='Case', desc='-', category=cls.category,
+                                          price_current=Decimal('5.50'), in_stock=10, image1='p.png')
+        cls.buyer = User.objects.create_user(first_name='B', last_name='B', email='buyer@example.com', password='x')
+        cls.shipping = ShippingAddress.objects.create(
+            user=cls.buyer, full_name='B B', email='buyer@example.com', phone='79000000000', address='Street 1',
+            city='Moscow', country='Russia', zipcode='101000',
+        )
+
+    def setUp(self):
+        self.addCleanup(discard_buffers)
+        use_temporary_media(self)
+        self.seller_client = APIClient()
+        self.seller_client.force_authenticate(self.seller.user)
+        self.buyer_client = APIClient()
+        self.buyer_client.force_authenticate(self.buyer)
+
+    def checkout(self, *lines):
+        """Order (product, quantity) lines through the cart and checkout endpoints, return the order data."""
+        for product, quantity in lines:
+            response = self.buyer_client.post('/shop/cart/', {'slug': product.slug, 'quantity': quantity})
+            self.assertEqual(response.status_code, 201, response.content)
+        response = self.buyer_client.post('/shop/checkout/', {'shipping_id': str(self.shipping.id)})
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()['item']
+
+
+class SellerExportTests(SellerTestCase):
+
+    def test_stream_order_items_csv(self):
+        order = self.checkout((self.phone, 2), (self.case, 1))
+        self.phone.price_current = Decimal('150.00')
+        self.phone.save()
+
+        response = self.seller_client.get('/sellers/exports/order_items/?file_format=csv')
+        self.assertEqual(response.status_code, 200)
+        rows = csv.DictReader(io.StringIO(b''.join(response.streaming_content).decode()))
+        # Lines keep the price at checkout
+        self.assertEqual(
+            sorted((row['tx_ref'], row['product_slug'], int(row['quantity']), Decimal(row['price']),
+                    Decimal(row['total'])) for row in rows),
+            [(order['tx_ref'], self.case.slug, 1, Decimal('5.50'), Decimal('5.50')),
+             (order['tx_ref'], self.phone.slug, 2, Decimal('100.00'), Decimal('200.00'))],
+        )
+
+    def test_background_export_is_only_served_to_its_seller(self):
+        self.checkout((self.phone, 1))
+        response = self.seller_client.post('/sellers/exports/', {'kind': 'orders', 'file_format': 'jsonl'})
+        self.assertEqual(response.status_code, 202)
+        run_jobs()
+        export = self.seller_client.get(f'/sellers/exports/{response.json()["id"]}/').json()
+        self.assertEqual((export['status'], export['row_count']), ('SUCCESS', 1))
+
+        download = self.seller_client.get(export['file'])
+        self.assertEqual(download.status_code, 200)
+        self.assertEqual(download['Cache-Control'], 'private, no-store')
+        line = json.loads(b''.join(download.streaming_content))
+        self.assertEqual((line['items'], Decimal(line['subtotal'])), (1, Decimal('100.00')))
+
+        other = APIClient()
+        other.force_authenticate(create_seller('other@example.com', 'Other').user)
+        self.assertEqual(other.get(export['file']).status_code, 404)
+
+
+class SellerOrderTests(SellerTestCase):
+
+    def test_checkout_splits_the_order_per_seller(self):
+        other = create_seller('other@example.com', 'Other')
+        lamp = Product.objects.create(seller=other, name='Lamp', desc='-', category=self.category,
+                                      price_current=Decimal('20.00'), in_stock=5, image1='p.png')
+        order = self.checkout((self.phone, 2), (self.case, 1), (lamp, 3))
+
+        response = self.seller_client.get('/sellers/orders/')
+        self.assertEqual(response.status_code, 200)
+        [row] = response.json()['results']
+        self.assertEqual((row['tx_ref'], row['item_count'], Decimal(row['subtotal'])),
+                         (order['tx_ref'], 3, Decimal('205.50')))
+        self.assertEqual(SellerOrder.objects.get(seller=other).subtotal, Decimal('60.00'))
+
+    def test_backfill_uses_the_prices_at_checkout(self):
+        order = self.checkout((self.phone, 2), (self.case, 1))
+        SellerOrder.objects.all().delete()
+        self.phone.price_current = Decimal('150.00')
+        self.phone.save()
+        self.case.price_current = Decimal('6.00')
+        self.case.save()
+        # An item of an order placed before the prices were stored
+        OrderItem.objects.filter(order__tx_ref=order['tx_ref'], product=self.case).update(price=None)
+
+        self.assertEqual(backfill_seller_orders(batch_size=1), 1)
+        self.assertEqual(backfill_seller_orders(), 0)
+        seller_order = SellerOrder.objects.get()
+        self.assertEqual((seller_order.item_count, seller_order.subtotal), (3, Decimal('206.00')))
+
+
+class SalesRollupTests(SellerTestCase):
+
+    def stats(self):
+        return (list(SellerDailyStats.objects.values_list('orders', 'units', 'revenue')),
+                sorted(ProductDailyStats.objects.values_list('product__name', 'units', 'revenue')))
+
+    def test_order_refresh_is_idempotent(self):
+        order = Order.objects.get(tx_ref=self.checkout((self.phone, 2), (self.case, 1))['tx_ref'])
+        run_jobs()
+        counted = ([(1, 3, Decimal('205.50'))], [('Case', 1, Decimal('5.50')), ('Phone', 2, Decimal('200.00'))])
+        self.assertEqual(self.stats(), counted)
+        refresh_order_rollups(order.id)
+        self.assertEqual(self.stats(), counted)
+
+        order.payment_status = 'CANCELLED'
+        order.save()
+        run_jobs()
+        refresh_order_rollups(order.id)
+        self.assertEqual(self.stats(), ([(0, 0, Decimal(0))], [('Case', 0, Decimal(0)), ('Phone', 0, Decimal(0))]))
+
+        order.payment_status = 'PENDING'
+        order.save()
+        run_jobs()
+        self.assertEqual(self.stats(), counted)
+
+    def test_rebuild_matches_the_incremental_rollups(self):
+        self.checkout((self.phone, 1))
+        self.checkout((self.case, 4))
+        run_jobs()
+        incremental = self.stats()
+        today = timezone.localdate()
+        self.assertEqual(rebuild_rollups(today, today), (1, 2))
+        self.assertEqual(self.stats(), incremental)
+        self.assertFalse(SellerOrder.objects.filter(in_rollups=False).exists())
+
+
+class StorefrontTests(SellerTestCase):
+
+    def counters(self):
+        return Seller.objects.values_list('product_count', 'rating_sum', 'rating_count', 'units_sold').get(
+            id=self.seller.id)
+
+    def test_counters_follow_the_changes_and_drift_is_reconciled(self):
+        # The fixture products are created bypassing the views
+        self.assertEqual(reconcile_storefronts(), 1)
+        self.assertEqual(self.counters(), (2, 0, 0, 0))
+
+        response = self.buyer_client.post(f'/review/create/{self.case.slug}/', {'rating': 4, 'text': 'ok'})
+        self.assertEqual(response.status_code, 200, response.content)
+        self.checkout((self.phone, 2), (self.case, 1))
+        self.assertEqual(self.counters(), (2, 4, 1, 3))
+
+        self.assertEqual(self.seller_client.delete(f'/sellers/product/{self.case.slug}/').status_code, 200)
+        self.assertEqual(self.counters(), (1, 0, 0, 3))
+        self.assertEqual(reconcile_storefronts(), 0)
+
+        Seller.objects.filter(id=self.seller.id).update(units_sold=100, rating_count=7)
+        self.assertEqual(reconcile_storefronts(batch_size=1), 1)
+        self.assertEqual(self.counters(), (1, 0, 0, 3))
+
+
+class ProductSyncTests(SellerTestCase):
+
+    def test_deltas_only_touch_own_products(self):
+        other = Product.objects.create(seller=create_seller('other@example.com', 'Other'), name='Other', desc='-',
+                                       category=self.category, price_current=Decimal('7.00'), in_stock=3, image1='p.png')
+        response = self.seller_client.post('/sellers/products/sync/', [
+            {'slug': self.phone.slug, 'price_current': '90.00'},
+            {'slug': self.case.slug, 'in_stock': 4},
+            {'slug': other.slug, 'price_current': '1.00'},
+        ], format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(sorted(response.json()['updated']), sorted([self.phone.slug, self.case.slug]))
+        self.assertEqual(response.json()['not_found'], [other.slug])
+
+        self.phone.refresh_from_db()
+        self.case.refresh_from_db()
+        other.refresh_from_db()
+        self.assertEqual((self.phone.price_current, self.phone.price_old, self.phone.in_stock),
+                         (Decimal('90.00'), Decimal('100.00'), 10))
+        self.assertEqual((self.case.price_current, self.case.price_old, self.case.in_stock),
+                         (Decimal('5.50'), None, 4))
+        self.assertEqual((other.price_current, other.in_stock), (Decimal('7.00'), 3))
+
+    @override_settings(PRODUCT_CACHE_TIMEOUT=60)
+    def test_cached_product_is_dropped_again_on_commit(self):
+        key = product_cache_key(self.phone.slug)
+        self.addCleanup(cache.delete, key)
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.seller_client.post('/sellers/products/sync/', [{'slug': self.phone.slug, 'in_stock': 1}],
+                                    format='json')
+            # A read between the update and the commit caches the old data again
+            cache.set(key, {'in_stock': 10})
+        self.assertEqual(cache.get(key), {'in_stock': 10})
+        for callback in callbacks:
+            callback()
+        self.assertIsNone(cache.get(key))
+
+    @override_settings(PRODUCT_CACHE_TIMEOUT=60)
+    def test_product_cache_requires_a_shared_backend(self):
+        self.assertIn('shop.E001', [error.id for error in run_checks()])
+        with override_settings(PRODUCT_CACHE_TIMEOUT=0):
+            self.assertNotIn('shop.E001', [error.id for error in run_checks()])
+
+
+def image_bytes(size=(4, 4)):
+    output = io.BytesIO()
+    Image.new('RGB', size, 'red').save(output, 'PNG')
+    return output.getvalue()
+
+
+class ImportImageTests(TestCase):
+
+    def setUp(self):
+        use_temporary_media(self)
+
+    def test_internal_addresses_are_refused(self):
+        for host in ('127.0.0.1', '10.0.0.5', '169.254.169.254', '::1'):
+            with self.subTest(host=host), self.assertRaisesMessage(OSError, 'недоступен'):
+                imports.public_connection((host, 80))
+
+    def test_urls_go_through_the_public_opener(self):
+        with self.assertRaisesMessage(imports.ImageError, 'недоступен'):
+            imports.load_image('http://127.0.0.1:9/image.png', None)
+
+    def test_archive_entries_are_bounded(self):
+        data = io.BytesIO()
+        with zipfile.ZipFile(data, 'w') as archive:
+            archive.writestr('small.png', image_bytes())
+            archive.writestr('large.png', image_bytes((64, 64)) + b'\0' * 4096)
+        with zipfile.ZipFile(data) as archive, mock.patch.object(imports, 'MAX_IMAGE_SIZE', 2048):
+            self.assertTrue(default_storage.exists(imports.load_image('small.png', archive)))
+            with self.assertRaisesMessage(imports.ImageError, 'large.png больше'):
+                imports.load_image('large.png', archive)
+            with self.assertRaisesMessage(imports.ImageError, 'missing.png нет в архиве'):
+                imports.load_image('missing.png', archive)
+
+
+class ImageUploadTests(SellerTestCase):
+
+    def start(self, data):
+        response = self.seller_client.post('/sellers/uploads/', {'filename': 'photo.png', 'size': len(data)})
+        self.assertEqual(response.status_code, 201, response.content)
+        return f'/sellers/uploads/{response.json()["id"]}/', response.json()['id']
+
+    def put(self, url, data, start, end=None):
+        end = start + len(data) - 1 if end is None else end
+        return self.seller_client.generic('PUT', url, data, content_type='application/octet-stream',
+                                          HTTP_CONTENT_RANGE=f'bytes {start}-{end}/{self.size}')
+
+    def test_chunks_are_resumed_and_assembled(self):
+        data = image_bytes((32, 32))
+        self.size, half = len(data), len(data) // 2
+        url, token = self.start(data)
+
+        self.assertEqual(self.put(url, data[:half], 0).json()['received'], half)
+        # A retried chunk is ignored, a gap is refused with the offset to resume from
+        self.assertEqual(self.put(url, data[:half], 0).status_code, 200)
+        gap = self.put(url, data[half + 1:], half + 1)
+        self.assertEqual((gap.status_code, gap.json()['received']), (409, half))
+        self.assertEqual(self.seller_client.get(url).json()['received'], half)
+
+        last = self.put(url, data[half:], half)
+        self.assertEqual((last.status_code, last.json()['status']), (202, 'ASSEMBLING'))
+        run_jobs()
+        self.assertEqual(self.seller_client.get(url).json()['status'], 'READY')
+
+        product = {'image1_upload': uuid.UUID(token)}
+        self.assertEqual(use_uploads(self.seller, product), {})
+        with default_storage.open(product['image1']) as f:
+            self.assertEqual(f.read(), data)
+        self.assertEqual(self.seller_client.get(url).status_code, 404)
+
+    def test_non_images_fail(self):
+        data = b'not an image'
+        self.size = len(data)
+        url, token = self.start(data)
+        self.assertEqual(self.put(url, data, 0).status_code, 202)
+        run_jobs()
+        upload = self.seller_client.get(url).json()
+        self.assertEqual((upload['status'], upload['error']), ('FAILED', 'Файл не является изображением'))
+        self.assertEqual(use_uploads(self.seller, {'image1_upload': uuid.UUID(token)}),
+                         {'image1_upload': ['Загрузка не найдена или еще не готова']})
+
+    def test_chunk_must_match_the_content_range(self):
+        data = image_bytes()
+        self.size = len(data)
+        url, _ = self.start(data)
+        self.assertEqual(self.put(url, data, 0, end=len(data)).status_code, 416)
+        self.assertEqual(self.put(url, data[:-1], 0, end=len(data) - 1).status_code, 400)
+        other = APIClient()
+        other.force_authenticate(create_seller('other@example.com', 'Other').user)
+        self.assertEqual(other.get(url).status_code, 404)
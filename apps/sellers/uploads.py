@@ -0,0 +1,153 @@
+import os
+import re
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files import File
+from django.db import transaction
+from django.utils import timezone
+from PIL import Image
+
+from apps.common.jobs import enqueue
+from apps.sellers.models import ImageUpload
+
+
+CONTENT_RANGE = re.compile(r'^bytes (?P<start>\d+)-(?P<end>\d+)/(?P<total>\d+)$')
+COPY_SIZE = 64 * 1024
+IMAGE_FORMATS = {'JPEG', 'PNG', 'WEBP', 'GIF'}
+
+
+class ChunkError(Exception):
+    """A chunk that can not be accepted, `status` is the HTTP status to answer with."""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def staging_path(upload):
+    return os.path.join(settings.IMAGE_UPLOADS['STAGING_DIR'], f'{upload.id}.part')
+
+
+def parse_content_range(header, upload, length):
+    """Return the (start, end) offsets of a chunk from its Content-Range header."""
+
+    match = CONTENT_RANGE.match(header or '')
+    if not match:
+        raise ChunkError('Нужен заголовок Content-Range: bytes <начало>-<конец>/<размер>')
+    start, end, total = int(match['start']), int(match['end']), int(match['total'])
+    if total != upload.size or end < start or end >= total:
+        raise ChunkError('Content-Range не соответствует размеру загрузки', status=416)
+    if end - start + 1 != length:
+        raise ChunkError('Длина тела не совпадает с Content-Range')
+    if length > settings.IMAGE_UPLOADS['MAX_CHUNK_SIZE']:
+        raise ChunkError(f'Часть больше {settings.IMAGE_UPLOADS["MAX_CHUNK_SIZE"]} байт', status=413)
+    return start, end
+
+
+def write_chunk(upload, stream, start, end):
+    """
+    Write the chunk [start, end] read from `stream` to the staging file.
+
+    Chunks must come in order: a chunk starting at `received` is appended, a chunk
+    already received is ignored (a retry after a lost response), anything else is
+    rejected with the offset to resume from. The last chunk queues the assembly.
+    """
+
+    if upload.status != 'RECEIVING' or end < upload.received:
+        return upload
+    if start != upload.received:
+        raise ChunkError(f'Ожидается часть с позиции {upload.received}', status=409)
+
+    path = staging_path(upload)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'r+b' if os.path.exists(path) else 'wb') as f:
+        f.seek(start)
+        remaining = end - start + 1
+        while remaining:
+            data = stream.read(min(COPY_SIZE, remaining))
+            if not data:
+                raise ChunkError('Тело запроса короче Content-Range')
+            f.write(data)
+            remaining -= len(data)
+        f.truncate()
+
+    received = end + 1
+    with transaction.atomic():
+        # The offset check guards against a concurrent request for the same chunk
+        updated = ImageUpload.objects.filter(id=upload.id, status='RECEIVING', received=start).update(
+            received=received, status='ASSEMBLING' if received == upload.size else 'RECEIVING',
+            updated_at=timezone.now(),
+        )
+        if updated and received == upload.size:
+            enqueue('sellers.assemble_upload', {'upload_id': str(upload.id)})
+    upload.refresh_from_db()
+    return upload
+
+
+def assemble(upload):
+    """Validate the staged file and store it, marking the upload READY or FAILED."""
+
+    path = staging_path(upload)
+    try:
+        if os.path.getsize(path) != upload.size:
+            raise ValueError('Размер файла не совпадает с заявленным')
+        try:
+            with Image.open(path) as image:
+                image_format = image.format
+                image.verify()
+        except Exception:
+            raise ValueError('Файл не является изображением')
+        if image_format not in IMAGE_FORMATS:
+            raise ValueError(f'Формат {image_format} не поддерживается')
+        with open(path, 'rb') as f:
+            upload.file.save(upload.filename, File(f), save=False)
+        upload.status = 'READY'
+    except ValueError as exc:
+        upload.status = 'FAILED'
+        upload.error = str(exc)
+    except OSError as exc:
+        # E.g. the staging file is missing: STAGING_DIR is not shared with the workers
+        upload.status = 'FAILED'
+        upload.error = f'Не удалось прочитать загруженный файл: {exc.strerror or exc}'
+    finally:
+        # A failed upload can not be resumed, its chunks are not needed either way
+        if os.path.exists(path):
+            os.remove(path)
+    upload.save()
+
+
+def use_uploads(seller, data):
+    """
+    Replace the image1_upload..image3_upload tokens of validated product data
+    with the stored images, returns the errors of unknown or unfinished uploads.
+
+    The used uploads are deleted, the images stay referenced by the product.
+    """
+
+    tokens = {field.removesuffix('_upload'): data.pop(field) for field in list(data) if field.endswith('_upload')}
+    if not tokens:
+        return {}
+    uploads = {
+        upload.id: upload
+        for upload in ImageUpload.objects.filter(id__in=tokens.values(), seller=seller, status='READY')
+    }
+    errors = {f'{field}_upload': ['Загрузка не найдена или еще не готова'] for field, token in tokens.items()
+              if token not in uploads}
+    if errors:
+        return errors
+    for field, token in tokens.items():
+        data[field] = uploads[token].file.name
+    ImageUpload.objects.filter(id__in=uploads).delete()
+    return {}
+
+
+def purge_uploads():
+    """Delete uploads not finished or not used within IMAGE_UPLOADS['EXPIRE_HOURS'], with their staged chunks."""
+
+    cutoff = timezone.now() - timedelta(hours=settings.IMAGE_UPLOADS['EXPIRE_HOURS'])
+    for upload in ImageUpload.objects.filter(updated_at__lt=cutoff).iterator():
+        path = staging_path(upload)
+        if os.path.exists(path):
+            os.remove(path)
+        upload.delete()
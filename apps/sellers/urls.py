@@ -1,12 +1,26 @@
 from django.urls import path
 
 from apps.sellers.views import SellersView, SellerProductsView, SellerProductView, SellerOrdersView, \
-    SellerOrderItemsView
+    SellerOrderItemsView, SellerExportsView, SellerExportView, SellerExportFileView, SellerExportStreamView, \
+    ProductImportsView, ProductImportView, SellerProductsSyncView, ImageUploadsView, ImageUploadView, \
+    SellerAnalyticsView, SellerProductsAnalyticsView, SellerProductAnalyticsView
 
 urlpatterns = [
     path('', SellersView.as_view()),
     path("products/", SellerProductsView.as_view()),
+    path("products/sync/", SellerProductsSyncView.as_view()),
     path('product/<str:slug>/', SellerProductView.as_view()),
     path("orders/", SellerOrdersView.as_view()),
     path("orders/<str:tx_ref>/", SellerOrderItemsView.as_view()),
+    path("analytics/", SellerAnalyticsView.as_view()),
+    path("analytics/products/", SellerProductsAnalyticsView.as_view()),
+    path("analytics/products/<str:slug>/", SellerProductAnalyticsView.as_view()),
+    path("exports/", SellerExportsView.as_view()),
+    path("exports/<uuid:id>/", SellerExportView.as_view()),
+    path("exports/<uuid:id>/file/", SellerExportFileView.as_view(), name='seller-export-file'),
+    path("exports/<str:kind>/", SellerExportStreamView.as_view()),
+    path("imports/", ProductImportsView.as_view()),
+    path("imports/<uuid:id>/", ProductImportView.as_view()),
+    path("uploads/", ImageUploadsView.as_view()),
+    path("uploads/<uuid:id>/", ImageUploadView.as_view()),
 ]
@@ -1,14 +1,30 @@
-from drf_spectacular.utils import extend_schema
+from django.db import transaction
+from django.db.models import Avg, Q
+from django.http import StreamingHttpResponse
+from drf_spectacular.utils import extend_schema, OpenApiParameter, OpenApiTypes
+from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
+from apps.common.db import QueryBudget
+from apps.common.paginations import CreatedAtCursorPagination
+from apps.common.responses import aiter_sync, is_async_request, private_file_response, stream_json_list
 from apps.common.utils import set_dict_attr
 from apps.common.permissions import IsSeller
-from apps.profiles.models import Order, OrderItem
-from apps.sellers.models import Seller
-from apps.sellers.serializers import SellerSerializer
+from apps.profiles.models import OrderItem
+from apps.sellers.exports import CONTENT_TYPES, EXPORTS, file_name, iter_export, start_export
+from apps.sellers.imports import start_import
+from apps.sellers.models import Seller, SellerExport, ProductImport, ImageUpload, SellerOrder
+from apps.sellers.serializers import SellerSerializer, SellerExportSerializer, SellerExportQuerySerializer, \
+    ProductImportSerializer, ProductImportDetailSerializer, ProductDeltaSerializer, ImageUploadSerializer, \
+    SellerOrderSerializer, AnalyticsQuerySerializer, AnalyticsSerializer, ProductStatsSerializer
+from apps.sellers.analytics import daily_series, top_products
+from apps.sellers.storefront import adjust_storefront, remove_product
+from apps.sellers.sync import apply_product_deltas
+from apps.sellers.uploads import ChunkError, parse_content_range, use_uploads, write_chunk
+from apps.shop.cache import invalidate_products
 from apps.shop.models import Product, Category
-from apps.shop.serializers import ProductSerializer, CreateProductSerializer, OrderSerializer, \
+from apps.shop.serializers import ProductSerializer, CreateProductSerializer, \
     CheckItemOrderSerializer
 
 
@@ -18,6 +34,22 @@ tags = ['Sellers']
 
 class SellersView(APIView):
     serializer_class = SellerSerializer
+    permission_classes = [IsAuthenticated]
+
+    @extend_schema(
+        summary='Профиль продавца',
+        description="""
+        Этот эндпоинт возвращает профиль продавца текущего пользователя вместе со статистикой витрины:
+        количество товаров, средняя оценка и проданные единицы.
+        """,
+        tags=tags,
+    )
+    def get(self, request):
+        seller = Seller.objects.get_or_none(user=request.user)
+        if not seller:
+            return Response(data={"message": "Вы не подавали заявку на продавца"}, status=404)
+        serializer = self.serializer_class(seller)
+        return Response(data=serializer.data, status=200)
 
     @extend_schema(
         summary='Подайте заявку, чтобы стать продавцом',
@@ -55,14 +87,17 @@ class SellerProductsView(APIView):
         seller = Seller.objects.get_or_none(user=request.user, is_approved=True)
         if not seller:
             return Response(data={"message": "Доступ запрещен"}, status=403)
-        products = Product.objects.select_related("category", "seller", "seller__user").filter(seller=seller)
-        serializer = self.serializer_class(products, many=True)
-        return Response(data=serializer.data, status=200)
+        products = Product.objects.select_related("category", "seller", "seller__user").filter(seller=seller).annotate(
+            avg_rating=Avg("reviews__rating", filter=Q(reviews__is_deleted=False))
+        )
+        return stream_json_list(request, products, self.serializer_class)
 
     @extend_schema(
         summary="Создать продукт",
         description="""
             Этот эндпоинт позволяет продавцу создавать продукт.
+            Изображения передаются файлами image1-image3 или токенами image1_upload-image3_upload
+            готовых загрузок /sellers/uploads/.
         """,
         tags=tags,
         request=CreateProductSerializer,
@@ -81,13 +116,54 @@ class SellerProductsView(APIView):
                 return Response(data={"message": "Категория не существует!"}, status=404)
             data['category'] = category
             data['seller'] = seller
-            new_prod = Product.objects.create(**data)
+            with transaction.atomic():
+                errors = use_uploads(seller, data)
+                if errors:
+                    return Response(errors, status=400)
+                new_prod = Product.objects.create(**data)
+                adjust_storefront(seller.id, product_count=1)
             serializer = ProductSerializer(new_prod)
             return Response(serializer.data, status=201)
         else:
             return Response(serializer.errors, status=400)
 
 
+class SellerProductsSyncView(APIView):
+    serializer_class = ProductDeltaSerializer
+    permission_classes = [IsSeller]
+    query_budget = QueryBudget(queries=6, db_ms=1000)
+
+    @extend_schema(
+        summary="Синхронизация цен и остатков",
+        description="""
+            Этот эндпоинт применяет пакет изменений цены и остатков (до 1000 товаров) одним запросом.
+            Передайте список объектов {slug, price_current?, in_stock?}. При смене цены прошлая цена
+            сохраняется в price_old. Товары других продавцов и несуществующие slug попадают в not_found.
+        """,
+        tags=tags,
+        request=ProductDeltaSerializer(many=True),
+        responses={
+            200: {
+                "type": "object",
+                "properties": {
+                    "updated": {"type": "array", "items": {"type": "string"}},
+                    "not_found": {"type": "array", "items": {"type": "string"}},
+                }
+            }
+        },
+    )
+    def post(self, request, *args, **kwargs):
+        seller = Seller.objects.get_or_none(user=request.user, is_approved=True)
+        if not seller:
+            return Response(data={"message": "Доступ запрещен"}, status=403)
+        serializer = self.serializer_class(data=request.data, many=True, allow_empty=False, max_length=1000)
+        serializer.is_valid(raise_exception=True)
+        updated = apply_product_deltas(seller, serializer.validated_data)
+        updated_slugs = set(updated)
+        not_found = [delta["slug"] for delta in serializer.validated_data if delta["slug"] not in updated_slugs]
+        return Response(data={"updated": updated, "not_found": not_found}, status=200)
+
+
 class SellerProductView(APIView):
     serializer_class = CreateProductSerializer
     permission_classes = [IsSeller]
@@ -123,8 +199,13 @@ class SellerProductView(APIView):
             data['category'] = category
             if data['price_current'] != product.price_current:
                 data['price_old'] = product.price_current
-            product = set_dict_attr(product, data)
-            product.save()
+            with transaction.atomic():
+                errors = use_uploads(product.seller, data)
+                if errors:
+                    return Response(errors, status=400)
+                product = set_dict_attr(product, data)
+                product.save()
+            invalidate_products([product.slug])
             serializer = ProductSerializer(product)
             return Response(serializer.data, status=200)
         return Response(serializer.errors, status=400)
@@ -143,36 +224,45 @@ class SellerProductView(APIView):
         elif product.seller != request.user.seller:
             return Response(data={"message": "Доступ запрещен"}, status=403)
 
-        product.delete()
+        with transaction.atomic():
+            product.delete()
+            remove_product(product)
+        invalidate_products([product.slug])
         return Response(data={"message": "Товар успешно удален"}, status=200)
 
 
 class SellerOrdersView(APIView):
-    serializer_class = OrderSerializer
+    serializer_class = SellerOrderSerializer
+    paginator_class = CreatedAtCursorPagination
     permission_classes = [IsSeller]
 
     @extend_schema(
         operation_id="seller_orders_view",
         summary="Заказы продавца",
         description="""
-            Этот эндпоинт возвращает все заказы для конкретного продавца.
+            Этот эндпоинт возвращает заказы с товарами продавца, новые сначала, страницами по курсору
+            (ссылки next и previous). Сумма и количество - только по товарам этого продавца.
         """,
-        tags=tags
+        tags=tags,
+        parameters=[
+            OpenApiParameter(name="cursor", description="Курсор страницы из next/previous", required=False,
+                             type=OpenApiTypes.STR),
+            OpenApiParameter(name="page_size", description="Размер страницы, до 100", required=False,
+                             type=OpenApiTypes.INT),
+        ],
     )
     def get(self, request):
         seller = request.user.seller
-        orders = (
-            Order.objects.filter(orderitems__product__seller=seller)
-            .distinct()
-            .order_by("-created_at")
-        )
-        serializer = self.serializer_class(orders, many=True)
-        return Response(data=serializer.data, status=200)
-
+        seller_orders = SellerOrder.objects.filter(seller=seller).select_related("order", "order__user")
+        paginator = self.paginator_class()
+        page = paginator.paginate_queryset(seller_orders, request, view=self)
+        serializer = self.serializer_class(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
 
 
 class SellerOrderItemsView(APIView):
     serializer_class = CheckItemOrderSerializer
+    paginator_class = CreatedAtCursorPagination
     permission_classes = [IsSeller]
 
     @extend_schema(
@@ -180,16 +270,358 @@ class SellerOrderItemsView(APIView):
         summary="Заказ товара продавца",
         description="""
             Этот эндпоинт возвращает список элементов заказа (товаров для конкретного заказа), 
-            принадлежащего данному продавцу.
+            принадлежащего данному продавцу, страницами по курсору.
         """,
         tags=tags,
 
     )
     def get(self, request, **kwargs):
         seller = request.user.seller
-        order = Order.objects.get_or_none(tx_ref=kwargs["tx_ref"])
-        if not order:
+        seller_order = SellerOrder.objects.get_or_none(order__tx_ref=kwargs["tx_ref"], seller=seller)
+        if not seller_order:
             return Response(data={"message": "Заказа не существует!"}, status=404)
-        order_items = OrderItem.objects.filter(order=order, product__seller=seller)
-        serializer = self.serializer_class(order_items, many=True)
+        order_items = (
+            OrderItem.objects.filter(order_id=seller_order.order_id, product__seller=seller)
+            .select_related("product", "product__category", "product__seller", "product__seller__user")
+            .annotate(avg_rating=Avg("product__reviews__rating", filter=Q(product__reviews__is_deleted=False)))
+        )
+        paginator = self.paginator_class()
+        page = paginator.paginate_queryset(order_items, request, view=self)
+        for item in page:
+            # ProductSerializer reads the rating annotated on the product
+            item.product.avg_rating = item.avg_rating
+        serializer = self.serializer_class(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
+
+
+ANALYTICS_PARAMETERS = [
+    OpenApiParameter(name="date_from", description="Дата начала (YYYY-MM-DD), по умолчанию 30 дней до date_to",
+                     required=False, type=OpenApiTypes.DATE),
+    OpenApiParameter(name="date_to", description="Дата окончания (YYYY-MM-DD), по умолчанию сегодня",
+                     required=False, type=OpenApiTypes.DATE),
+]
+
+
+class SellerAnalyticsView(APIView):
+    serializer_class = AnalyticsSerializer
+    permission_classes = [IsSeller]
+    query_budget = QueryBudget(queries=4, db_ms=300)
+
+    @extend_schema(
+        summary="Аналитика продаж продавца",
+        description="""
+            Этот эндпоинт возвращает продажи продавца по дням за период до 366 дней: заказы, единицы товаров,
+            выручку и средняя оценка новых отзывов, и итоги за период. Данные берутся из дневных сводок,
+            которые обновляются в фоне после заказа и смены статуса оплаты.
+        """,
+        tags=tags,
+        parameters=ANALYTICS_PARAMETERS,
+    )
+    def get(self, request):
+        query = AnalyticsQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        data = query.validated_data
+        stats = daily_series(request.user.seller.daily_stats.all(), data["date_from"], data["date_to"])
+        return Response(data=self.serializer_class(stats).data, status=200)
+
+
+class SellerProductsAnalyticsView(APIView):
+    serializer_class = ProductStatsSerializer
+    permission_classes = [IsSeller]
+    query_budget = QueryBudget(queries=4, db_ms=500)
+
+    @extend_schema(
+        summary="Аналитика товаров продавца",
+        description="""
+            Этот эндпоинт возвращает товары продавца с наибольшей выручкой за период и их итоги.
+        """,
+        tags=tags,
+        parameters=[
+            *ANALYTICS_PARAMETERS,
+            OpenApiParameter(name="limit", description="Количество товаров, до 100", required=False,
+                             type=OpenApiTypes.INT),
+        ],
+    )
+    def get(self, request):
+        query = AnalyticsQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        data = query.validated_data
+        products = top_products(request.user.seller, data["date_from"], data["date_to"], data["limit"])
+        return Response(data=self.serializer_class(products, many=True).data, status=200)
+
+
+class SellerProductAnalyticsView(APIView):
+    serializer_class = AnalyticsSerializer
+    permission_classes = [IsSeller]
+    query_budget = QueryBudget(queries=5, db_ms=300)
+
+    @extend_schema(
+        summary="Аналитика товара продавца",
+        description="""
+            Этот эндпоинт возвращает продажи и отзывы товара продавца по дням за период до 366 дней и итоги.
+        """,
+        tags=tags,
+        parameters=ANALYTICS_PARAMETERS,
+    )
+    def get(self, request, **kwargs):
+        product = Product.objects.only("id").get_or_none(slug=kwargs["slug"], seller=request.user.seller)
+        if not product:
+            return Response(data={"message": "Товар не существует!"}, status=404)
+        query = AnalyticsQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        data = query.validated_data
+        stats = daily_series(product.daily_stats.all(), data["date_from"], data["date_to"])
+        return Response(data=self.serializer_class(stats).data, status=200)
+
+
+class SellerExportStreamView(APIView):
+    serializer_class = SellerExportQuerySerializer
+    permission_classes = [IsSeller]
+
+    @extend_schema(
+        operation_id="seller_export_stream",
+        summary="Выгрузка продавца (поток)",
+        description="""
+            Этот эндпоинт отдает выгрузку заказов (orders), позиций заказов (order_items) или товаров (products)
+            продавца в CSV или JSONL потоком, без загрузки всех строк в память.
+            Для больших выгрузок используйте фоновую выгрузку.
+        """,
+        tags=tags,
+        parameters=[
+            OpenApiParameter(name='file_format', description='csv или jsonl', required=False, type=OpenApiTypes.STR),
+            OpenApiParameter(name='date_from', description='Дата начала (YYYY-MM-DD)', required=False,
+                             type=OpenApiTypes.DATE),
+            OpenApiParameter(name='date_to', description='Дата окончания (YYYY-MM-DD)', required=False,
+                             type=OpenApiTypes.DATE),
+        ],
+        responses={200: OpenApiTypes.BINARY},
+    )
+    def get(self, request, **kwargs):
+        seller = Seller.objects.get_or_none(user=request.user, is_approved=True)
+        if not seller:
+            return Response(data={"message": "Доступ запрещен"}, status=403)
+        kind = kwargs["kind"]
+        if kind not in EXPORTS:
+            return Response(data={"message": "Неизвестный тип выгрузки"}, status=404)
+        serializer = self.serializer_class(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+
+        content = iter_export(seller, kind, data["file_format"], data.get("date_from"), data.get("date_to"))
+        if is_async_request(request):
+            content = aiter_sync(content)
+        response = StreamingHttpResponse(content, content_type=CONTENT_TYPES[data["file_format"]])
+        response["Content-Disposition"] = f'attachment; filename="{file_name(kind, data["file_format"], seller)}"'
+        return response
+
+
+class SellerExportsView(APIView):
+    serializer_class = SellerExportSerializer
+    permission_classes = [IsSeller]
+
+    @extend_schema(
+        summary="Фоновые выгрузки продавца",
+        description="""
+            Этот эндпоинт возвращает фоновые выгрузки продавца.
+        """,
+        tags=tags,
+    )
+    def get(self, request):
+        seller = Seller.objects.get_or_none(user=request.user, is_approved=True)
+        if not seller:
+            return Response(data={"message": "Доступ запрещен"}, status=403)
+        exports = SellerExport.objects.filter(seller=seller)
+        serializer = self.serializer_class(exports, many=True)
+        return Response(data=serializer.data, status=200)
+
+    @extend_schema(
+        summary="Запустить фоновую выгрузку",
+        description="""
+            Этот эндпоинт запускает выгрузку заказов, позиций заказов или товаров в фоне.
+            Когда статус станет SUCCESS, файл можно скачать по ссылке из поля file.
+        """,
+        tags=tags,
+    )
+    def post(self, request):
+        seller = Seller.objects.get_or_none(user=request.user, is_approved=True)
+        if not seller:
+            return Response(data={"message": "Доступ запрещен"}, status=403)
+        serializer = self.serializer_class(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        export = SellerExport.objects.create(seller=seller, **serializer.validated_data)
+        start_export(export)
+        serializer = self.serializer_class(export)
+        return Response(data=serializer.data, status=202)
+
+
+class SellerExportView(APIView):
+    serializer_class = SellerExportSerializer
+    permission_classes = [IsSeller]
+
+    @extend_schema(
+        summary="Статус фоновой выгрузки",
+        description="""
+            Этот эндпоинт возвращает статус фоновой выгрузки и ссылку на файл.
+        """,
+        tags=tags,
+    )
+    def get(self, request, **kwargs):
+        export = SellerExport.objects.get_or_none(id=kwargs["id"], seller__user=request.user)
+        if not export:
+            return Response(data={"message": "Выгрузка не существует!"}, status=404)
+        serializer = self.serializer_class(export)
+        return Response(data=serializer.data, status=200)
+
+
+class SellerExportFileView(APIView):
+    permission_classes = [IsSeller]
+
+    @extend_schema(
+        summary="Скачать файл фоновой выгрузки",
+        description="""
+            Этот эндпоинт отдает файл готовой фоновой выгрузки. Файл содержит данные покупателей
+            и доступен только продавцу, которому принадлежит выгрузка.
+        """,
+        tags=tags,
+        responses={200: OpenApiTypes.BINARY},
+    )
+    def get(self, request, **kwargs):
+        export = SellerExport.objects.get_or_none(id=kwargs["id"], seller__user=request.user)
+        if not export or not export.file:
+            return Response(data={"message": "Выгрузка не существует!"}, status=404)
+        return private_file_response(export.file)
+
+
+class ProductImportsView(APIView):
+    serializer_class = ProductImportSerializer
+    permission_classes = [IsSeller]
+
+    @extend_schema(
+        summary="Импорты каталога продавца",
+        description="""
+            Этот эндпоинт возвращает импорты каталога продавца.
+        """,
+        tags=tags,
+    )
+    def get(self, request):
+        seller = Seller.objects.get_or_none(user=request.user, is_approved=True)
+        if not seller:
+            return Response(data={"message": "Доступ запрещен"}, status=403)
+        imports = ProductImport.objects.filter(seller=seller)
+        serializer = self.serializer_class(imports, many=True)
         return Response(data=serializer.data, status=200)
+
+    @extend_schema(
+        summary="Массовый импорт товаров",
+        description="""
+            Этот эндпоинт запускает фоновый импорт товаров из CSV или JSONL.
+            Колонки: name, desc, price_current, price_old, category_slug, in_stock, image1, image2, image3.
+            Изображения задаются URL или путем к файлу в загруженном ZIP-архиве (archive).
+            Ход импорта и отчет об ошибках по строкам доступны по id импорта.
+        """,
+        tags=tags,
+        request={"multipart/form-data": ProductImportSerializer},
+    )
+    def post(self, request):
+        seller = Seller.objects.get_or_none(user=request.user, is_approved=True)
+        if not seller:
+            return Response(data={"message": "Доступ запрещен"}, status=403)
+        serializer = self.serializer_class(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        product_import = ProductImport.objects.create(seller=seller, **serializer.validated_data)
+        start_import(product_import)
+        serializer = self.serializer_class(product_import)
+        return Response(data=serializer.data, status=202)
+
+
+class ProductImportView(APIView):
+    serializer_class = ProductImportDetailSerializer
+    permission_classes = [IsSeller]
+
+    @extend_schema(
+        summary="Статус импорта каталога",
+        description="""
+            Этот эндпоинт возвращает ход импорта и отчет об ошибках по строкам.
+        """,
+        tags=tags,
+    )
+    def get(self, request, **kwargs):
+        product_import = ProductImport.objects.get_or_none(id=kwargs["id"], seller__user=request.user)
+        if not product_import:
+            return Response(data={"message": "Импорт не существует!"}, status=404)
+        serializer = self.serializer_class(product_import)
+        return Response(data=serializer.data, status=200)
+
+
+class ImageUploadsView(APIView):
+    serializer_class = ImageUploadSerializer
+    permission_classes = [IsSeller]
+
+    @extend_schema(
+        summary="Начать загрузку изображения",
+        description="""
+            Этот эндпоинт создает возобновляемую загрузку изображения товара и возвращает ее токен (id).
+            Затем файл отправляется частями PUT /sellers/uploads/<id>/ с заголовком
+            Content-Range: bytes <начало>-<конец>/<размер> и телом application/octet-stream.
+            После последней части изображение проверяется в фоне, готовый токен передается в
+            image1_upload-image3_upload при создании или изменении товара.
+        """,
+        tags=tags,
+    )
+    def post(self, request):
+        seller = Seller.objects.get_or_none(user=request.user, is_approved=True)
+        if not seller:
+            return Response(data={"message": "Доступ запрещен"}, status=403)
+        serializer = self.serializer_class(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        upload = ImageUpload.objects.create(seller=seller, **serializer.validated_data)
+        serializer = self.serializer_class(upload)
+        return Response(data=serializer.data, status=201)
+
+
+class ImageUploadView(APIView):
+    serializer_class = ImageUploadSerializer
+    permission_classes = [IsSeller]
+
+    def get_object(self, id):
+        return ImageUpload.objects.get_or_none(id=id, seller__user=self.request.user)
+
+    @extend_schema(
+        summary="Статус загрузки изображения",
+        description="""
+            Этот эндпоинт возвращает статус загрузки и число принятых байт (received),
+            с этой позиции загрузку можно продолжить после обрыва связи.
+        """,
+        tags=tags,
+    )
+    def get(self, request, **kwargs):
+        upload = self.get_object(kwargs["id"])
+        if not upload:
+            return Response(data={"message": "Загрузка не существует!"}, status=404)
+        serializer = self.serializer_class(upload)
+        return Response(data=serializer.data, status=200)
+
+    @extend_schema(
+        summary="Загрузка части изображения",
+        description="""
+            Этот эндпоинт принимает часть файла, указанную в Content-Range. Части отправляются по порядку,
+            повтор уже принятой части игнорируется, на часть не с той позиции возвращается 409 с received.
+            После последней части статус меняется на ASSEMBLING, затем READY или FAILED.
+        """,
+        tags=tags,
+        request={"application/octet-stream": {"type": "string", "format": "binary"}},
+        responses=ImageUploadSerializer,
+    )
+    def put(self, request, **kwargs):
+        upload = self.get_object(kwargs["id"])
+        if not upload:
+            return Response(data={"message": "Загрузка не существует!"}, status=404)
+        try:
+            length = int(request.META.get("CONTENT_LENGTH") or 0)
+            start, end = parse_content_range(request.META.get("HTTP_CONTENT_RANGE"), upload, length)
+            # The body is copied to disk from the stream, never read into memory at once
+            upload = write_chunk(upload, request.stream, start, end)
+        except ChunkError as exc:
+            return Response(data={"message": str(exc), "received": upload.received}, status=exc.status)
+        serializer = self.serializer_class(upload)
+        return Response(data=serializer.data, status=202 if upload.status != "RECEIVING" else 200)
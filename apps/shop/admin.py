@@ -1,6 +1,6 @@
 from django.contrib import admin
 
-from .models import Category, Product
+from .models import Category, Product, ProductTrend, RelatedProduct, SimilarProduct
 
 
 
@@ -12,4 +12,29 @@ class CategoryAdmin(admin.ModelAdmin):
 
 @admin.register(Product)
 class ProductAdmin(admin.ModelAdmin):
-    pass
+    list_display = ('name', 'seller', 'price_current', 'in_stock', 'view_count', 'cart_add_count')
+    list_select_related = ('seller',)
+
+
+
+@admin.register(RelatedProduct)
+class RelatedProductAdmin(admin.ModelAdmin):
+    list_display = ('product', 'rank', 'related', 'count')
+    list_select_related = ('product', 'related')
+    raw_id_fields = ('product', 'related')
+
+
+
+@admin.register(SimilarProduct)
+class SimilarProductAdmin(admin.ModelAdmin):
+    list_display = ('product', 'rank', 'similar', 'score')
+    list_select_related = ('product', 'similar')
+    raw_id_fields = ('product', 'similar')
+
+
+
+@admin.register(ProductTrend)
+class ProductTrendAdmin(admin.ModelAdmin):
+    list_display = ('product', 'category', 'score')
+    list_select_related = ('product', 'category')
+    raw_id_fields = ('product',)
@@ -0,0 +1,36 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+
+# Backends local to a process: an invalidation would not reach the other workers
+LOCAL_BACKENDS = ('django.core.cache.backends.locmem.LocMemCache',)
+
+
+def product_cache_key(slug):
+    return f'shop:product:{slug}'
+
+
+def get_cached_product(slug):
+    if not settings.PRODUCT_CACHE_TIMEOUT:
+        return None
+    return cache.get(product_cache_key(slug))
+
+
+def cache_product(slug, data):
+    if settings.PRODUCT_CACHE_TIMEOUT:
+        cache.set(product_cache_key(slug), data, settings.PRODUCT_CACHE_TIMEOUT)
+
+
+def invalidate_products(slugs):
+    """
+    Drop the cached data of the given products only, right away and again once the
+    current transaction commits: a request reading the product before the commit
+    may have cached the old data in between.
+    """
+
+    keys = [product_cache_key(slug) for slug in slugs]
+    if not keys or not settings.PRODUCT_CACHE_TIMEOUT:
+        return
+    cache.delete_many(keys)
+    transaction.on_commit(lambda: cache.delete_many(keys))
@@ -0,0 +1,16 @@
+from django.conf import settings
+from django.core.checks import Error, register
+
+from apps.shop.cache import LOCAL_BACKENDS
+
+
+@register()
+def check_product_cache(app_configs, **kwargs):
+    if settings.PRODUCT_CACHE_TIMEOUT and settings.CACHES['default']['BACKEND'] in LOCAL_BACKENDS:
+        return [Error(
+            'PRODUCT_CACHE_TIMEOUT requires a cache shared by all processes.',
+            hint='Set CACHE_BACKEND (e.g. django.core.cache.backends.redis.RedisCache) and CACHE_LOCATION, '
+                 'or PRODUCT_CACHE_TIMEOUT=0.',
+            id='shop.E001',
+        )]
+    return []
@@ -0,0 +1,6 @@
+from apps.common.counters import counter
+from apps.shop.models import Product
+
+
+product_views = counter('shop.product_views', Product, 'view_count', key='slug')
+product_cart_adds = counter('shop.product_cart_adds', Product, 'cart_add_count')
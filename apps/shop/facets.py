@@ -0,0 +1,90 @@
+import hashlib
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import F
+
+
+RATING_BUCKETS = (4, 3, 2, 1)
+
+
+def facets_cache_key(filterset):
+    """Cache key of the facets of a filter: same filters in any order or spelling share it."""
+
+    params = sorted(
+        # Decimal('5') and Decimal('5.0') are equal but print differently
+        (name, str(value.normalize() if isinstance(value, Decimal) else value))
+        for name, value in filterset.form.cleaned_data.items()
+        if value not in (None, '', []) and name != 'ordering'
+    )
+    digest = hashlib.md5(repr(params).encode()).hexdigest()
+    return f'shop:facets:{digest}'
+
+
+def get_facets(filterset):
+    """Facet counts of the products matched by a valid ProductFilter, cached per normalized filter."""
+
+    key = facets_cache_key(filterset)
+    facets = cache.get(key)
+    if facets is None:
+        facets = count_facets(filterset.qs)
+        cache.set(key, facets, settings.PRODUCT_FACETS['CACHE_TIMEOUT'])
+    return facets
+
+
+def count_facets(products):
+    """
+    Count the products of a queryset per category, price range, rating and stock in one query.
+
+    The filtered queryset (with its avg_rating annotation) becomes a subquery,
+    grouped by the combination of the four facets; the combinations are few, so
+    they are summed per facet here instead of running a COUNT per facet value.
+    """
+
+    bounds = settings.PRODUCT_FACETS['PRICE_BUCKETS']
+    inner = products.order_by().annotate(
+        facet_category=F('category__slug'), facet_category_name=F('category__name'),
+        facet_price=F('price_current'), facet_in_stock=F('in_stock'),
+    ).values('facet_category', 'facet_category_name', 'facet_price', 'facet_in_stock', 'avg_rating')
+    inner_sql, inner_params = inner.query.sql_with_params()
+
+    price_bucket = ' '.join(f'WHEN p.facet_price < %s THEN {i}' for i in range(len(bounds)))
+    rating_bucket = ' '.join(f'WHEN p.avg_rating >= {rating} THEN {rating}' for rating in RATING_BUCKETS)
+    sql = f"""
+        SELECT p.facet_category, p.facet_category_name, price_bucket, rating_bucket, in_stock, COUNT(*)
+        FROM (
+            SELECT p.facet_category, p.facet_category_name,
+                CASE {price_bucket} ELSE {len(bounds)} END AS price_bucket,
+                CASE {rating_bucket} ELSE 0 END AS rating_bucket,
+                CASE WHEN p.facet_in_stock > 0 THEN 1 ELSE 0 END AS in_stock
+            FROM ({inner_sql}) AS p
+        ) AS p
+        GROUP BY p.facet_category, p.facet_category_name, price_bucket, rating_bucket, in_stock
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [*bounds, *inner_params])
+        rows = cursor.fetchall()
+
+    categories = {}
+    prices = [0] * (len(bounds) + 1)
+    ratings = dict.fromkeys(RATING_BUCKETS, 0)
+    stock = {True: 0, False: 0}
+    for slug, name, price, rating, in_stock, count in rows:
+        category = categories.setdefault(slug, {'slug': slug, 'name': name, 'count': 0})
+        category['count'] += count
+        prices[price] += count
+        # Rating buckets are "at least N", like the min_rating filter
+        for bucket in RATING_BUCKETS:
+            if rating >= bucket:
+                ratings[bucket] += count
+        stock[bool(in_stock)] += count
+
+    edges = [None, *(Decimal(bound) for bound in bounds), None]
+    return {
+        'category': sorted(categories.values(), key=lambda c: (-c['count'], c['slug'])),
+        'price': [{'min': edges[i], 'max': edges[i + 1], 'count': count} for i, count in enumerate(prices)],
+        'rating': [{'min': bucket, 'count': ratings[bucket]} for bucket in RATING_BUCKETS],
+        'in_stock': [{'value': value, 'count': stock[value]} for value in (True, False)],
+    }
@@ -1,20 +1,39 @@
 import django_filters
 from django.contrib.postgres.search import TrigramSimilarity
+from django.db.models import F
 
 from .models import Product
 
 
+class ProductOrderingFilter(django_filters.OrderingFilter):
+    """Ordering with products without a value last and ties by id, as the catalog snapshot sorts."""
+
+    def filter(self, qs, value):
+        if not value:
+            return qs
+        ordering = []
+        for param in value:
+            field = F(self.param_map[param.lstrip('-')])
+            ordering.append(field.desc(nulls_last=True) if param.startswith('-') else field.asc(nulls_last=True))
+        return qs.order_by(*ordering, '-id')
+
 
 class ProductFilter(django_filters.FilterSet):
     max_price = django_filters.NumberFilter(field_name='price_current', lookup_expr='lte')
     min_price = django_filters.NumberFilter(field_name='price_current', lookup_expr='gte')
     in_stock = django_filters.NumberFilter(lookup_expr='gte')
     name = django_filters.CharFilter(field_name='name', method='filter_name_trigram')
+    category = django_filters.CharFilter(field_name='category__slug')
+    # avg_rating is annotated by the views listing products
+    min_rating = django_filters.NumberFilter(field_name='avg_rating', lookup_expr='gte')
+    seller = django_filters.CharFilter(field_name='seller__slug')
+    ordering = ProductOrderingFilter(fields=(('price_current', 'price'), ('created_at', 'created_at'),
+                                             ('avg_rating', 'rating')))
     # created_at = django_filters.DateTimeFilter(lookup_expr='gte')
 
     class Meta:
         model = Product
-        fields = ['max_price', 'min_price', 'in_stock', 'name',]
+        fields = ['max_price', 'min_price', 'in_stock', 'name', 'category', 'min_rating', 'seller', 'ordering']
 
     def filter_name_trigram(self, queryset, name, value):
         if value:
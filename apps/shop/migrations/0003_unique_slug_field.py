@@ -0,0 +1,40 @@
+# Generated by Django 5.2.8 on 2026-10-19 08:29
+
+import apps.common.fields
+from django.db import migrations
+
+from apps.common.fields import register_slugs
+
+
+def register_existing_slugs(apps, schema_editor):
+    using = schema_editor.connection.alias
+    for model_name in ('category', 'product'):
+        model = apps.get_model('shop', model_name)
+        slugs = model.objects.using(using).values_list('slug', flat=True).iterator(chunk_size=10_000)
+        register_slugs(f'shop.{model_name}.slug', slugs, using)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0001_initial'),
+        ('common', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='product',
+            options={'ordering': ['-id']},
+        ),
+        migrations.AlterField(
+            model_name='category',
+            name='slug',
+            field=apps.common.fields.UniqueSlugField(always_update=True, populate_from='name'),
+        ),
+        migrations.AlterField(
+            model_name='product',
+            name='slug',
+            field=apps.common.fields.UniqueSlugField(populate_from='name'),
+        ),
+        migrations.RunPython(register_existing_slugs, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.2.8 on 2026-10-19 08:37
+
+import apps.common.fields
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0003_unique_slug_field'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='image_variants',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='image_variants',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+        migrations.AlterField(
+            model_name='category',
+            name='image',
+            field=apps.common.fields.VariantImageField(upload_to='category_images/'),
+        ),
+        migrations.AlterField(
+            model_name='product',
+            name='image1',
+            field=apps.common.fields.VariantImageField(upload_to='product_images/'),
+        ),
+        migrations.AlterField(
+            model_name='product',
+            name='image2',
+            field=apps.common.fields.VariantImageField(blank=True, upload_to='product_images/'),
+        ),
+        migrations.AlterField(
+            model_name='product',
+            name='image3',
+            field=apps.common.fields.VariantImageField(blank=True, upload_to='product_images/'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-19 08:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sellers', '0008_storefront_counters'),
+        ('shop', '0004_image_variants'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['updated_at'], name='product_updated_idx'),
+        ),
+    ]
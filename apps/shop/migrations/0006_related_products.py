@@ -0,0 +1,39 @@
+# Generated by Django 5.2.8 on 2026-10-19 09:03
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0005_product_updated_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductPair',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('other', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='shop.product')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='shop.product')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('product', 'other'), name='product_pair_unique')],
+            },
+        ),
+        migrations.CreateModel(
+            name='RelatedProduct',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('rank', models.PositiveSmallIntegerField()),
+                ('count', models.PositiveIntegerField()),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='related_products', to='shop.product')),
+                ('related', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='shop.product')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('product', 'rank'), name='related_product_rank_unique')],
+            },
+        ),
+    ]
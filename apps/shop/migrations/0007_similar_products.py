@@ -0,0 +1,27 @@
+# Generated by Django 5.2.8 on 2026-10-19 09:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0006_related_products'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SimilarProduct',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('rank', models.PositiveSmallIntegerField()),
+                ('score', models.FloatField()),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='similar_products', to='shop.product')),
+                ('similar', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='shop.product')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('product', 'rank'), name='similar_product_rank_unique')],
+            },
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.8 on 2026-10-19 09:08
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0007_similar_products'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductTrend',
+            fields=[
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='trend', serialize=False, to='shop.product')),
+                ('score', models.FloatField(default=0)),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='shop.category')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['-score'], name='product_trend_score_idx'), models.Index(fields=['category', '-score'], name='product_trend_category_idx')],
+            },
+        ),
+    ]
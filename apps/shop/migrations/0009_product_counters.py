@@ -0,0 +1,23 @@
+# Generated by Django 5.2.8 on 2026-10-19 09:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0008_product_trend'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='cart_add_count',
+            field=models.PositiveBigIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='view_count',
+            field=models.PositiveBigIntegerField(default=0, editable=False),
+        ),
+    ]
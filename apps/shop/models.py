@@ -1,7 +1,6 @@
 from django.db import models
 
-from autoslug import AutoSlugField
-
+from apps.common.fields import UniqueSlugField, VariantImageField
 from apps.common.models import BaseModel, IsDeletedModel
 from apps.sellers.models import Seller
 
@@ -14,6 +13,7 @@ class Category(BaseModel):
         name (str): The category name, unique for each instance.
         slug (str): The slug generated from the name, used in URLs.
         image (ImageField): An image representing the category.
+        image_variants (JSONField): Resized variants of the image, see VariantImageField.
 
     Methods:
         __str__():
@@ -21,8 +21,9 @@ class Category(BaseModel):
     """
 
     name = models.CharField(max_length=100, unique=True)
-    slug = AutoSlugField(populate_from='name', unique=True, always_update=True)
-    image = models.ImageField(upload_to='category_images/')
+    slug = UniqueSlugField(populate_from='name', always_update=True)
+    image = VariantImageField(upload_to='category_images/')
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
 
     class Meta:
         verbose_name_plural = 'Categories'
@@ -47,11 +48,14 @@ class Product(IsDeletedModel):
         image1 (ImageField): The first image of the product.
         image2 (ImageField): The second image of the product.
         image3 (ImageField): The third image of the product.
+        image_variants (JSONField): Resized variants of the images, see VariantImageField.
+        view_count (int): Views of the product page, see apps.shop.counters.
+        cart_add_count (int): Times the product was added to a cart.
     """
 
     seller = models.ForeignKey(Seller, on_delete=models.SET_NULL, related_name='products', null=True)
     name = models.CharField(max_length=100)
-    slug = AutoSlugField(populate_from='name', unique=True, db_index=True)
+    slug = UniqueSlugField(populate_from='name')
     desc = models.TextField()
     price_old = models.DecimalField(max_digits=10, decimal_places=2, null=True)
     price_current = models.DecimalField(max_digits=10, decimal_places=2)
@@ -59,9 +63,127 @@ class Product(IsDeletedModel):
     in_stock = models.IntegerField(default=5)
 
     # only 3 images are allowed
-    image1 = models.ImageField(upload_to='product_images/')
-    image2 = models.ImageField(upload_to='product_images/', blank=True)
-    image3 = models.ImageField(upload_to='product_images/', blank=True)
+    image1 = VariantImageField(upload_to='product_images/')
+    image2 = VariantImageField(upload_to='product_images/', blank=True)
+    image3 = VariantImageField(upload_to='product_images/', blank=True)
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
+    # Written in batches by apps.shop.counters, a few seconds behind
+    view_count = models.PositiveBigIntegerField(default=0, editable=False)
+    cart_add_count = models.PositiveBigIntegerField(default=0, editable=False)
+
+    class Meta(IsDeletedModel.Meta):
+        indexes = [
+            # Changed products for the catalog snapshot, see apps.shop.snapshot
+            models.Index(fields=['updated_at'], name='product_updated_idx'),
+        ]
 
     def __str__(self):
         return self.name
+
+
+class ProductPair(models.Model):
+    """
+    Number of orders with both products, a cell of the co-occurrence matrix, see apps.shop.related.
+
+    Every pair is stored in both directions, so the neighbours of a product are
+    one index range.
+
+    Attributes:
+        product (ForeignKey): The product.
+        other (ForeignKey): A product ordered together with it.
+        count (int): Orders containing both.
+    """
+
+    id = models.BigAutoField(primary_key=True)
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    other = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'other'], name='product_pair_unique'),
+        ]
+
+    def __str__(self):
+        return f'{self.product_id} + {self.other_id}: {self.count}'
+
+
+class RelatedProduct(models.Model):
+    """
+    One of the top products bought together with a product, served by RelatedProductsView.
+
+    Attributes:
+        product (ForeignKey): The product.
+        related (ForeignKey): A product often ordered with it.
+        rank (int): Position in the recommendations, 1 is the most frequent.
+        count (int): Orders containing both.
+    """
+
+    id = models.BigAutoField(primary_key=True)
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='related_products')
+    related = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    rank = models.PositiveSmallIntegerField()
+    count = models.PositiveIntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'rank'], name='related_product_rank_unique'),
+        ]
+
+    def __str__(self):
+        return f'{self.product_id} #{self.rank}: {self.related_id}'
+
+
+class SimilarProduct(models.Model):
+    """
+    One of the products of the same category closest to a product by name and description,
+    see apps.shop.similar.
+
+    Attributes:
+        product (ForeignKey): The product.
+        similar (ForeignKey): A product with a similar text.
+        rank (int): Position in the list, 1 is the closest.
+        score (float): Cosine similarity of the TF-IDF vectors of both products.
+    """
+
+    id = models.BigAutoField(primary_key=True)
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='similar_products')
+    similar = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    rank = models.PositiveSmallIntegerField()
+    score = models.FloatField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'rank'], name='similar_product_rank_unique'),
+        ]
+
+    def __str__(self):
+        return f'{self.product_id} #{self.rank}: {self.similar_id}'
+
+
+class ProductTrend(models.Model):
+    """
+    Trending score of a product, see apps.shop.trending.
+
+    Every view, cart add, checkout and review adds its weight times 2 ** (t / half life)
+    (forward decay), so the order of the scores is the order of the decayed activity
+    without rewriting the rows as time passes.
+
+    Attributes:
+        product (OneToOneField): The product.
+        category (ForeignKey): Category of the product, for the per category leaderboards.
+        score (float): Sum of the weighted events, relative to the landmark time.
+    """
+
+    product = models.OneToOneField(Product, on_delete=models.CASCADE, primary_key=True, related_name='trend')
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='+')
+    score = models.FloatField(default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-score'], name='product_trend_score_idx'),
+            models.Index(fields=['category', '-score'], name='product_trend_category_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.product_id}: {self.score}'
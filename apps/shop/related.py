@@ -0,0 +1,177 @@
+from datetime import timedelta
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
+from django.utils import timezone
+
+from apps.common.models import Checkpoint
+from apps.common.utils import batched
+from apps.profiles.models import Order, OrderItem
+from apps.shop.models import Product, ProductPair, RelatedProduct
+
+
+CHECKPOINT = 'shop.related_products'
+
+
+def related_cache_key(slug):
+    return f'shop:related:{slug}'
+
+
+def invalidate_related(slugs):
+    cache.delete_many([related_cache_key(slug) for slug in slugs])
+
+
+def cooccurrence(order_codes, product_codes, max_items):
+    """
+    Pairs of products ordered together and the number of orders of each pair.
+
+    Args:
+        order_codes (ndarray): Order of every (order, product) row, rows of an order adjacent.
+        product_codes (ndarray): Product of every row, distinct within an order.
+        max_items (int): Bigger orders are left out, they pair everything with everything.
+
+    Returns:
+        (products, others, counts): The non-zero cells of the sparse co-occurrence
+        matrix, every pair in both directions.
+    """
+
+    starts = np.flatnonzero(np.r_[True, order_codes[1:] != order_codes[:-1]])
+    sizes = np.diff(np.r_[starts, len(order_codes)])
+    keep = (sizes > 1) & (sizes <= max_items)
+    starts, sizes = starts[keep], sizes[keep]
+    if not len(starts):
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty, empty
+
+    def ranges(starts, lengths):
+        # Concatenated arange(start, start + length) without a Python loop
+        return np.repeat(starts, lengths) + np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+
+    # Every row of a kept order paired with every row of the same order
+    rows = ranges(starts, sizes)
+    repeats = np.repeat(sizes, sizes)
+    left = np.repeat(rows, repeats)
+    right = ranges(np.repeat(starts, sizes), repeats)
+    distinct = left != right
+
+    size = np.int64(product_codes.max()) + 1
+    cells = product_codes[left[distinct]].astype(np.int64) * size + product_codes[right[distinct]]
+    cells, counts = np.unique(cells, return_counts=True)
+    return cells // size, cells % size, counts
+
+
+def add_pairs(pairs):
+    """Add `pairs` ((product_id, other_id, count) tuples) to ProductPair with INSERT ... ON CONFLICT."""
+
+    quote = connection.ops.quote_name
+    table = quote(ProductPair._meta.db_table)
+    columns = [ProductPair._meta.get_field(name) for name in ('product', 'other', 'count')]
+    for batch in batched(pairs, 1000):
+        params = []
+        for row in batch:
+            params.extend(field.get_db_prep_value(value, connection, prepared=False)
+                          for field, value in zip(columns, row))
+        placeholders = ', '.join(['(%s, %s, %s)'] * len(batch))
+        sql = (
+            f'INSERT INTO {table} ({", ".join(quote(field.column) for field in columns)}) VALUES {placeholders} '
+            f'ON CONFLICT ({quote("product_id")}, {quote("other_id")}) '
+            f'DO UPDATE SET {quote("count")} = {table}.{quote("count")} + EXCLUDED.{quote("count")}'
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+
+
+def rank_related(product_ids):
+    """Replace the stored recommendations of the given products with their current top pairs."""
+
+    top_k = settings.RELATED_PRODUCTS['TOP_K']
+    for batch in batched(product_ids, 500):
+        top = (
+            ProductPair.objects.filter(product__in=batch, other__is_deleted=False)
+            .annotate(rank=Window(RowNumber(), partition_by=F('product'), order_by=[F('count').desc(), F('other')]))
+            .filter(rank__lte=top_k)
+            .values_list('product', 'other', 'rank', 'count')
+        )
+        rows = [RelatedProduct(product_id=product, related_id=other, rank=rank, count=count)
+                for product, other, rank, count in top]
+        RelatedProduct.objects.filter(product__in=batch).delete()
+        RelatedProduct.objects.bulk_create(rows)
+
+
+def process_orders(date_from, date_to):
+    """
+    Count the products ordered together in the orders created in [date_from, date_to)
+    into ProductPair and re-rank the recommendations of the products involved.
+
+    Returns the ids of the products with new recommendations.
+    """
+
+    rows = (
+        OrderItem.objects.filter(order__created_at__gte=date_from, order__created_at__lt=date_to)
+        .order_by('order').values_list('order', 'product').distinct()
+    )
+    order_codes, product_codes, products = [], [], {}
+    orders = {}
+    for order_id, product_id in rows.iterator(chunk_size=5000):
+        order_codes.append(orders.setdefault(order_id, len(orders)))
+        product_codes.append(products.setdefault(product_id, len(products)))
+    if not products:
+        return []
+
+    codes, others, counts = cooccurrence(np.array(order_codes, dtype=np.int64), np.array(product_codes, dtype=np.int64),
+                                         settings.RELATED_PRODUCTS['MAX_ORDER_ITEMS'])
+    ids = list(products)
+    add_pairs([(ids[product], ids[other], int(count)) for product, other, count in zip(codes, others, counts)])
+    changed = [ids[product] for product in np.unique(codes)]
+    rank_related(changed)
+    return changed
+
+
+def update_related_products(date_to=None):
+    """
+    Process the orders created since the last run, a window of
+    RELATED_PRODUCTS['BATCH_DAYS'] per transaction, and return the number of
+    products with new recommendations.
+
+    The checkpoint row is locked while a window is processed, so concurrent runs
+    wait for each other and every order is counted once. Orders younger than
+    RELATED_PRODUCTS['SETTLE'] seconds are left for the next run: a checkout
+    committing late must not land behind the checkpoint.
+    """
+
+    config = settings.RELATED_PRODUCTS
+    if date_to is None:
+        date_to = timezone.now() - timedelta(seconds=config['SETTLE'])
+    Checkpoint.objects.get_or_create(name=CHECKPOINT)
+    updated = 0
+    while True:
+        with transaction.atomic():
+            checkpoint = Checkpoint.objects.select_for_update().get(name=CHECKPOINT)
+            date_from = checkpoint.position
+            if date_from is None:
+                first = Order.objects.order_by('created_at').values_list('created_at', flat=True).first()
+                if first is None:
+                    return updated
+                date_from = first
+            if date_from >= date_to:
+                return updated
+            window_end = min(date_from + timedelta(days=config['BATCH_DAYS']), date_to)
+            changed = process_orders(date_from, window_end)
+            checkpoint.position = window_end
+            checkpoint.save(update_fields=['position', 'updated_at'])
+            slugs = list(Product.objects.unfiltered().filter(id__in=changed).values_list('slug', flat=True))
+            transaction.on_commit(lambda slugs=slugs: invalidate_related(slugs))
+        updated += len(changed)
+
+
+def reset_related_products():
+    """Drop the counted pairs and recommendations, the next update counts every order again."""
+
+    with transaction.atomic():
+        Checkpoint.objects.filter(name=CHECKPOINT).delete()
+        ProductPair.objects.all().delete()
+        RelatedProduct.objects.all().delete()
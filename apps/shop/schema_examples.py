@@ -28,6 +28,36 @@ PRODUCT_PARAM_EXAMPLE = [
         required=False,
         type=OpenApiTypes.STR,
     ),
+    OpenApiParameter(
+        name="category",
+        description="Фильтровать товары по slug категории",
+        required=False,
+        type=OpenApiTypes.STR,
+    ),
+    OpenApiParameter(
+        name="min_rating",
+        description="Фильтровать товары по минимальной средней оценке",
+        required=False,
+        type=OpenApiTypes.NUMBER,
+    ),
+    OpenApiParameter(
+        name="seller",
+        description="Фильтровать товары по slug продавца",
+        required=False,
+        type=OpenApiTypes.STR,
+    ),
+    OpenApiParameter(
+        name="ordering",
+        description="Сортировка: price, created_at, rating, с минусом - по убыванию (-price)",
+        required=False,
+        type=OpenApiTypes.STR,
+    ),
+    OpenApiParameter(
+        name="facets",
+        description="1 - добавить в ответ количество товаров по категориям, ценам, оценкам и наличию (facets)",
+        required=False,
+        type=OpenApiTypes.BOOL,
+    ),
     OpenApiParameter(
         name="page",
         description="Получить определенную страницу. По умолчанию 1",
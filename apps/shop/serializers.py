@@ -2,6 +2,7 @@ from django.db.models import Avg
 from rest_framework import serializers
 from drf_spectacular.utils import extend_schema_field
 
+from apps.common.serializers import ImageVariantsField
 from apps.profiles.serializers import ShippingAddressSerializer
 
 
@@ -10,12 +11,17 @@ class CategorySerializer(serializers.Serializer):
     name = serializers.CharField()
     slug = serializers.SlugField(read_only=True)
     image = serializers.ImageField()
+    image_variants = ImageVariantsField('image')
 
 
 class SellerShopSerializer(serializers.Serializer):
     name = serializers.CharField(source='business_name')
     slug = serializers.SlugField()
     image = serializers.ImageField(source='user.avatar')
+    image_variants = ImageVariantsField('avatar', source='user')
+    product_count = serializers.IntegerField(help_text='Товары в продаже')
+    avg_rating = serializers.FloatField(allow_null=True, help_text='Средняя оценка по всем отзывам на товары')
+    units_sold = serializers.IntegerField(help_text='Продано единиц товаров')
 
 
 class ProductSerializer(serializers.Serializer):
@@ -31,8 +37,13 @@ class ProductSerializer(serializers.Serializer):
     image1 = serializers.ImageField()
     image2 = serializers.ImageField(required=False)
     image3 = serializers.ImageField(required=False)
+    image1_variants = ImageVariantsField('image1')
+    image2_variants = ImageVariantsField('image2')
+    image3_variants = ImageVariantsField('image3')
 
     def get_avg(self, product):
+        if hasattr(product, 'avg_rating'):
+            return product.avg_rating
         stats = product.reviews.filter(is_deleted=False).aggregate(
             avg=Avg('rating'),
             # total_count=Count('id')
@@ -40,28 +51,47 @@ class ProductSerializer(serializers.Serializer):
         return stats['avg']
 
 
+class ProductRelationsSerializer(serializers.Serializer):
+    """Seller and category of a product, serialized on every request: they change without the product."""
+
+    seller = SellerShopSerializer()
+    category = CategorySerializer()
+
+
 class CreateProductSerializer(serializers.Serializer):
     name = serializers.CharField(max_length=100)
     desc = serializers.CharField()
     price_current = serializers.DecimalField(max_digits=10, decimal_places=2)
     category_slug = serializers.SlugField()
     in_stock = serializers.IntegerField()
-    image1 = serializers.ImageField()
+    image1 = serializers.ImageField(required=False)
     image2 = serializers.ImageField(required=False)
     image3 = serializers.ImageField(required=False)
+    image1_upload = serializers.UUIDField(required=False, help_text='Токен загрузки вместо файла image1')
+    image2_upload = serializers.UUIDField(required=False, help_text='Токен загрузки вместо файла image2')
+    image3_upload = serializers.UUIDField(required=False, help_text='Токен загрузки вместо файла image3')
+
+    def validate(self, attrs):
+        for field in ('image1', 'image2', 'image3'):
+            if field in attrs and f'{field}_upload' in attrs:
+                raise serializers.ValidationError({field: 'Передайте либо файл, либо токен загрузки'})
+        if 'image1' not in attrs and 'image1_upload' not in attrs:
+            raise serializers.ValidationError({'image1': 'Обязательное поле.'})
+        return attrs
 
 
 class OrderItemProductSerializer(serializers.Serializer):
-    seller = SellerShopSerializer()
-    name = serializers.CharField()
-    slug = serializers.SlugField()
+    # Serializes an OrderItem: the price is the one of the order, not the current one
+    seller = SellerShopSerializer(source="product.seller")
+    name = serializers.CharField(source="product.name")
+    slug = serializers.SlugField(source="product.slug")
     price = serializers.DecimalField(
-        max_digits=10, decimal_places=2, source="price_current"
+        max_digits=10, decimal_places=2, source="unit_price"
     )
 
 
 class OrderItemSerializer(serializers.Serializer):
-    product = OrderItemProductSerializer()
+    product = OrderItemProductSerializer(source="*")
     quantity = serializers.IntegerField()
     total = serializers.DecimalField(max_digits=10, decimal_places=2, source="get_total")
 
@@ -101,3 +131,64 @@ class CheckItemOrderSerializer(serializers.Serializer):
     product = ProductSerializer()
     quantity = serializers.IntegerField()
     total = serializers.FloatField(source="get_total")
+
+
+class CategoryFacetSerializer(serializers.Serializer):
+    slug = serializers.SlugField()
+    name = serializers.CharField()
+    count = serializers.IntegerField()
+
+
+class PriceFacetSerializer(serializers.Serializer):
+    min = serializers.DecimalField(max_digits=10, decimal_places=2, allow_null=True, help_text='От, включительно')
+    max = serializers.DecimalField(max_digits=10, decimal_places=2, allow_null=True, help_text='До, не включая')
+    count = serializers.IntegerField()
+
+
+class RatingFacetSerializer(serializers.Serializer):
+    min = serializers.IntegerField(help_text='Средняя оценка не ниже')
+    count = serializers.IntegerField()
+
+
+class InStockFacetSerializer(serializers.Serializer):
+    value = serializers.BooleanField(help_text='Есть в наличии')
+    count = serializers.IntegerField()
+
+
+class ProductFacetsSerializer(serializers.Serializer):
+    category = CategoryFacetSerializer(many=True)
+    price = PriceFacetSerializer(many=True)
+    rating = RatingFacetSerializer(many=True)
+    in_stock = InStockFacetSerializer(many=True)
+
+
+class RelatedProductSerializer(serializers.Serializer):
+    name = serializers.CharField(source='related.name')
+    slug = serializers.SlugField(source='related.slug')
+    price_old = serializers.DecimalField(source='related.price_old', max_digits=10, decimal_places=2)
+    price_current = serializers.DecimalField(source='related.price_current', max_digits=10, decimal_places=2)
+    in_stock = serializers.IntegerField(source='related.in_stock')
+    image1 = serializers.ImageField(source='related.image1')
+    image1_variants = ImageVariantsField('image1', source='related')
+    count = serializers.IntegerField(help_text='Заказов с обоими товарами')
+
+
+class SimilarProductSerializer(serializers.Serializer):
+    name = serializers.CharField(source='similar.name')
+    slug = serializers.SlugField(source='similar.slug')
+    price_old = serializers.DecimalField(source='similar.price_old', max_digits=10, decimal_places=2)
+    price_current = serializers.DecimalField(source='similar.price_current', max_digits=10, decimal_places=2)
+    in_stock = serializers.IntegerField(source='similar.in_stock')
+    image1 = serializers.ImageField(source='similar.image1')
+    image1_variants = ImageVariantsField('image1', source='similar')
+    score = serializers.FloatField(help_text='Похожесть названия и описания, от 0 до 1')
+
+
+class TrendingProductSerializer(serializers.Serializer):
+    name = serializers.CharField(source='product.name')
+    slug = serializers.SlugField(source='product.slug')
+    price_old = serializers.DecimalField(source='product.price_old', max_digits=10, decimal_places=2)
+    price_current = serializers.DecimalField(source='product.price_current', max_digits=10, decimal_places=2)
+    in_stock = serializers.IntegerField(source='product.in_stock')
+    image1 = serializers.ImageField(source='product.image1')
+    image1_variants = ImageVariantsField('image1', source='product')
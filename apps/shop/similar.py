@@ -0,0 +1,231 @@
+import re
+import zlib
+from datetime import timedelta
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+from apps.common.models import Checkpoint
+from apps.shop.models import Product, SimilarProduct
+
+
+CHECKPOINT = 'shop.similar_products'
+# Products saved while a run reads them are read again by the next one
+OVERLAP = timedelta(minutes=1)
+TOKEN_RE = re.compile(r'\w{2,}')
+
+
+def similar_cache_key(slug):
+    return f'shop:similar:{slug}'
+
+
+def invalidate_similar(slugs):
+    cache.delete_many([similar_cache_key(slug) for slug in slugs])
+
+
+def token_columns(text, dimensions):
+    # crc32, unlike hash(), is the same in every process
+    return [zlib.crc32(token.encode()) % dimensions for token in TOKEN_RE.findall(text.lower())]
+
+
+def ranges(starts, lengths):
+    # Concatenated arange(start, start + length) without a Python loop
+    return np.repeat(starts, lengths) + np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+
+
+class TermVectors:
+    """
+    L2-normalized sparse rows in CSR form (indptr, indices, data) and the same
+    cells by term (the postings, CSC form), built with NumPy: SciPy is not a
+    dependency. A product has a few dozen words out of DIMENSIONS columns, so
+    memory is proportional to the words, not to products x DIMENSIONS.
+    """
+
+    def __init__(self, rows, columns, values, shape):
+        self.shape = shape
+        order = np.lexsort((columns, rows))
+        self.indices, self.data = columns[order], values[order]
+        self.indptr = np.r_[0, np.cumsum(np.bincount(rows, minlength=shape[0]))]
+        order = np.argsort(columns, kind='stable')
+        self.posting_rows, self.posting_data = rows[order], values[order]
+        self.postings = np.r_[0, np.cumsum(np.bincount(columns, minlength=shape[1]))]
+
+    def __len__(self):
+        return self.shape[0]
+
+    def scores(self, block):
+        """Dense (len(block), rows) matrix of the dot products of the `block` rows with every row."""
+
+        lengths = self.indptr[block + 1] - self.indptr[block]
+        cells = ranges(self.indptr[block], lengths)
+        owners = np.repeat(np.arange(len(block)), lengths)
+        # Every term of a block row meets the rows listing the same term
+        terms = self.indices[cells]
+        starts = self.postings[terms]
+        counts = self.postings[terms + 1] - starts
+        postings = ranges(starts, counts)
+        weights = np.repeat(self.data[cells], counts) * self.posting_data[postings]
+        targets = np.repeat(owners, counts) * len(self) + self.posting_rows[postings]
+        scores = np.bincount(targets, weights=weights, minlength=len(block) * len(self))
+        return scores.reshape(len(block), len(self)).astype(np.float32)
+
+
+def vectorize(products, dimensions):
+    """
+    L2-normalized TF-IDF vectors (TermVectors) of (name, desc) pairs over hashed words.
+
+    Words of the name count twice, term frequencies are sublinear (1 + log tf)
+    and the IDF is computed over the given products.
+    """
+
+    rows, columns = [], []
+    for row, (name, desc) in enumerate(products):
+        words = token_columns(name, dimensions) * 2 + token_columns(desc, dimensions)
+        rows.extend([row] * len(words))
+        columns.extend(words)
+    cells, counts = np.unique(np.array(rows, dtype=np.int64) * dimensions + np.array(columns, dtype=np.int64),
+                              return_counts=True)
+    rows, columns = cells // dimensions, cells % dimensions
+
+    # Cells are distinct, so the count of a column is the number of products with the word
+    idf = np.log((1 + len(products)) / (1 + np.bincount(columns, minlength=dimensions))) + 1
+    values = (1 + np.log(counts)) * idf[columns]
+    norms = np.sqrt(np.bincount(rows, weights=values ** 2, minlength=len(products)))
+    values = (values / norms[rows]).astype(np.float32)
+    return TermVectors(rows, columns, values, (len(products), dimensions))
+
+
+def nearest(vectors, rows, top_k, min_score):
+    """Yield (row, neighbour rows, scores, all scores of the row) for `rows`, by blocks of rows."""
+
+    block_size = settings.SIMILAR_PRODUCTS['BLOCK_SIZE']
+    k = min(top_k, len(vectors) - 1)
+    for start in range(0, len(rows), block_size):
+        block = rows[start:start + block_size]
+        # Rounded, so that equal texts tie whatever the block, ties go to the first row
+        scores = np.round(vectors.scores(block), 6)
+        scores[np.arange(len(block)), block] = -np.inf
+        kth = -np.partition(-scores, k - 1, axis=1)[:, k - 1] if k > 0 else np.full(len(block), np.inf)
+        for i, row in enumerate(block):
+            candidates = np.flatnonzero(scores[i] >= max(kth[i], min_score))
+            order = candidates[np.argsort(-scores[i, candidates], kind='stable')][:k]
+            yield row, order, scores[i, order], scores[i]
+
+
+def update_category(category_id, changed):
+    """
+    Recompute the neighbours of the affected products of a category and return their ids.
+
+    Args:
+        category_id: The category, neighbours are only searched within it.
+        changed (set): Ids of the products changed since the last run (of any
+            category), None to recompute the whole category.
+
+    Affected are the changed products, the products listing a changed one (its
+    text or category changed, or it was deleted) and the products a changed one
+    now beats the last neighbour of.
+    """
+
+    config = settings.SIMILAR_PRODUCTS
+    top_k, min_score = config['TOP_K'], config['MIN_SCORE']
+    products = list(Product.objects.filter(category_id=category_id).order_by('id').values_list('id', 'name', 'desc'))
+    ids = [product_id for product_id, _, _ in products]
+    if not products:
+        return []
+    vectors = vectorize([(name, desc) for _, name, desc in products], config['DIMENSIONS'])
+
+    if changed is None:
+        affected = set(range(len(ids)))
+        changed_rows = []
+    else:
+        index = {product_id: row for row, product_id in enumerate(ids)}
+        changed_rows = [index[product_id] for product_id in changed if product_id in index]
+        # Last kept score of every product, any score enters an incomplete list
+        threshold = np.full(len(ids), -np.inf, dtype=np.float32)
+        listed = {}
+        for product_id, similar_id, score in SimilarProduct.objects.filter(product__in=ids).values_list(
+                'product', 'similar', 'score'):
+            listed.setdefault(product_id, []).append((similar_id, score))
+        affected = set(changed_rows)
+        for product_id, neighbours in listed.items():
+            if any(similar_id in changed for similar_id, _ in neighbours):
+                affected.add(index[product_id])
+            elif len(neighbours) >= top_k:
+                threshold[index[product_id]] = min(score for _, score in neighbours)
+
+    results = {}
+    for row, neighbours, scores, all_scores in nearest(vectors, np.array(changed_rows, dtype=np.intp), top_k, min_score):
+        results[row] = (neighbours, scores)
+        # Similarity is symmetric: the row of a changed product is also its column
+        beaten = np.flatnonzero((all_scores >= min_score) & (all_scores >= threshold))
+        affected.update(beaten.tolist())
+    rest = np.array(sorted(affected - set(results)), dtype=np.intp)
+    for row, neighbours, scores, _ in nearest(vectors, rest, top_k, min_score):
+        results[row] = (neighbours, scores)
+
+    rows = [
+        SimilarProduct(product_id=ids[row], similar_id=ids[neighbour], rank=rank, score=float(score))
+        for row, (neighbours, scores) in results.items()
+        for rank, (neighbour, score) in enumerate(zip(neighbours, scores), start=1)
+    ]
+    recomputed = [ids[row] for row in results]
+    SimilarProduct.objects.filter(product__in=recomputed).delete()
+    SimilarProduct.objects.bulk_create(rows, batch_size=1000)
+    return recomputed
+
+
+def update_similar_products():
+    """
+    Recompute the similar products of the products changed since the last run
+    (by updated_at, soft deletes included) and return the number of products
+    with new neighbours. Without a checkpoint every category is recomputed.
+
+    Every category is written in its own transaction, which holds the checkpoint
+    row so that concurrent runs do not write the same category at once. The
+    checkpoint moves once all categories are done: an interrupted run is
+    repeated by the next one.
+    """
+
+    started = timezone.now()
+    Checkpoint.objects.get_or_create(name=CHECKPOINT)
+    position = Checkpoint.objects.get(name=CHECKPOINT).position
+    if position is None:
+        changed = None
+        categories = set(Product.objects.order_by().values_list('category', flat=True).distinct())
+        # Lists of deleted products are not recomputed, drop them all
+        SimilarProduct.objects.filter(product__is_deleted=True).delete()
+    else:
+        rows = list(Product.objects.unfiltered().filter(updated_at__gte=position - OVERLAP)
+                    .values_list('id', 'category', 'is_deleted'))
+        changed = {product_id for product_id, _, _ in rows}
+        categories = {category_id for _, category_id, is_deleted in rows if not is_deleted}
+        # Categories of the products listing a changed one, e.g. moved to another category
+        categories.update(SimilarProduct.objects.filter(similar__in=changed)
+                          .values_list('product__category', flat=True).distinct())
+        SimilarProduct.objects.filter(product__in=[product_id for product_id, _, is_deleted in rows
+                                                   if is_deleted]).delete()
+
+    updated = 0
+    for category_id in categories:
+        with transaction.atomic():
+            Checkpoint.objects.select_for_update().get(name=CHECKPOINT)
+            recomputed = update_category(category_id, changed)
+            slugs = list(Product.objects.unfiltered().filter(id__in=recomputed).values_list('slug', flat=True))
+            transaction.on_commit(lambda slugs=slugs: invalidate_similar(slugs))
+        updated += len(recomputed)
+    with transaction.atomic():
+        checkpoint = Checkpoint.objects.select_for_update().get(name=CHECKPOINT)
+        # A concurrent run that started later may have moved it already
+        if checkpoint.position is None or checkpoint.position < started:
+            checkpoint.position = started
+            checkpoint.save(update_fields=['position', 'updated_at'])
+    return updated
+
+
+def reset_similar_products():
+    """Forget the checkpoint, the next update recomputes every category."""
+
+    Checkpoint.objects.filter(name=CHECKPOINT).delete()
@@ -0,0 +1,373 @@
+import fcntl
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from decimal import ROUND_CEILING, ROUND_FLOOR, Decimal
+
+import numpy as np
+from django.conf import settings
+from django.db.models import Avg, Q
+from django.utils import timezone
+
+from apps.reviews.models import Review
+from apps.sellers.models import Seller
+from apps.shop.models import Category, Product
+
+
+# One record per product. Ids are the UUID bytes, so sorting them matches ORDER BY id.
+# numpy drops trailing NUL bytes of "S" values, uuid_from() pads them back.
+DTYPE = np.dtype([
+    ('id', 'S16'),
+    ('category', '<i4'),  # code from state['category_ids'], -1 unknown
+    ('seller', '<i4'),  # code from state['seller_ids'], -1 none
+    ('price', '<i8'),  # kopecks
+    ('stock', '<i4'),
+    ('rating', '<f4'),  # average review rating, NaN without reviews
+    ('created_at', '<i8'),  # microseconds since the epoch
+    ('deleted', '?'),
+])
+# ProductFilter ordering names and their columns
+SORT_COLUMNS = {'price': 'price', 'created_at': 'created_at', 'rating': 'rating'}
+# Updates committed shortly before a delta run may carry an older updated_at, they are read again
+OVERLAP = timedelta(seconds=5)
+CHUNK_SIZE = 10_000
+
+
+def uuid_from(value):
+    return uuid.UUID(bytes=value.ljust(16, b'\0'))
+
+
+def to_kopecks(price, rounding=ROUND_FLOOR):
+    return int((Decimal(price) * 100).to_integral_value(rounding))
+
+
+def sort_key(records, column, descending):
+    """Values to sort `records` by, products without a rating always last."""
+
+    values = records[column]
+    if column == 'rating':
+        values = np.nan_to_num(values, nan=-np.inf if descending else np.inf)
+    return values
+
+
+def sort_order(records, column, descending):
+    """Stable order of `records` (stored by id descending) by a column, ties stay by id descending."""
+
+    values = sort_key(records, column, descending)
+    return np.argsort(-values if descending else values, kind='stable')
+
+
+@contextmanager
+def snapshot_lock(directory):
+    # Builds and delta runs of several job workers take turns
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, '.lock'), 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def write_json(path, data):
+    temporary = f'{path}.tmp'
+    with open(temporary, 'w') as f:
+        json.dump(data, f)
+    os.replace(temporary, path)
+
+
+def read_json(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def current_version(directory):
+    try:
+        with open(os.path.join(directory, 'CURRENT')) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def product_records(products, state):
+    """Records of a product queryset, the codes of new categories and sellers are added to `state`."""
+
+    rows = list(products.order_by().annotate(
+        avg_rating=Avg('reviews__rating', filter=Q(reviews__is_deleted=False)),
+    ).values_list('id', 'category_id', 'seller_id', 'price_current', 'in_stock', 'avg_rating', 'created_at',
+                  'is_deleted').iterator(chunk_size=CHUNK_SIZE))
+    category_ids = {str(row[1]) for row in rows} - state['category_ids'].keys()
+    for category_id, slug in Category.objects.filter(id__in=category_ids).values_list('id', 'slug'):
+        add_code(state, 'category', category_id, slug)
+    seller_ids = {str(row[2]) for row in rows if row[2] is not None} - state['seller_ids'].keys()
+    for seller_id, slug in Seller.objects.filter(id__in=seller_ids).values_list('id', 'slug'):
+        add_code(state, 'seller', seller_id, slug)
+
+    records = np.zeros(len(rows), dtype=DTYPE)
+    for i, (product_id, category_id, seller_id, price, stock, rating, created_at, deleted) in enumerate(rows):
+        records[i] = (
+            product_id.bytes, state['category_ids'].get(str(category_id), -1),
+            state['seller_ids'].get(str(seller_id), -1) if seller_id is not None else -1,
+            to_kopecks(price), stock, np.nan if rating is None else rating,
+            int(created_at.timestamp() * 1_000_000), deleted,
+        )
+    return records
+
+
+def add_code(state, kind, object_id, slug):
+    codes = state[f'{kind}_ids']
+    if str(object_id) not in codes:
+        codes[str(object_id)] = len(codes)
+    if slug:
+        state[f'{kind}_slugs'][slug] = codes[str(object_id)]
+
+
+def build_snapshot(directory=None):
+    """
+    Write a new snapshot of the live products and make it current.
+
+    A snapshot is a directory with products.npy (records by id descending),
+    one precomputed order per sort column and direction, an empty deltas.bin
+    and state.json. The CURRENT file is replaced atomically, so readers see
+    either the old or the new snapshot. Returns the version name.
+    """
+
+    directory = directory or settings.CATALOG_SNAPSHOT['DIR']
+    with snapshot_lock(directory):
+        started = timezone.now()
+        state = {'category_ids': {}, 'category_slugs': {}, 'seller_ids': {}, 'seller_slugs': {}}
+        for category_id, slug in Category.objects.values_list('id', 'slug'):
+            add_code(state, 'category', category_id, slug)
+        for seller_id, slug in Seller.objects.values_list('id', 'slug'):
+            add_code(state, 'seller', seller_id, slug)
+        records = product_records(Product.objects.all(), state)
+        records = records[np.argsort(records['id'], kind='stable')[::-1]]
+
+        version = f'v{int(started.timestamp() * 1_000_000)}'
+        path = os.path.join(directory, version)
+        os.makedirs(path)
+        np.save(os.path.join(path, 'products.npy'), records)
+        for column in SORT_COLUMNS.values():
+            for descending in (False, True):
+                order = sort_order(records, column, descending).astype(np.int32)
+                np.save(os.path.join(path, f'order-{column}-{"desc" if descending else "asc"}.npy'), order)
+        open(os.path.join(path, 'deltas.bin'), 'wb').close()
+        write_json(os.path.join(path, 'state.json'), {
+            **state, 'watermark': started.isoformat(), 'updated_at': started.isoformat(), 'deltas': 0,
+        })
+        temporary = os.path.join(directory, 'CURRENT.tmp')
+        with open(temporary, 'w') as f:
+            f.write(version)
+        os.replace(temporary, os.path.join(directory, 'CURRENT'))
+        prune_snapshots(directory, version)
+        return version
+
+
+def prune_snapshots(directory, current):
+    # Workers still reading an older snapshot keep its mapped files until they switch
+    versions = sorted(name for name in os.listdir(directory) if name.startswith('v') and name != current)
+    for name in versions[:max(len(versions) - settings.CATALOG_SNAPSHOT['KEEP'] + 1, 0)]:
+        shutil.rmtree(os.path.join(directory, name), ignore_errors=True)
+
+
+def append_deltas(directory=None):
+    """
+    Append the products changed or reviewed since the last run to the delta log
+    of the current snapshot, or build a snapshot if there is none or the log is
+    too long. Returns the number of appended records.
+    """
+
+    directory = directory or settings.CATALOG_SNAPSHOT['DIR']
+    with snapshot_lock(directory):
+        version = current_version(directory)
+        path = os.path.join(directory, version or '')
+        state = read_json(os.path.join(path, 'state.json')) if version else None
+        if state and state['deltas'] < settings.CATALOG_SNAPSHOT['MAX_DELTAS']:
+            started = timezone.now()
+            since = datetime.fromisoformat(state['watermark']) - OVERLAP
+            # Reviews change the rating without touching their product
+            reviewed = Review.objects.unfiltered().filter(updated_at__gte=since).values('product_id')
+            records = product_records(
+                Product.objects.unfiltered().filter(Q(updated_at__gte=since) | Q(id__in=reviewed)), state)
+            # Records first, then the state: a reader never sees a state newer than the log.
+            # Writing at the counted end drops what a crashed run left after it.
+            with open(os.path.join(path, 'deltas.bin'), 'r+b') as f:
+                f.seek(state['deltas'] * DTYPE.itemsize)
+                f.write(records.tobytes())
+                f.truncate()
+            write_json(os.path.join(path, 'state.json'), {
+                **state, 'watermark': started.isoformat(), 'updated_at': started.isoformat(),
+                'deltas': state['deltas'] + len(records),
+            })
+            return len(records)
+    build_snapshot(directory)
+    return 0
+
+
+class Snapshot:
+    """
+    A snapshot opened by a web worker: products.npy and the orders are memory
+    mapped, so every worker shares the same pages, only the delta log is read
+    into memory.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.products = np.load(os.path.join(path, 'products.npy'), mmap_mode='r')
+        self.orders = {}
+        self.state_mtime = None
+        self.deltas = None
+        self.refresh()
+
+    def order(self, column, descending):
+        name = f'{column}-{"desc" if descending else "asc"}'
+        if name not in self.orders:
+            self.orders[name] = np.load(os.path.join(self.path, f'order-{name}.npy'), mmap_mode='r')
+        return self.orders[name]
+
+    def refresh(self):
+        # state.json is replaced after every delta run, its counter says how many records are complete
+        mtime = os.stat(os.path.join(self.path, 'state.json')).st_mtime_ns
+        if mtime == self.state_mtime:
+            return
+        previous = getattr(self, 'state', {}).get('deltas')
+        self.state = read_json(os.path.join(self.path, 'state.json'))
+        self.state_mtime = mtime
+        if self.state['deltas'] == previous:
+            return
+        deltas = np.fromfile(os.path.join(self.path, 'deltas.bin'), dtype=DTYPE, count=self.state['deltas'])
+        # The last record of a product wins
+        _, last = np.unique(deltas['id'][::-1], return_index=True)
+        deltas = deltas[::-1][last]
+        self.live = ~np.isin(self.products['id'], deltas['id']) if len(deltas) else None
+        self.deltas = deltas[~deltas['deleted']]
+
+    @property
+    def age(self):
+        return (timezone.now() - datetime.fromisoformat(self.state['updated_at'])).total_seconds()
+
+    def match(self, records, filters):
+        """Boolean mask of the records matching ProductFilter values."""
+
+        mask = np.ones(len(records), dtype=bool)
+        if filters.get('min_price') is not None:
+            mask &= records['price'] >= to_kopecks(filters['min_price'], ROUND_CEILING)
+        if filters.get('max_price') is not None:
+            mask &= records['price'] <= to_kopecks(filters['max_price'])
+        if filters.get('in_stock') is not None:
+            mask &= records['stock'] >= filters['in_stock']
+        if filters.get('min_rating') is not None:
+            mask &= records['rating'] >= float(filters['min_rating'])
+        for kind in ('category', 'seller'):
+            if filters.get(kind):
+                mask &= records[kind] == self.state[f'{kind}_slugs'].get(filters[kind], -2)
+        return mask
+
+    def search(self, filters, ordering=None):
+        """
+        Ids (UUID bytes) of the products matching `filters`, sorted by `ordering`
+        ("price", "-rating"...; None is id descending, like ProductsView).
+        """
+
+        mask = self.match(self.products, filters)
+        if self.live is not None:
+            mask &= self.live
+        deltas = self.deltas[self.match(self.deltas, filters)]
+
+        descending = ordering is None or ordering.startswith('-')
+        column = 'id' if ordering is None else SORT_COLUMNS[ordering.lstrip('-')]
+        if column == 'id':
+            indexes = np.flatnonzero(mask)
+            keys = self.products['id'][indexes]
+        else:
+            order = self.order(column, descending)
+            indexes = order[mask[order]]
+            keys = sort_key(self.products[indexes], column, descending)
+        ids = self.products['id'][indexes]
+        if not len(deltas):
+            return ids
+
+        # Changed products are few: sort them and insert them at their place
+        deltas = deltas[np.argsort(deltas['id'], kind='stable')[::-1]]
+        if column != 'id':
+            deltas = deltas[sort_order(deltas, column, descending)]
+        if column == 'id':
+            positions = len(ids) - np.searchsorted(ids[::-1], deltas['id'], side='left')
+            return np.insert(ids, positions, deltas['id'])
+        if descending:
+            keys = -keys
+        delta_keys = sort_key(deltas, column, descending)
+        delta_keys = -delta_keys if descending else delta_keys
+        starts = np.searchsorted(keys, delta_keys, side='left')
+        ends = np.searchsorted(keys, delta_keys, side='right')
+        positions = []
+        for start, end, product_id in zip(starts, ends, deltas['id']):
+            # Equal values stay by id descending, like the "-id" tiebreak of the database
+            tied = ids[start:end][::-1]
+            positions.append(end - np.searchsorted(tied, product_id, side='right'))
+        return np.insert(ids, positions, deltas['id'])
+
+
+_lock = threading.Lock()
+_current = {'version': None, 'snapshot': None, 'checked': 0.0}
+
+
+def get_snapshot():
+    """
+    The current snapshot of this process, or None when snapshots are disabled,
+    not built yet or not updated for CATALOG_SNAPSHOT['MAX_AGE'] seconds.
+    """
+
+    config = settings.CATALOG_SNAPSHOT
+    if not config['ENABLED']:
+        return None
+    with _lock:
+        now = time.monotonic()
+        if now - _current['checked'] >= config['CHECK_INTERVAL']:
+            _current['checked'] = now
+            try:
+                version = current_version(config['DIR'])
+                if version is None:
+                    _current.update(version=None, snapshot=None)
+                elif version != _current['version']:
+                    _current.update(version=version, snapshot=Snapshot(os.path.join(config['DIR'], version)))
+                else:
+                    _current['snapshot'].refresh()
+            except (OSError, ValueError):
+                # Pruned or half written, the next check picks up the new one
+                _current.update(version=None, snapshot=None)
+        snapshot = _current['snapshot']
+    if snapshot is None or snapshot.age > config['MAX_AGE']:
+        return None
+    return snapshot
+
+
+def search_products(filterset):
+    """
+    Ids of the products matched by a valid ProductFilter, from the snapshot, or
+    None when the database has to answer (name search, several orderings, no
+    fresh snapshot).
+    """
+
+    data = filterset.form.cleaned_data
+    ordering = data.get('ordering') or []
+    if data.get('name') or len(ordering) > 1:
+        return None
+    snapshot = get_snapshot()
+    if snapshot is None:
+        return None
+    return snapshot.search(data, ordering[0] if ordering else None)
+
+
+def hydrate(products, ids):
+    """Products of a product queryset with the given snapshot ids, in their order."""
+
+    uuids = [uuid_from(value) for value in ids]
+    # A product deleted since the last delta run is simply left out of the page
+    by_id = {product.id: product for product in products.order_by().filter(id__in=uuids)}
+    return [by_id[product_id] for product_id in uuids if product_id in by_id]
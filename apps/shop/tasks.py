@@ -0,0 +1,34 @@
+from apps.common.jobs import job
+from apps.shop import related, similar, trending
+from apps.shop.snapshot import append_deltas, build_snapshot
+
+
+@job(queue='catalog', max_attempts=1)
+def build_catalog_snapshot():
+    """Rebuild the catalog snapshot of ProductsView, see apps.shop.snapshot."""
+    build_snapshot()
+
+
+# Missed runs are harmless, the next one reads everything changed since the last success
+@job(queue='catalog', max_attempts=1)
+def append_catalog_deltas():
+    """Append the products changed in the last minute to the catalog snapshot."""
+    append_deltas()
+
+
+@job(queue='analytics', max_attempts=3)
+def update_related_products():
+    """Count the product pairs of the new orders, see apps.shop.related."""
+    related.update_related_products()
+
+
+@job(queue='analytics', max_attempts=3)
+def update_similar_products():
+    """Recompute the similar products of the changed products, see apps.shop.similar."""
+    similar.update_similar_products()
+
+
+@job(name='shop.decay_trending', max_attempts=3)
+def decay_trending_job():
+    """Move the landmark of the trending scores to now, see apps.shop.trending."""
+    trending.decay_trending()
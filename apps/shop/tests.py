@@ -1,3 +1,298 @@
-from django.test import TestCase
+import itertools
+import os
+import random
+import tempfile
+import time
+from collections import Counter
+from datetime import timedelta
+from decimal import Decimal
 
-# Create your tests here.
+import numpy as np
+from django.conf import settings
+from django.db.models import Avg, Q
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from apps.accounts.models import User
+from apps.common.tests import discard_buffers
+from apps.reviews.models import Review
+from apps.sellers.models import Seller
+from apps.sellers.tests import SellerTestCase
+from apps.shop.facets import facets_cache_key
+from apps.shop.filters import ProductFilter
+from apps.common.models import Checkpoint
+from apps.shop import trending
+from apps.shop.models import Category, Product, ProductTrend, SimilarProduct
+from apps.shop.related import cooccurrence, update_related_products
+from apps.shop.similar import reset_similar_products, update_similar_products
+from apps.shop.snapshot import Snapshot, append_deltas, build_snapshot, current_version, uuid_from
+
+
+FILTER_VALUES = {
+    'min_price': [None, '5', '10.5'],
+    'max_price': [None, '1000'],
+    'in_stock': [None, '1'],
+    'category': [None, 'phones', 'unknown'],
+    'min_rating': [None, '4'],
+    'seller': [None, 'shop'],
+    'ordering': [None, 'price', '-price', 'created_at', '-created_at', 'rating', '-rating'],
+}
+
+
+class SnapshotSearchTests(TestCase):
+    """Snapshot.search must return the ids ProductsView gets from the database, in the same order."""
+
+    @classmethod
+    def setUpTestData(cls):
+        rng = random.Random(1)
+        user = User.objects.create_user(first_name='S', last_name='S', email='seller@example.com', password='x')
+        buyers = [User.objects.create_user(first_name='B', last_name='B', email=f'buyer{i}@example.com',
+                                           password='x') for i in range(3)]
+        seller = Seller.objects.create(
+            user=user, business_name='Shop', inn_identification_number='1', phone_number='1',
+            business_description='-', business_address='-', city='-', postal_code='1', bank_name='-',
+            bank_bic_number='1', bank_account_number='1', bank_routing_number='1', is_approved=True,
+        )
+        categories = [Category.objects.create(name=name, image='c.png') for name in ('Phones', 'Books')]
+        for i in range(40):
+            product = Product.objects.create(
+                seller=seller if i % 3 else None, name=f'Product {i}', desc='-', category=categories[i % 2],
+                # Few distinct prices, so that ties are ordered by id
+                price_current=Decimal(rng.choice([1, 5, 10, 99, 1500])) + Decimal('0.50') * rng.randrange(2),
+                in_stock=rng.randrange(3), image1='p.png',
+            )
+            for buyer in buyers[:rng.randrange(4)]:
+                Review.objects.create(user=buyer, product=product, rating=rng.randint(1, 5))
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def assert_matches_database(self):
+        snapshot = Snapshot(os.path.join(self.directory, current_version(self.directory)))
+        products = Product.objects.annotate(
+            avg_rating=Avg('reviews__rating', filter=Q(reviews__is_deleted=False))
+        ).order_by('-id')
+        for values in itertools.product(*FILTER_VALUES.values()):
+            params = {name: value for name, value in zip(FILTER_VALUES, values) if value is not None}
+            filterset = ProductFilter(params, queryset=products)
+            self.assertTrue(filterset.is_valid(), filterset.errors)
+            ordering = filterset.form.cleaned_data.get('ordering')
+            ids = snapshot.search(filterset.form.cleaned_data, ordering[0] if ordering else None)
+            with self.subTest(**params):
+                self.assertEqual([uuid_from(value) for value in ids], [product.id for product in filterset.qs])
+
+    def test_search(self):
+        build_snapshot(self.directory)
+        self.assert_matches_database()
+
+    def test_search_with_deltas(self):
+        build_snapshot(self.directory)
+        products = list(Product.objects.order_by('id')[:4])
+        products[0].price_current = Decimal('5.00')
+        products[0].save()
+        products[1].delete()
+        products[2].in_stock = 0
+        products[2].save()
+        Product.objects.create(seller=products[3].seller, name='New', desc='-', price_current=Decimal('10.50'),
+                               category=products[3].category, in_stock=2, image1='p.png')
+        self.assertGreaterEqual(append_deltas(self.directory), 4)
+        self.assert_matches_database()
+
+    def test_reviews_reach_the_deltas(self):
+        # Older than the overlap of the delta runs, only the reviewed products are picked up
+        day_ago = timezone.now() - timedelta(days=1)
+        Product.objects.unfiltered().update(updated_at=day_ago)
+        Review.objects.unfiltered().update(updated_at=day_ago)
+        build_snapshot(self.directory)
+        product = Product.objects.filter(reviews__isnull=True).order_by('id').first()
+        buyer = User.objects.filter(seller__isnull=True).first()
+        Review.objects.create(user=buyer, product=product, rating=5)
+        Review.objects.exclude(product=product).order_by('id').first().delete()
+        self.assertEqual(append_deltas(self.directory), 2)
+        self.assert_matches_database()
+
+
+class FacetTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        phones, books = (Category.objects.create(name=name, image='c.png') for name in ('Phones', 'Books'))
+        buyer = User.objects.create_user(first_name='B', last_name='B', email='buyer@example.com', password='x')
+        for name, category, price, in_stock, rating in (('Cheap', phones, 500, 1, 5), ('Mid', phones, 2000, 0, 3),
+                                                        ('Book', books, 20000, 2, None)):
+            product = Product.objects.create(name=name, desc='-', category=category, price_current=Decimal(price),
+                                             in_stock=in_stock, image1='p.png')
+            if rating:
+                Review.objects.create(user=buyer, product=product, rating=rating)
+
+    def setUp(self):
+        self.addCleanup(discard_buffers)
+        self.addCleanup(cache.clear)
+
+    def facets(self, query):
+        client = APIClient()
+        client.force_authenticate(User.objects.get())
+        response = client.get(f'/shop/products/?facets=1&{query}')
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()['facets']
+
+    def test_counts(self):
+        facets = self.facets('')
+        self.assertEqual([(c['slug'], c['count']) for c in facets['category']], [('phones', 2), ('books', 1)])
+        self.assertEqual([bucket['count'] for bucket in facets['price']], [1, 1, 0, 1, 0])
+        self.assertEqual([(bucket['min'], bucket['count']) for bucket in facets['rating']],
+                         [(4, 1), (3, 2), (2, 2), (1, 2)])
+        self.assertEqual([(bucket['value'], bucket['count']) for bucket in facets['in_stock']], [(True, 2), (False, 1)])
+
+        facets = self.facets('category=phones&in_stock=1')
+        self.assertEqual([(c['slug'], c['count']) for c in facets['category']], [('phones', 1)])
+        self.assertEqual([bucket['count'] for bucket in facets['price']], [1, 0, 0, 0, 0])
+
+    def test_cache_key_ignores_order_spelling_and_pagination(self):
+        def key(params):
+            filterset = ProductFilter(params, queryset=Product.objects.all())
+            self.assertTrue(filterset.is_valid(), filterset.errors)
+            return facets_cache_key(filterset)
+
+        self.assertEqual(key({'min_price': '5', 'category': 'phones'}),
+                         key({'category': 'phones', 'min_price': '5.0', 'ordering': '-price', 'page': '2'}))
+        self.assertNotEqual(key({'min_price': '5'}), key({'min_price': '6'}))
+
+
+class CooccurrenceTests(SimpleTestCase):
+
+    def brute_force(self, orders, max_items):
+        counts = Counter()
+        for products in orders:
+            if 1 < len(products) <= max_items:
+                for product, other in itertools.permutations(products, 2):
+                    counts[product, other] += 1
+        return counts
+
+    def test_matches_brute_force(self):
+        rng = random.Random(2)
+        orders = [rng.sample(range(30), rng.randint(1, 8)) for _ in range(200)]
+        order_codes = np.array([order for order, products in enumerate(orders) for _ in products], dtype=np.int64)
+        product_codes = np.array([product for products in orders for product in products], dtype=np.int64)
+
+        products, others, counts = cooccurrence(order_codes, product_codes, max_items=6)
+
+        self.assertEqual(dict(zip(zip(products.tolist(), others.tolist()), counts.tolist())),
+                         dict(self.brute_force(orders, 6)))
+
+    def test_no_pairs(self):
+        products, others, counts = cooccurrence(np.array([0, 1, 1, 1], dtype=np.int64),
+                                                np.array([5, 1, 2, 3], dtype=np.int64), max_items=2)
+        self.assertEqual((len(products), len(others), len(counts)), (0, 0, 0))
+
+
+class RelatedProductsTests(SellerTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.addCleanup(cache.clear)
+
+    def related(self, product):
+        response = self.buyer_client.get(f'/shop/products/{product.slug}/related/')
+        self.assertEqual(response.status_code, 200, response.content)
+        return [(row['slug'], row['count']) for row in response.json()]
+
+    def test_products_bought_together(self):
+        charger = Product.objects.create(seller=self.seller, name='Charger', desc='-', category=self.category,
+                                         price_current=Decimal('15.00'), in_stock=10, image1='p.png')
+        self.checkout((self.phone, 1), (self.case, 1))
+        self.checkout((self.phone, 1), (self.case, 2))
+        self.checkout((self.phone, 1), (charger, 1))
+        self.checkout((self.case, 1))
+        later = timezone.now() + timedelta(seconds=1)
+
+        self.assertEqual(update_related_products(date_to=later), 3)
+        self.assertEqual(self.related(self.phone), [(self.case.slug, 2), (charger.slug, 1)])
+        self.assertEqual(self.related(charger), [(self.phone.slug, 1)])
+        # Every order is counted once
+        self.assertEqual(update_related_products(date_to=later), 0)
+        cache.clear()
+        self.assertEqual(self.related(self.phone), [(self.case.slug, 2), (charger.slug, 1)])
+
+
+class SimilarProductsTests(SellerTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.addCleanup(cache.clear)
+
+    def create(self, name, category=None):
+        return Product.objects.create(seller=self.seller, name=name, desc='-', category=category or self.category,
+                                      price_current=Decimal('10.00'), in_stock=1, image1='p.png')
+
+    def similar(self, product):
+        response = self.buyer_client.get(f'/shop/products/{product.slug}/similar/')
+        self.assertEqual(response.status_code, 200, response.content)
+        return [row['slug'] for row in response.json()]
+
+    def stored(self):
+        return sorted(SimilarProduct.objects.values_list('product', 'similar', 'rank'))
+
+    def test_neighbours_within_the_category(self):
+        black = self.create('Leather phone case black')
+        brown = self.create('Leather phone case brown')
+        hose = self.create('Garden hose')
+        self.create('Leather phone case red', Category.objects.create(name='Gifts', image='c.png'))
+
+        self.assertGreater(update_similar_products(), 0)
+        self.assertEqual(self.similar(black)[0], brown.slug)
+        self.assertNotIn(hose.slug, self.similar(black))
+
+        # Incremental runs only see the changed products and give the lists of a full recomputation
+        Product.objects.unfiltered().update(updated_at=timezone.now() - timedelta(hours=1))
+        hose.name = 'Leather phone case green'
+        hose.save()
+        brown.delete()
+        self.assertGreater(update_similar_products(), 0)
+        cache.clear()
+        self.assertEqual(self.similar(black)[0], hose.slug)
+        self.assertNotIn(brown.slug, self.similar(black))
+        incremental = self.stored()
+        reset_similar_products()
+        update_similar_products()
+        self.assertEqual(self.stored(), incremental)
+
+
+class TrendingTests(SellerTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.addCleanup(cache.clear)
+
+    def trending(self, query=''):
+        response = self.buyer_client.get(f'/shop/trending/{query}')
+        self.assertEqual(response.status_code, 200, response.content)
+        return [row['slug'] for row in response.json()]
+
+    def test_events_are_ranked(self):
+        book = Product.objects.create(seller=self.seller, name='Book', desc='-', price_current=Decimal('3.00'),
+                                      category=Category.objects.create(name='Books', image='c.png'), in_stock=1,
+                                      image1='p.png')
+        for _ in range(3):
+            self.assertEqual(self.buyer_client.get(f'/shop/products/{self.phone.slug}/').status_code, 200)
+        self.checkout((self.case, 1))
+        trending.record(book.slug, 'view')
+        self.assertEqual(trending.buffer.flush(), 3)
+
+        self.assertEqual(self.trending(), [self.case.slug, self.phone.slug, book.slug])
+        self.assertEqual(self.trending('?category=books'), [book.slug])
+        self.assertEqual(self.buyer_client.get('/shop/trending/?category=unknown').status_code, 404)
+
+    def test_decay_halves_the_scores_every_half_life(self):
+        trending.add_scores({self.phone.slug: 4, self.case.slug: 0.8}, time.time())
+        half_life = timedelta(seconds=settings.TRENDING['HALF_LIFE'])
+        Checkpoint.objects.filter(name=trending.LANDMARK).update(position=timezone.now() - half_life)
+
+        self.assertEqual(trending.decay_trending(), 1)
+        [trend] = ProductTrend.objects.all()
+        self.assertEqual(trend.product_id, self.phone.id)
+        self.assertAlmostEqual(trend.score, 2, places=3)
@@ -0,0 +1,93 @@
+import time
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from apps.common.counters import WriteBehindBuffer
+from apps.common.models import Checkpoint
+from apps.shop.models import Product, ProductTrend
+
+
+# Landmark time of the forward decayed scores, moved forward by decay_trending
+LANDMARK = 'shop.trending'
+
+
+def trending_cache_key(category_slug=None):
+    return f'shop:trending:{category_slug or ""}'
+
+
+def growth(seconds):
+    """Factor of an event `seconds` after the landmark: scores halve every HALF_LIFE as time goes on."""
+    return 2.0 ** (seconds / settings.TRENDING['HALF_LIFE'])
+
+
+# Buffered scores are relative to the start of the process, moved to the landmark when written
+REFERENCE = time.time()
+buffer = WriteBehindBuffer('shop.trending', lambda scores: add_scores(scores, REFERENCE))
+
+
+def record(slug, event):
+    """Count an event ('view', 'cart_add', 'checkout' or 'review') of a product in the trending scores."""
+    buffer.add(slug, settings.TRENDING['WEIGHTS'][event] * growth(time.time() - REFERENCE))
+
+
+def add_scores(scores, reference):
+    """Add `scores` (relative to the `reference` timestamp) of products by slug to ProductTrend with one upsert."""
+
+    with transaction.atomic():
+        # Locked, so that decay_trending does not move the landmark under the upsert
+        landmark, _ = Checkpoint.objects.select_for_update().get_or_create(
+            name=LANDMARK, defaults={'position': timezone.now()})
+        factor = growth(reference - landmark.position.timestamp())
+        products = Product.objects.filter(slug__in=scores).values_list('slug', 'id', 'category')
+        rows = [(product_id, category_id, scores[slug] * factor) for slug, product_id, category_id in products]
+        if not rows:
+            return 0
+        quote = connection.ops.quote_name
+        table = quote(ProductTrend._meta.db_table)
+        columns = [ProductTrend._meta.get_field(name) for name in ('product', 'category', 'score')]
+        params = []
+        for row in rows:
+            params.extend(field.get_db_prep_value(value, connection, prepared=False)
+                          for field, value in zip(columns, row))
+        sql = (
+            f'INSERT INTO {table} ({", ".join(quote(field.column) for field in columns)}) '
+            f'VALUES {", ".join(["(%s, %s, %s)"] * len(rows))} '
+            f'ON CONFLICT ({quote("product_id")}) DO UPDATE SET '
+            f'{quote("score")} = {table}.{quote("score")} + EXCLUDED.{quote("score")}, '
+            f'{quote("category_id")} = EXCLUDED.{quote("category_id")}'
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+    return len(rows)
+
+
+def decay_trending():
+    """
+    Move the landmark to now: scale every score to its current value and drop the
+    products below TRENDING['MIN_SCORE'], so the numbers stay small and the table
+    only holds products with recent activity. Returns the number of dropped rows.
+    """
+
+    with transaction.atomic():
+        now = timezone.now()
+        landmark, created = Checkpoint.objects.select_for_update().get_or_create(
+            name=LANDMARK, defaults={'position': now})
+        if created:
+            return 0
+        ProductTrend.objects.update(score=F('score') * growth((landmark.position - now).total_seconds()))
+        dropped, _ = ProductTrend.objects.filter(score__lt=settings.TRENDING['MIN_SCORE']).delete()
+        landmark.position = now
+        landmark.save(update_fields=['position', 'updated_at'])
+    return dropped
+
+
+def top_trending(category_slug=None):
+    """The TRENDING['LIMIT'] top ProductTrend rows with their products, of all products or of a category."""
+
+    trends = ProductTrend.objects.filter(product__is_deleted=False).select_related('product')
+    if category_slug is not None:
+        trends = trends.filter(category__slug=category_slug)
+    return list(trends.order_by('-score')[:settings.TRENDING['LIMIT']])
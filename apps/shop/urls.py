@@ -1,7 +1,7 @@
 from django.urls import path
 
 from apps.shop.views import CategoriesView, ProductView, ProductsView, ProductsByCategoryView, ProductsBySellerView, \
-    CartView, CheckoutView
+    RelatedProductsView, SimilarProductsView, TrendingProductsView, CartView, CheckoutView
 
 urlpatterns = [
     path("categories/", CategoriesView.as_view()),
@@ -9,6 +9,9 @@ urlpatterns = [
     path("sellers/<slug:slug>/", ProductsBySellerView.as_view()),
     path("products/", ProductsView.as_view()),
     path("products/<slug:slug>/", ProductView.as_view()),
+    path("products/<slug:slug>/related/", RelatedProductsView.as_view()),
+    path("products/<slug:slug>/similar/", SimilarProductsView.as_view()),
+    path("trending/", TrendingProductsView.as_view()),
     path("cart/", CartView.as_view()),
     path("checkout/", CheckoutView.as_view()),
 ]
@@ -1,3 +1,7 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Avg, OuterRef, Prefetch, Q, Subquery, prefetch_related_objects
 from drf_spectacular.utils import extend_schema, OpenApiParameter, OpenApiTypes
 from rest_framework import status
 from rest_framework.throttling import UserRateThrottle, ScopedRateThrottle
@@ -6,14 +10,26 @@ from rest_framework.generics import ListAPIView
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 
+from apps.common.db import QueryBudget
+from apps.common.jobs import enqueue
 from apps.common.paginations import CustomPagination
+from apps.common.responses import stream_json_list
 from apps.common.permissions import IsStaff, IsSeller, IsOwner
 from apps.shop.serializers import (CategorySerializer, ProductSerializer, OrderItemSerializer, ToggleCartItemSerializer,
-                                   CheckoutSerializer, OrderSerializer)
-from apps.shop.models import Category, Product
+                                   ProductRelationsSerializer, CheckoutSerializer, OrderSerializer, ProductFacetsSerializer,
+                                   RelatedProductSerializer, SimilarProductSerializer, TrendingProductSerializer)
+from apps.shop.models import Category, Product, RelatedProduct, SimilarProduct
 from apps.sellers.models import Seller
+from apps.sellers.orders import create_seller_orders
 from apps.profiles.models import OrderItem, ShippingAddress, Order
+from apps.shop.cache import cache_product, get_cached_product
+from apps.shop.counters import product_cart_adds, product_views
+from apps.shop.facets import get_facets
 from apps.shop.filters import ProductFilter
+from apps.shop.related import related_cache_key
+from apps.shop.similar import similar_cache_key
+from apps.shop import trending
+from apps.shop.snapshot import hydrate, search_products
 from apps.shop.schema_examples import PRODUCT_PARAM_EXAMPLE
 
 tags = ["Shop"]
@@ -23,6 +39,7 @@ class CategoriesView(APIView):
     serializer_class = CategorySerializer
     permission_classes = [IsStaff]
     throttle_scope = 'user'
+    query_budget = QueryBudget(queries=10, db_ms=300)
 
     @extend_schema(
         summary='Категории Получить',
@@ -68,9 +85,10 @@ class ProductsByCategoryView(APIView):
         category = Category.objects.get_or_none(slug=kwargs["slug"])
         if not category:
             return Response(data={"message": "Категория не существует!"}, status=404)
-        products = Product.objects.select_related("category", "seller", "seller__user").filter(category=category)
-        serializer = self.serializer_class(products, many=True)
-        return Response(data=serializer.data, status=200)
+        products = Product.objects.select_related("category", "seller", "seller__user").filter(category=category).annotate(
+            avg_rating=Avg("reviews__rating", filter=Q(reviews__is_deleted=False))
+        )
+        return stream_json_list(request, products, self.serializer_class)
 
 
 class ProductsView(APIView):
@@ -79,25 +97,41 @@ class ProductsView(APIView):
     paginator_class = CustomPagination
     throttle_classes = [ScopedRateThrottle]
     throttle_scope = 'my_scope'
+    # Read-only, so it can run in the transaction of the statement_timeout
+    query_budget = QueryBudget(queries=5, db_ms=500, statement_timeout=True)
 
     @extend_schema(
         operation_id="all_products",
         summary="Получение продукта",
         description="""
             Этот эндпоинт возвращает все продукты.
+            Фильтры по цене, наличию, категории, продавцу и оценке и сортировка считаются по снимку
+            каталога, обновляемому каждую минуту; поиск по названию идет в базу.
+            С facets=1 в ответ добавляется поле facets: количество найденных по фильтру товаров
+            по категориям, ценовым диапазонам, оценкам и наличию, для боковой панели фильтров.
         """,
         tags=tags,
         parameters=PRODUCT_PARAM_EXAMPLE,
     )
     def get(self, request, *args, **kwargs):
-        products = Product.objects.select_related("category", "seller", "seller__user").all()
+        # Средний рейтинг одним запросом вместо запроса на каждый товар в ProductSerializer
+        products = Product.objects.select_related("category", "seller", "seller__user").annotate(
+            avg_rating=Avg("reviews__rating", filter=Q(reviews__is_deleted=False))
+        ).order_by("-id")
         filterset = ProductFilter(request.query_params, queryset=products)
         if filterset.is_valid():
-            queryset = filterset.qs
             paginator = self.paginator_class()
-            paginated_queryset = paginator.paginate_queryset(queryset=queryset, request=request)
+            # Фильтры и сортировка по снимку каталога в памяти, из базы - только товары страницы
+            ids = search_products(filterset)
+            if ids is not None:
+                paginated_queryset = hydrate(products, paginator.paginate_queryset(queryset=ids, request=request))
+            else:
+                paginated_queryset = paginator.paginate_queryset(queryset=filterset.qs, request=request)
             serializer = self.serializer_class(paginated_queryset, many=True)
-            return paginator.get_paginated_response(serializer.data)
+            response = paginator.get_paginated_response(serializer.data)
+            if request.query_params.get("facets") in ("1", "true"):
+                response.data["facets"] = ProductFacetsSerializer(get_facets(filterset)).data
+            return response
         return Response(filterset.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
@@ -129,17 +163,19 @@ class ProductsBySellerView(APIView):
         seller = Seller.objects.get_or_none(slug=kwargs["slug"])
         if not seller:
             return Response(data={"message": "Продавец не существует!"}, status=404)
-        products = Product.objects.select_related("category", "seller", "seller__user").filter(seller=seller)
-        serializer = self.serializer_class(products, many=True)
-        return Response(data=serializer.data, status=200)
+        products = Product.objects.select_related("category", "seller", "seller__user").filter(seller=seller).annotate(
+            avg_rating=Avg("reviews__rating", filter=Q(reviews__is_deleted=False))
+        )
+        return stream_json_list(request, products, self.serializer_class)
 
 
 class ProductView(APIView):
     serializer_class = ProductSerializer
     permission_classes = [IsAuthenticated]
+    query_budget = QueryBudget(queries=5, db_ms=200)
 
     def get_object(self, slug):
-        product = Product.objects.get_or_none(slug=slug)
+        product = Product.objects.select_related("category", "seller", "seller__user").get_or_none(slug=slug)
         self.check_object_permissions(self.request, product)
         return product
 
@@ -155,13 +191,115 @@ class ProductView(APIView):
         product = self.get_object(kwargs['slug'])
         if not product:
             return Response(data={"message": "Товар не существует!"}, status=404)
-        serializer = self.serializer_class(product)
-        return Response(data=serializer.data, status=200)
+        # Only the product's own fields are cached: the seller's counters and the
+        # category change without a save of the product
+        relations = ProductRelationsSerializer(product).data
+        data = get_cached_product(product.slug)
+        if data is None:
+            data = self.serializer_class(product).data
+            cache_product(product.slug, {**data, **dict.fromkeys(relations)})
+        data = {**data, **relations}
+        product_views.add(kwargs['slug'])
+        trending.record(kwargs['slug'], 'view')
+        return Response(data=data, status=200)
+
+
+class RelatedProductsView(APIView):
+    serializer_class = RelatedProductSerializer
+    permission_classes = [IsAuthenticated]
+    query_budget = QueryBudget(queries=3, db_ms=100)
+
+    @extend_schema(
+        operation_id="product_related",
+        summary="Часто покупают вместе",
+        description="""
+            Этот эндпоинт возвращает товары, которые чаще всего заказывают вместе с этим товаром.
+            Рекомендации пересчитываются раз в час по новым заказам.
+        """,
+        tags=tags,
+        responses=RelatedProductSerializer(many=True),
+    )
+    def get(self, request, *args, **kwargs):
+        key = related_cache_key(kwargs['slug'])
+        data = cache.get(key)
+        if data is None:
+            # Одним запросом по индексу (product, rank)
+            related = RelatedProduct.objects.filter(
+                product__slug=kwargs['slug'], product__is_deleted=False, related__is_deleted=False
+            ).select_related("related").order_by("rank")
+            data = self.serializer_class(related, many=True).data
+            if not data and not Product.objects.filter(slug=kwargs['slug']).exists():
+                return Response(data={"message": "Товар не существует!"}, status=404)
+            cache.set(key, data, settings.RELATED_PRODUCTS['CACHE_TIMEOUT'])
+        return Response(data=data, status=200)
+
+
+class SimilarProductsView(APIView):
+    serializer_class = SimilarProductSerializer
+    permission_classes = [IsAuthenticated]
+    query_budget = QueryBudget(queries=3, db_ms=100)
+
+    @extend_schema(
+        operation_id="product_similar",
+        summary="Похожие товары",
+        description="""
+            Этот эндпоинт возвращает товары той же категории с похожими названием и описанием,
+            в том числе для новых товаров без заказов. Список обновляется каждые 10 минут.
+        """,
+        tags=tags,
+        responses=SimilarProductSerializer(many=True),
+    )
+    def get(self, request, *args, **kwargs):
+        key = similar_cache_key(kwargs['slug'])
+        data = cache.get(key)
+        if data is None:
+            # Одним запросом по индексу (product, rank)
+            similar = SimilarProduct.objects.filter(
+                product__slug=kwargs['slug'], product__is_deleted=False, similar__is_deleted=False
+            ).select_related("similar").order_by("rank")
+            data = self.serializer_class(similar, many=True).data
+            if not data and not Product.objects.filter(slug=kwargs['slug']).exists():
+                return Response(data={"message": "Товар не существует!"}, status=404)
+            cache.set(key, data, settings.SIMILAR_PRODUCTS['CACHE_TIMEOUT'])
+        return Response(data=data, status=200)
+
+
+class TrendingProductsView(APIView):
+    serializer_class = TrendingProductSerializer
+    permission_classes = [IsAuthenticated]
+    query_budget = QueryBudget(queries=3, db_ms=100)
+
+    @extend_schema(
+        operation_id="trending_products",
+        summary="Популярные товары",
+        description="""
+            Этот эндпоинт возвращает самые популярные сейчас товары, всего магазина или категории (category=slug).
+            Популярность - просмотры, добавления в корзину, заказы и отзывы, недавние весят больше:
+            вес события падает вдвое каждые сутки.
+        """,
+        tags=tags,
+        parameters=[
+            OpenApiParameter(name="category", description="Slug категории", required=False, type=OpenApiTypes.STR),
+        ],
+        responses=TrendingProductSerializer(many=True),
+    )
+    def get(self, request, *args, **kwargs):
+        category = request.query_params.get("category") or None
+        key = trending.trending_cache_key(category)
+        data = cache.get(key)
+        if data is None:
+            trends = trending.top_trending(category)
+            if not trends and category is not None and not Category.objects.filter(slug=category).exists():
+                return Response(data={"message": "Категория не существует!"}, status=404)
+            data = self.serializer_class(trends, many=True).data
+            cache.set(key, data, settings.TRENDING['CACHE_TIMEOUT'])
+        return Response(data=data, status=200)
 
 
 class CartView(APIView):
     serializer_class = OrderItemSerializer
     permission_classes = [IsOwner]
+    query_budget = QueryBudget(queries=12, db_ms=300)
 
     @extend_schema(
         summary="Товары в корзине",
@@ -207,6 +345,8 @@ class CartView(APIView):
         if created:
             status_code = 201
             resp_message_substring = "Added To"
+            product_cart_adds.add(product.id)
+            trending.record(product.slug, 'cart_add')
         if orderitem.quantity == 0:
             resp_message_substring = "Removed From"
             orderitem.delete()
@@ -220,6 +360,7 @@ class CartView(APIView):
 class CheckoutView(APIView):
     serializer_class = CheckoutSerializer
     permission_classes = [IsOwner]
+    query_budget = QueryBudget(queries=12, db_ms=1000)
 
     @extend_schema(
         summary="Проверить",
@@ -259,8 +400,17 @@ class CheckoutView(APIView):
             value = getattr(shipping, field)
             data[field] = value
 
-        order = Order.objects.create(user=user, **data)
-        orderitems.update(order=order)
-
+        with transaction.atomic():
+            order = Order.objects.create(user=user, **data)
+            # Цена на момент заказа, для аналитики продаж продавца
+            orderitems.update(order=order, price=Subquery(
+                Product.objects.filter(id=OuterRef('product_id')).values('price_current')[:1]))
+            # Товары заказа одним запросом для подсчета суммы в OrderSerializer
+            prefetch_related_objects([order], Prefetch("orderitems", OrderItem.objects.select_related("product")))
+            create_seller_orders(order)
+            enqueue('sellers.refresh_order_rollups', {'order_id': str(order.id)})
+
+        for item in order.orderitems.all():
+            trending.record(item.product.slug, 'checkout')
         serializer = OrderSerializer(order)
         return Response(data={"message": "Checkout Successful", "item": serializer.data}, status=200)
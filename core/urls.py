@@ -29,6 +29,7 @@ urlpatterns = [
     path('sellers/', include('apps.sellers.urls')),
     path('shop/', include('apps.shop.urls')),
     path('review/', include('apps.reviews.urls')),
+    path('common/', include('apps.common.urls')),
 ]
 
 if settings.DEBUG: